@@ -0,0 +1,20 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from .cache import get_user_profile
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that loads the user from the profile cache instead of one query per request"""
+    
+    def get_user(self, validated_token):
+        # Revocation checks compare against the stored password, so keep them uncached
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        
+        user = get_user_profile(validated_token[api_settings.USER_ID_CLAIM])
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
\ No newline at end of file
@@ -0,0 +1,33 @@
+from django.db import DEFAULT_DB_ALIAS
+from backend.cache import TieredCache
+from .models import User
+
+PROFILE_TTL = 300  # seconds
+PROFILE_LOCAL_TTL = 30  # seconds
+
+# Everything but the password hash, which never goes into the cache
+PROFILE_FIELDS = [field.attname for field in User._meta.concrete_fields if field.name != 'password']
+
+profile_cache = TieredCache('profiles', PROFILE_TTL, PROFILE_LOCAL_TTL, local_max_size=10000)
+
+def _profile_key(user_id):
+    # Token claims may carry the id as a string
+    return f'user:{user_id}'
+
+def get_user_profile(user_id):
+    """
+    Return the user through the two-tier profile cache, or None if there is
+    no such user. The password is deferred, so it is read from the database
+    when needed and a save() leaves it alone. Each caller gets its own
+    instance, so it is safe to modify.
+    """
+    values = profile_cache.get(_profile_key(user_id))
+    if values is None:
+        values = User.objects.filter(pk=user_id).values_list(*PROFILE_FIELDS).first()
+        if values is None:
+            return None
+        profile_cache.set(_profile_key(user_id), values)
+    return User.from_db(DEFAULT_DB_ALIAS, PROFILE_FIELDS, values)
+
+def invalidate_user_profile(user_id):
+    profile_cache.delete(_profile_key(user_id))
\ No newline at end of file
@@ -0,0 +1,9 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import User
+from .cache import invalidate_user_profile
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_user_profile(instance.pk))
\ No newline at end of file
@@ -1,16 +1,13 @@
 from celery import shared_task
-from django.core.mail import send_mail
-from django.conf import settings
+from backend.emails import build_message, dispatch, EMAIL_MAX_RETRIES
 
-@shared_task
-def send_welcome_email(user_id):
-    """Send welcome email to new users"""
+@shared_task(bind=True, max_retries=EMAIL_MAX_RETRIES)
+def send_welcome_emails(self, user_ids):
+    """Send welcome emails to new users over a shared SMTP connection"""
     from accounts.models import User
     
-    try:
-        user = User.objects.get(id=user_id)
-        
-        subject = 'Welcome to Our Store!'
+    messages = {}
+    for user in User.objects.filter(id__in=user_ids):
         message = f"""
         Hi {user.first_name},
         
@@ -21,18 +18,14 @@ def send_welcome_email(user_id):
         Best regards,
         Your E-commerce Team
         """
-        
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            fail_silently=False,
+        messages[user.id] = build_message(
+            'Welcome to Our Store!', message, user.email, 'emails/welcome.html', {'user': user}
         )
-        
-        return f"Welcome email sent to {user.email}"
     
-    except User.DoesNotExist:
-        return f"User {user_id} not found"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
\ No newline at end of file
+    sent = dispatch(self, messages, lambda failed: (failed,))
+    return f"Sent {sent} welcome emails"
+
+@shared_task
+def send_welcome_email(user_id):
+    """Send welcome email to new users"""
+    send_welcome_emails.delay([user_id])
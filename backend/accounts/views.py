@@ -54,7 +54,10 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self):
-        return self.request.user
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user
+        # request.user may be a cached snapshot; update the current row instead
+        return User.objects.get(pk=self.request.user.pk)
 
 class AddressListCreateView(generics.ListCreateAPIView):
     serializer_class = AddressSerializer
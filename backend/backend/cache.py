@@ -0,0 +1,493 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from .db_router import use_primary
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+LISTENER_RETRY_DELAY_MAX = 30  # seconds
+STATS_FLUSH_INTERVAL = 30  # seconds
+STATS_KEY_TTL = 7 * 24 * 3600
+TIERS = ('local', 'shared')
+# Fresh-until times are spread over the last 10% of the TTL, so keys cached
+# together do not all expire together
+TTL_JITTER = 0.1
+COMPUTE_LOCK_TIMEOUT = 30  # seconds one caller may spend recomputing a key
+COMPUTE_WAIT_TIMEOUT = 5  # seconds other callers wait for it before computing themselves
+COMPUTE_POLL_INTERVAL = 0.05  # seconds, while the recompute runs in another process
+
+_MISSING = object()
+_VERSION_KEY = '__version__'  # local tier key holding the namespace version
+
+class LockLost(Exception):
+    """Another run took a cache lock over after it expired"""
+
+class CacheLock:
+    """A lock in the shared cache, owned through a random token; see cache_lock"""
+    
+    def __init__(self, key, timeout):
+        self.key = key
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+    
+    def refresh(self):
+        """Extend the lock by its timeout; raises LockLost if this run no longer owns it"""
+        if cache.get(self.key) != self.token or not cache.touch(self.key, self.timeout):
+            raise LockLost(self.key)
+    
+    def release(self):
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+@contextmanager
+def cache_lock(key, timeout):
+    """
+    Take ``key`` in the shared cache for ``timeout`` seconds so only one node
+    runs a job at a time. Yields a CacheLock whose ``acquired`` is False when
+    another run holds it; jobs that may outlive the timeout call
+    ``refresh()`` as they make progress. Released on exit if still owned.
+    """
+    lock = CacheLock(key, timeout)
+    lock.acquired = cache.add(key, lock.token, timeout)
+    try:
+        yield lock
+    finally:
+        if lock.acquired:
+            lock.release()
+
+class LocalLRUCache:
+    """Small thread-safe LRU cache with a fixed TTL, private to the process"""
+    
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+
+# Every TieredCache in the process, by namespace, for the invalidation listener
+_registry = {}
+_listener_lock = threading.Lock()
+_listener_pid = None
+
+def _sender_id():
+    # Includes the pid, as forked workers share everything else
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _redis_client():
+    backend = caches['default']
+    if not isinstance(backend, RedisCache):
+        return None
+    return backend._cache.get_client(write=True)
+
+def publish_invalidation(namespace, keys=None):
+    """Tell every other process to evict ``keys``, or the whole namespace for None"""
+    client = _redis_client()
+    if client is None:
+        return
+    message = json.dumps({'sender': _sender_id(), 'namespace': namespace, 'keys': keys})
+    try:
+        client.publish(INVALIDATION_CHANNEL, message)
+    except Exception:
+        # The local TTL still bounds how long other processes serve stale data
+        logger.warning('Could not publish cache invalidation for %s', namespace, exc_info=True)
+
+def handle_invalidation(message):
+    data = json.loads(message)
+    if data.get('sender') == _sender_id():
+        return
+    tiered = _registry.get(data.get('namespace'))
+    if tiered is None:
+        return
+    if data.get('keys') is None:
+        tiered.local.clear()
+    else:
+        tiered.local.delete_many(data['keys'])
+
+def clear_local_caches():
+    """Empty the local tier of every TieredCache in this process"""
+    for tiered in list(_registry.values()):
+        tiered.local.clear()
+
+def _listen():
+    delay = 1
+    while True:
+        try:
+            pubsub = _redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Messages sent while we were not subscribed are lost
+            clear_local_caches()
+            delay = 1
+            for message in pubsub.listen():
+                handle_invalidation(message['data'])
+        except Exception:
+            logger.warning('Cache invalidation listener disconnected', exc_info=True)
+            clear_local_caches()
+            time.sleep(delay)
+            delay = min(delay * 2, LISTENER_RETRY_DELAY_MAX)
+
+def ensure_listener():
+    """Start this process's invalidation listener thread, once per process"""
+    global _listener_pid
+    pid = os.getpid()
+    if _listener_pid == pid:
+        return
+    with _listener_lock:
+        if _listener_pid == pid:
+            return
+        if _redis_client() is not None:
+            threading.Thread(target=_listen, name='cache-invalidation', daemon=True).start()
+        _listener_pid = pid
+
+def _stats_key(namespace, tier, outcome):
+    return f'cache-stats:{namespace}:{tier}:{outcome}'
+
+class _Flight:
+    """A recompute running in this process, for other threads to wait on"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.values = {}
+        self.error = None
+
+class TieredCache:
+    """
+    A bounded per-process LRU in front of the shared ``default`` cache, for
+    one namespace of keys. Reads check the local tier, then fetch the misses
+    from the shared tier in one round trip. Deletes and clears are broadcast
+    over Redis pub/sub so other processes evict their local copies right
+    away; the short local TTL bounds staleness if a message is lost.
+    
+    ``get_or_compute`` adds stampede protection: each missing key is
+    recomputed by a single caller while the others wait for its result, and
+    entries up to ``stale_ttl`` seconds past their TTL are served while one
+    caller refreshes them.
+    
+    Values returned from the local tier are shared between threads and must
+    not be mutated.
+    """
+    
+    def __init__(self, namespace, ttl, local_ttl=5, local_max_size=1024, stale_ttl=0):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.local = LocalLRUCache(local_max_size, local_ttl)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._counts = {(tier, outcome): 0 for tier in TIERS for outcome in ('hits', 'misses')}
+        self._unflushed = dict(self._counts)
+        self._counts_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        _registry[namespace] = self
+    
+    def _version(self):
+        # Cached in the local tier, so clear() reaches it with everything else
+        version = self.local.get(_VERSION_KEY, _MISSING)
+        if version is _MISSING:
+            version = cache.get(f'{self.namespace}:version', 0)
+            self.local.set(_VERSION_KEY, version)
+        return version
+    
+    def _shared_key(self, key, version):
+        return f'{self.namespace}:{version}:{key}'
+    
+    def _count(self, tier, hits, misses):
+        with self._counts_lock:
+            for outcome, value in (('hits', hits), ('misses', misses)):
+                self._counts[(tier, outcome)] += value
+                self._unflushed[(tier, outcome)] += value
+    
+    def _lock_key(self, key):
+        return f'{self.namespace}:lock:{key}'
+    
+    def _entries(self, keys):
+        """Shared tier entries by key, as ``(fresh_until, value)``"""
+        version = self._version()
+        shared_keys = {self._shared_key(key, version): key for key in keys}
+        return {shared_keys[shared_key]: entry for shared_key, entry in cache.get_many(shared_keys).items()}
+    
+    def _get_local(self, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self._count('local', len(found), len(missing))
+        return found, missing
+    
+    def get_many(self, keys):
+        """Cached values by key; stale entries count as misses"""
+        ensure_listener()
+        found, missing = self._get_local(keys)
+        
+        if missing:
+            now = time.time()
+            fresh = {
+                key: value for key, (fresh_until, value) in self._entries(missing).items()
+                if fresh_until > now
+            }
+            for key, value in fresh.items():
+                found[key] = value
+                self.local.set(key, value)
+            self._count('shared', len(fresh), len(missing) - len(fresh))
+        
+        self.flush_stats()
+        return found
+    
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+    
+    def set_many(self, mapping, ttl=None):
+        fresh_for = (self.ttl if ttl is None else ttl) * random.uniform(1 - TTL_JITTER, 1)
+        fresh_until = time.time() + fresh_for
+        version = self._version()
+        cache.set_many(
+            {self._shared_key(key, version): (fresh_until, value) for key, value in mapping.items()},
+            max(1, round(fresh_for + self.stale_ttl))
+        )
+        for key, value in mapping.items():
+            self.local.set(key, value)
+    
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+    
+    def get_or_compute_many(self, keys, compute):
+        """
+        Like ``get_many``, with the misses filled by ``compute(keys)``, which
+        returns values by key. Keys it leaves out are cached as None, and any
+        extra keys it returns are cached too. Only one caller at a time
+        recomputes a key, across all processes; the others wait for its
+        result. Stale entries are served as they are, except to the one
+        caller that gets to refresh them.
+        """
+        ensure_listener()
+        found, missing = self._get_local(keys)
+        
+        if missing:
+            now = time.time()
+            entries = self._entries(missing)
+            stale = []
+            for key, (fresh_until, value) in entries.items():
+                found[key] = value
+                if fresh_until > now:
+                    self.local.set(key, value)
+                else:
+                    stale.append(key)
+            self._count('shared', len(entries), len(missing) - len(entries))
+            
+            absent = [key for key in missing if key not in entries]
+            if absent:
+                found.update(self._single_flight(absent, compute))
+            if stale:
+                token, locked = self._lock(stale)
+                try:
+                    if locked:
+                        found.update(self._compute(locked, compute))
+                finally:
+                    self._unlock(locked, token)
+        
+        self.flush_stats()
+        return found
+    
+    def get_or_compute(self, key, compute):
+        """``get_or_compute_many`` for one key, with ``compute()`` taking no arguments"""
+        return self.get_or_compute_many([key], lambda keys: {key: compute()})[key]
+    
+    def _compute(self, keys, compute):
+        # A lagging replica would put stale values in the cache for everyone
+        with use_primary():
+            values = compute(keys)
+        self.set_many({key: values.get(key) for key in keys} | values)
+        return {key: values.get(key) for key in keys}
+    
+    def _lock(self, keys):
+        token = uuid.uuid4().hex
+        return token, [
+            key for key in keys if cache.add(self._lock_key(key), token, COMPUTE_LOCK_TIMEOUT)
+        ]
+    
+    def _unlock(self, keys, token):
+        held = cache.get_many([self._lock_key(key) for key in keys])
+        cache.delete_many([lock_key for lock_key, value in held.items() if value == token])
+    
+    def _single_flight(self, keys, compute):
+        """Fill missing keys, joining recomputes already running in this process"""
+        flight = _Flight()
+        with self._flights_lock:
+            joined = {key: self._flights[key] for key in keys if key in self._flights}
+            owned = [key for key in keys if key not in joined]
+            for key in owned:
+                self._flights[key] = flight
+        
+        values = {}
+        if owned:
+            try:
+                flight.values = self._fill(owned, compute)
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                with self._flights_lock:
+                    for key in owned:
+                        if self._flights.get(key) is flight:
+                            del self._flights[key]
+                flight.done.set()
+            values.update(flight.values)
+        
+        late = []
+        for key, other in joined.items():
+            if not other.done.wait(COMPUTE_WAIT_TIMEOUT):
+                late.append(key)
+            elif other.error is not None:
+                raise other.error
+            else:
+                values[key] = other.values.get(key)
+        if late:
+            values.update(self._compute(late, compute))
+        return values
+    
+    def _fill(self, keys, compute):
+        """Compute the keys no other process is computing, and wait for the rest"""
+        token, locked = self._lock(keys)
+        values = {}
+        try:
+            if locked:
+                # Another caller may have stored them since we looked
+                now = time.time()
+                for key, (fresh_until, value) in self._entries(locked).items():
+                    if fresh_until > now:
+                        values[key] = value
+                        self.local.set(key, value)
+                todo = [key for key in locked if key not in values]
+                if todo:
+                    values.update(self._compute(todo, compute))
+        finally:
+            self._unlock(locked, token)
+        
+        pending = [key for key in keys if key not in locked]
+        deadline = time.monotonic() + COMPUTE_WAIT_TIMEOUT
+        while pending and time.monotonic() < deadline:
+            time.sleep(COMPUTE_POLL_INTERVAL)
+            for key, (fresh_until, value) in self._entries(pending).items():
+                values[key] = value
+                self.local.set(key, value)
+            pending = [key for key in pending if key not in values]
+            # The lock holder gave up without storing anything
+            if pending and not cache.get_many([self._lock_key(key) for key in pending]):
+                break
+        if pending:
+            values.update(self._compute(pending, compute))
+        return values
+    
+    def delete_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+        version = self._version()
+        cache.delete_many([self._shared_key(key, version) for key in keys])
+        self.local.delete_many(keys)
+        publish_invalidation(self.namespace, keys)
+    
+    def delete(self, key):
+        self.delete_many([key])
+    
+    def clear(self):
+        """Drop every key in the namespace by moving to a new version"""
+        version_key = f'{self.namespace}:version'
+        cache.add(version_key, 0, None)
+        cache.incr(version_key)
+        self.local.clear()
+        publish_invalidation(self.namespace)
+    
+    def stats(self):
+        """Hits, misses and hit rate per tier for this process"""
+        with self._counts_lock:
+            counts = dict(self._counts)
+        return _hit_rates(counts)
+    
+    def flush_stats(self, force=False):
+        """Add this process's counters to the shared totals every STATS_FLUSH_INTERVAL"""
+        if not force and time.monotonic() - self._flushed_at < STATS_FLUSH_INTERVAL:
+            return
+        with self._counts_lock:
+            unflushed, self._unflushed = self._unflushed, dict.fromkeys(self._unflushed, 0)
+            self._flushed_at = time.monotonic()
+        try:
+            for (tier, outcome), value in unflushed.items():
+                if value:
+                    key = _stats_key(self.namespace, tier, outcome)
+                    cache.add(key, 0, STATS_KEY_TTL)
+                    cache.incr(key, value)
+        except Exception:
+            logger.warning('Could not publish cache stats for %s', self.namespace, exc_info=True)
+
+def _hit_rates(counts):
+    stats = {}
+    for tier in TIERS:
+        hits, misses = counts[(tier, 'hits')], counts[(tier, 'misses')]
+        stats[tier] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return stats
+
+def read_cache_stats(namespaces=None):
+    """Hit rates per tier summed over every process, from the published counters"""
+    namespaces = sorted(_registry) if namespaces is None else namespaces
+    keys = {
+        _stats_key(namespace, tier, outcome): (namespace, tier, outcome)
+        for namespace in namespaces for tier in TIERS for outcome in ('hits', 'misses')
+    }
+    values = cache.get_many(keys)
+    return {
+        namespace: _hit_rates({
+            (tier, outcome): values.get(_stats_key(namespace, tier, outcome), 0)
+            for tier in TIERS for outcome in ('hits', 'misses')
+        })
+        for namespace in namespaces
+    }
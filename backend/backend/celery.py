@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
@@ -7,6 +8,12 @@ app = Celery('backend')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
+@worker_process_init.connect
+def warm_email_templates(**kwargs):
+    # Compile email templates once per worker process instead of on first send
+    from backend.emails import warm_templates
+    warm_templates()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
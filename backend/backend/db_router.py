@@ -0,0 +1,121 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Models whose reads may be served by a replica, by app label; None means
+# every model in the app. Everything else always reads from the primary.
+REPLICA_READ_MODELS = {
+    'products': None,
+    'orders': {'order', 'orderitem', 'orderstatushistory'},
+}
+
+_request_state = ContextVar('db_routing_request', default=None)
+_force_primary = ContextVar('db_routing_force_primary', default=False)
+
+def _pin_key(user_id):
+    return f'db-pin:user:{user_id}'
+
+def pin_to_primary(user_id):
+    """Send the user's reads to the primary for the next REPLICA_PIN_SECONDS"""
+    cache.set(_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+def route_as_user(user_id):
+    """Tell the router who is making the current request, when request.user does not know"""
+    state = _request_state.get()
+    if state is not None:
+        state.known_user_id = user_id
+
+@contextmanager
+def use_primary():
+    """Read everything from the primary inside the block"""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+class RequestRouting:
+    """
+    What the router knows about the request being served. Set by
+    ReplicaRoutingMiddleware; outside a request, e.g. in Celery tasks and
+    management commands, every read goes to the primary.
+    """
+    
+    def __init__(self, request):
+        self.request = request
+        self.read_only = request.method in ('GET', 'HEAD', 'OPTIONS')
+        self.wrote = False
+        # Picked up front, as reads may be routed from several threads at once
+        self.replica = random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None
+        self.known_user_id = None
+        self._pinned = {}
+    
+    def user_id(self):
+        if self.known_user_id is not None:
+            return self.known_user_id
+        user = getattr(self.request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return user.pk
+    
+    def pinned(self):
+        # The user is only known once the view has authenticated the request
+        user_id = self.user_id()
+        if user_id is None:
+            return False
+        if user_id not in self._pinned:
+            self._pinned[user_id] = bool(cache.get(_pin_key(user_id)))
+        return self._pinned[user_id]
+
+@contextmanager
+def request_routing(request):
+    state = RequestRouting(request)
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+def _replica_model(model):
+    models = REPLICA_READ_MODELS.get(model._meta.app_label, ())
+    return models is None or model._meta.model_name in models
+
+class ReplicaRouter:
+    """
+    Send reads of REPLICA_READ_MODELS made while serving GET, HEAD and
+    OPTIONS requests to a replica, one per request. Reads go to the primary
+    instead inside a transaction, after the request has written anything,
+    and for users pinned by a recent write (read-your-writes). All writes go
+    to the primary.
+    """
+    
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        state = _request_state.get()
+        if not replicas or state is None or not state.read_only or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if _force_primary.get() or not _replica_model(model):
+            return DEFAULT_DB_ALIAS
+        # Reads in a transaction must see its own writes and locks
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or state.pinned():
+            return DEFAULT_DB_ALIAS
+        return state.replica or DEFAULT_DB_ALIAS
+    
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
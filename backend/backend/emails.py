@@ -0,0 +1,105 @@
+import logging
+import smtplib
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+EMAIL_TEMPLATES = (
+    'emails/order_confirmation.html',
+    'emails/order_shipped.html',
+    'emails/welcome.html',
+)
+
+EMAIL_BATCH_SIZE = 100  # messages sent per SMTP session
+EMAIL_MAX_RETRIES = 5
+EMAIL_RETRY_BACKOFF = 30  # seconds, doubled on every retry
+EMAIL_RETRY_BACKOFF_MAX = 1800
+
+# Errors worth retrying; anything else is a bug and should surface
+EMAIL_ERRORS = (smtplib.SMTPException, OSError)
+
+_templates = {}
+
+def get_email_template(name):
+    """Return a compiled template, loading it only once per process"""
+    template = _templates.get(name)
+    if template is None:
+        template = _templates[name] = get_template(name)
+    return template
+
+def warm_templates():
+    """Compile every email template up front, e.g. when a worker starts"""
+    for name in EMAIL_TEMPLATES:
+        get_email_template(name)
+
+def build_message(subject, body, to, html_template=None, context=None):
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[to] if isinstance(to, str) else list(to),
+    )
+    if html_template:
+        message.attach_alternative(get_email_template(html_template).render(context or {}), 'text/html')
+    return message
+
+def send_batch(messages, connection=None):
+    """
+    Send ``{key: message}`` over one SMTP connection per EMAIL_BATCH_SIZE
+    messages. Returns the keys of messages that could not be delivered; if a
+    connection cannot be opened, that batch and every later one are failed.
+    """
+    items = list(messages.items())
+    failed = []
+    for start in range(0, len(items), EMAIL_BATCH_SIZE):
+        batch_connection = connection or get_connection()
+        try:
+            batch_connection.open()
+        except EMAIL_ERRORS:
+            logger.exception("Failed to open an SMTP connection, %s emails left unsent", len(items) - start)
+            failed.extend(key for key, _ in items[start:])
+            break
+        try:
+            for key, message in items[start:start + EMAIL_BATCH_SIZE]:
+                message.connection = batch_connection
+                try:
+                    message.send()
+                except EMAIL_ERRORS:
+                    logger.exception("Failed to send email %r", key)
+                    failed.append(key)
+        finally:
+            if connection is None:
+                batch_connection.close()
+    return failed
+
+def retry_countdown(retries):
+    return get_exponential_backoff_interval(
+        EMAIL_RETRY_BACKOFF, retries, EMAIL_RETRY_BACKOFF_MAX, full_jitter=True
+    )
+
+class EmailBatchError(Exception):
+    """Raised to retry the part of a batch that could not be delivered"""
+    
+    def __init__(self, failed):
+        super().__init__(f'{len(failed)} emails failed')
+        self.failed = failed
+
+def dispatch(task, messages, retry_args):
+    """
+    Send a batch from inside a bound Celery task. Failed messages are retried
+    with backoff by calling ``retry_args(failed_keys)`` to build the retry's
+    positional arguments, so messages already delivered are never resent.
+    Returns the number of messages sent.
+    """
+    failed = send_batch(messages)
+    if failed:
+        raise task.retry(
+            args=retry_args(failed),
+            kwargs={},
+            exc=EmailBatchError(failed),
+            countdown=retry_countdown(task.request.retries)
+        )
+    return len(messages)
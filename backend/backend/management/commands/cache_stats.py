@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from backend.cache import read_cache_stats
+
+class Command(BaseCommand):
+    help = 'Show hit rates per tier of the two-tier caches, summed over all processes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('namespaces', nargs='*', help='Defaults to every cache registered in this process')
+    
+    def handle(self, *args, **options):
+        stats = read_cache_stats(options['namespaces'] or None)
+        for namespace, tiers in stats.items():
+            line = ', '.join(
+                f"{tier} {values['hits']}/{values['hits'] + values['misses']}"
+                + (f" ({values['hit_rate']:.1%})" if values['hit_rate'] is not None else '')
+                for tier, values in tiers.items()
+            )
+            self.stdout.write(f'{namespace}: {line}')
\ No newline at end of file
@@ -1,5 +1,8 @@
 import time
 import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from .db_router import request_routing, pin_to_primary
 
 logger = logging.getLogger(__name__)
 
@@ -21,4 +24,43 @@ class RequestLoggingMiddleware:
             f"[{response.status_code}] - {duration:.2f}s"
         )
         
+        return response
+
+class ReplicaRoutingMiddleware:
+    """
+    Give the database router the current request, and pin users who made
+    a write request to the primary for a few seconds so their next reads do
+    not hit a lagging replica
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def pins(self, state, response):
+        # GETs may write too, e.g. view counters; only write requests pin
+        return bool(settings.DATABASE_REPLICAS) and not state.read_only and response.status_code < 400
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with request_routing(request) as state:
+            response = self.get_response(request)
+            if self.pins(state, response):
+                user_id = state.user_id()
+                if user_id is not None:
+                    pin_to_primary(user_id)
+        return response
+    
+    async def __acall__(self, request):
+        with request_routing(request) as state:
+            response = await self.get_response(request)
+            if self.pins(state, response):
+                # request.user may still need the session from the database
+                user_id = await sync_to_async(state.user_id)()
+                if user_id is not None:
+                    await sync_to_async(pin_to_primary)(user_id)
         return response
\ No newline at end of file
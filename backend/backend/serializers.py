@@ -0,0 +1,73 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+def parse_field_list(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+class SparseFieldsMixin:
+    """
+    ``?fields=id,name`` limits the output of the top-level serializer to the
+    listed fields, and ``?expand=items`` adds fields named in
+    ``Meta.expandable_fields``, which are left out by default. Nested
+    serializers always render in full. Views call ``selected_fields`` to
+    prune their querysets to match.
+    
+    Pass ``sparse=False`` in the context to render the default fields
+    whatever the request asks for, e.g. for representations that are cached
+    and trimmed per request.
+    
+    ``Meta.field_dependencies`` lists the model fields needed by fields that
+    are not backed by a model field of the same name, e.g. properties.
+    """
+    
+    @classmethod
+    def selected_fields(cls, request):
+        """Names of the fields that will be rendered for this request"""
+        declared = list(cls.Meta.fields)
+        expandable = set(getattr(cls.Meta, 'expandable_fields', ()))
+        if request is None:
+            return [name for name in declared if name not in expandable]
+        
+        expand = set(parse_field_list(request.query_params.get('expand'))) & expandable
+        only = set(parse_field_list(request.query_params.get('fields')))
+        selected = [name for name in declared if name not in expandable or name in expand]
+        if only:
+            selected = [name for name in selected if name in only or name in expand]
+        return selected
+    
+    @classmethod
+    def model_fields(cls, selected):
+        """Concrete model fields to load with ``only()`` for the selected fields"""
+        model = cls.Meta.model
+        dependencies = getattr(cls.Meta, 'field_dependencies', {})
+        names = {model._meta.pk.name}
+        for name in selected:
+            if name in dependencies:
+                names.update(dependencies[name])
+                continue
+            declared = cls._declared_fields.get(name)
+            source = declared.source if declared is not None and declared.source else name
+            try:
+                field = model._meta.get_field(source.split('.')[0])
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.many_to_many:
+                names.add(field.name)
+        return sorted(names)
+    
+    def _is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        sparse = self._is_root() and self.context.get('sparse', True)
+        request = self.context.get('request') if sparse else None
+        selected = set(self.selected_fields(request))
+        # Write-only fields are inputs and never pruned
+        return {
+            name: field for name, field in fields.items()
+            if name in selected or field.write_only
+        }
@@ -25,11 +25,13 @@ INSTALLED_APPS = [
     'corsheaders',
     
     # Local apps
+    'backend',  # project-wide management commands, e.g. cache_stats
     'accounts',
     'products',
     'cart',
     'orders',
     'payments',
+    'reports',
 ]
 
 MIDDLEWARE = [
@@ -39,6 +41,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'backend.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,7 +69,7 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': config('DB_ENGINE', default='django.db.backends.postgresql'),
         'NAME': config('DB_NAME', default='ecommerce_db'),
         'USER': config('DB_USER', default='postgres'),
         'PASSWORD': config('DB_PASSWORD', default='postgres'),
@@ -75,6 +78,24 @@ DATABASES = {
     }
 }
 
+# Optional read replica. Safe-method reads of the catalog and order history go
+# to it, except for users who wrote in the last REPLICA_PIN_SECONDS (see
+# backend/db_router.py). For local testing point DB_NAME and DB_REPLICA_NAME
+# at two databases, or at two SQLite files with DB_ENGINE=django.db.backends.sqlite3
+DB_REPLICA_NAME = config('DB_REPLICA_NAME', default='')
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+if DB_REPLICA_NAME or DB_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': DB_REPLICA_NAME or DATABASES['default']['NAME'],
+        'HOST': DB_REPLICA_HOST or DATABASES['default']['HOST'],
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['backend.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -113,7 +134,7 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -156,6 +177,65 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'purge-idempotency-keys': {
+        'task': 'orders.tasks.purge_idempotency_keys',
+        'schedule': timedelta(hours=1),
+    },
+    'auto-deliver-shipped-orders': {
+        'task': 'orders.tasks.auto_deliver_shipped_orders',
+        'schedule': timedelta(hours=1),
+    },
+    'relay-outbox': {
+        'task': 'orders.tasks.relay_outbox',
+        'schedule': timedelta(seconds=10),
+    },
+    'fail-stale-checkouts': {
+        'task': 'orders.tasks.fail_stale_checkouts',
+        'schedule': timedelta(minutes=5),
+    },
+    'purge-outbox-events': {
+        'task': 'orders.tasks.purge_outbox_events',
+        'schedule': timedelta(days=1),
+    },
+    'process-abandoned-carts': {
+        'task': 'cart.tasks.process_abandoned_carts',
+        'schedule': timedelta(hours=1),
+    },
+    'compute-customer-segments': {
+        'task': 'reports.tasks.compute_customer_segments',
+        'schedule': timedelta(days=1),
+    },
+    'refresh-related-products': {
+        'task': 'products.tasks.refresh_related_products',
+        'schedule': timedelta(hours=1),
+    },
+    'refresh-product-rankings': {
+        'task': 'products.tasks.refresh_product_rankings',
+        'schedule': timedelta(minutes=15),
+    },
+}
+
+# Checkout Settings
+# Queue checkouts for Celery workers instead of placing orders in the request.
+# Run one single-concurrency worker per partition queue (checkout.0 .. checkout.N-1)
+CHECKOUT_ASYNC = config('CHECKOUT_ASYNC', default=False, cast=bool)
+CHECKOUT_QUEUE_PARTITIONS = config('CHECKOUT_QUEUE_PARTITIONS', default=4, cast=int)
+
+# Read order list item totals from the order_summaries table instead of
+# aggregating order_items (run backfill_order_summaries before enabling)
+ORDER_LIST_USE_SUMMARY = config('ORDER_LIST_USE_SUMMARY', default=False, cast=bool)
+
+# Maximum cart/checkout requests per second per SKU (0 disables rate limiting).
+# Sold-out SKUs are always rejected from the cache without touching the database
+PRODUCT_ADMISSION_RATE = config('PRODUCT_ADMISSION_RATE', default=0, cast=int)
+
+# Serve the product list, detail and availability endpoints from async views
+# (products/async_views.py) when running under ASGI. Their independent queries
+# run concurrently on a pool of ASYNC_DB_THREADS threads per process, each
+# holding its own database connection
+PRODUCT_ASYNC_VIEWS = config('PRODUCT_ASYNC_VIEWS', default=False, cast=bool)
+ASYNC_DB_THREADS = config('ASYNC_DB_THREADS', default=8, cast=int)
 
 # Cache Settings
 CACHES = {
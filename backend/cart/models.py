@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from accounts.models import User
 from products.models import Product, ProductVariant
 
@@ -7,13 +8,22 @@ class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # updated_at of the cart contents the last abandoned-cart email was about
+    abandoned_notified_version = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         db_table = 'carts'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='carts_updated_at_idx'),
+        ]
     
     def __str__(self):
         return f"Cart - {self.user.email}"
     
+    def touch(self):
+        """Bump updated_at after the items change, without saving the row"""
+        Cart.objects.filter(pk=self.pk).update(updated_at=timezone.now())
+    
     @property
     def subtotal(self):
         return sum(item.total_price for item in self.items.all())
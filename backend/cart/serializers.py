@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from backend.serializers import SparseFieldsMixin
 from .models import Cart, CartItem
 from products.serializers import ProductListSerializer, ProductVariantSerializer
 
@@ -21,7 +22,7 @@ class CartItemSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Quantity must be at least 1")
         return value
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     subtotal = serializers.ReadOnlyField()
     total_items = serializers.ReadOnlyField()
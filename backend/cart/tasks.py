@@ -0,0 +1,119 @@
+import time
+from celery import shared_task
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from backend.emails import build_message, dispatch, EMAIL_MAX_RETRIES
+from .models import Cart, CartItem
+
+ABANDONED_CART_AFTER = timedelta(hours=24)
+# Carts idle for longer than this are no longer worth a reminder
+ABANDONED_CART_WINDOW = timedelta(days=7)
+ABANDONED_CART_CHUNK_SIZE = 1000
+
+def _abandoned_cart_chunks(cutoff, chunk_size):
+    """
+    Yield chunks of ``(id, updated_at, email, first_name)`` for carts idle
+    since before ``cutoff`` whose current contents were not emailed about
+    yet, walking the (updated_at, id) index by keyset.
+    """
+    candidates = Cart.objects.filter(
+        updated_at__gt=cutoff - ABANDONED_CART_WINDOW,
+        updated_at__lte=cutoff,
+    ).filter(
+        Q(abandoned_notified_version__isnull=True) | Q(abandoned_notified_version__lt=F('updated_at'))
+    ).order_by('updated_at', 'id')
+    
+    position = Q()
+    while True:
+        chunk = list(
+            candidates.filter(position).values_list(
+                'id', 'updated_at', 'user__email', 'user__first_name'
+            )[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_id, last_updated_at = chunk[-1][0], chunk[-1][1]
+        position = Q(updated_at__gt=last_updated_at) | Q(updated_at=last_updated_at, id__gt=last_id)
+
+def _cart_totals(cart_ids):
+    """Item count and subtotal for many carts with one aggregate query"""
+    rows = CartItem.objects.filter(cart_id__in=cart_ids).values('cart_id').annotate(
+        total_items=Sum('quantity'),
+        subtotal=Sum(
+            Coalesce(F('variant__price'), F('product__price')) * F('quantity'),
+            output_field=DecimalField(max_digits=12, decimal_places=2)
+        )
+    ).order_by()
+    return {row['cart_id']: row for row in rows}
+
+@shared_task
+def process_abandoned_carts(chunk_size=ABANDONED_CART_CHUNK_SIZE):
+    """
+    Queue reminder emails for abandoned carts, one email job per chunk.
+    Each cart is marked with the version it was emailed about, so it is only
+    emailed again once its contents change and it goes idle again. Returns
+    metrics for the run.
+    """
+    started = time.monotonic()
+    cutoff = timezone.now() - ABANDONED_CART_AFTER
+    scanned = notified = chunks = 0
+    
+    for chunk in _abandoned_cart_chunks(cutoff, chunk_size):
+        chunks += 1
+        scanned += len(chunk)
+        totals = _cart_totals([cart_id for cart_id, *_ in chunk])
+        
+        carts = [
+            {
+                'cart_id': cart_id,
+                'email': email,
+                'first_name': first_name,
+                'total_items': totals[cart_id]['total_items'],
+                'subtotal': str(totals[cart_id]['subtotal'].quantize(Decimal('0.01'))),
+            }
+            for cart_id, updated_at, email, first_name in chunk
+            if cart_id in totals
+        ]
+        if not carts:
+            continue
+        
+        # Carts touched since the scan keep their new version unmarked
+        Cart.objects.filter(
+            id__in=[cart['cart_id'] for cart in carts], updated_at__lte=cutoff
+        ).update(abandoned_notified_version=F('updated_at'))
+        send_abandoned_cart_emails.delay(carts)
+        notified += len(carts)
+    
+    return {
+        'scanned': scanned,
+        'notified': notified,
+        'chunks': chunks,
+        'duration': round(time.monotonic() - started, 2),
+    }
+
+@shared_task(bind=True, max_retries=EMAIL_MAX_RETRIES)
+def send_abandoned_cart_emails(self, carts):
+    """Send abandoned cart reminders over a shared SMTP connection"""
+    messages = {}
+    for cart in carts:
+        message = f"""
+        Hi {cart['first_name']},
+        
+        You left {cart['total_items']} item(s) in your cart.
+        Complete your purchase now!
+        
+        Cart Total: ${cart['subtotal']}
+        
+        Best regards,
+        Your E-commerce Team
+        """
+        messages[cart['cart_id']] = build_message("Don't forget your items!", message, cart['email'])
+    
+    sent = dispatch(
+        self, messages, lambda failed: ([cart for cart in carts if cart['cart_id'] in failed],)
+    )
+    return f"Sent {sent} abandoned cart emails"
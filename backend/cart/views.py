@@ -1,27 +1,60 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db.models import Prefetch, prefetch_related_objects
 from .models import Cart, CartItem
 from .serializers import CartSerializer, CartItemSerializer
 from products.models import Product, ProductVariant
+from products.admission import check_admission, mark_sold_out, SOLD_OUT, RATE_LIMITED
 
 class CartView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
         cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
+        
+        # Load items once for items, subtotal and total_items, and product
+        # details only when the items themselves are rendered
+        fields = set(CartSerializer.selected_fields(request))
+        if 'items' in fields:
+            items = CartItem.objects.select_related('variant').prefetch_related(
+                Prefetch('product', queryset=Product.objects.select_related('category').prefetch_related('images').with_ratings())
+            )
+            prefetch_related_objects([cart], Prefetch('items', queryset=items))
+        elif fields & {'subtotal', 'total_items'}:
+            prefetch_related_objects([cart], Prefetch('items', queryset=CartItem.objects.select_related('product', 'variant')))
+        
+        serializer = CartSerializer(cart, context={'request': request})
         return Response(serializer.data)
 
 class CartItemAddView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
+        try:
+            product_id = int(request.data.get('product_id'))
+            variant_id = int(request.data.get('variant_id') or 0) or None
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            return Response(
+                {'detail': 'product_id, variant_id and quantity must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Sold-out and throttled SKUs are turned away before any database query
+        rejection = check_admission([(product_id, variant_id)])
+        if rejection == SOLD_OUT:
+            return Response(
+                {'detail': 'This item is sold out'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if rejection == RATE_LIMITED:
+            return Response(
+                {'detail': 'Too many requests for this item, please retry'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
         
-        product_id = request.data.get('product_id')
-        variant_id = request.data.get('variant_id')
-        quantity = request.data.get('quantity', 1)
+        cart, created = Cart.objects.get_or_create(user=request.user)
         
         try:
             product = Product.objects.get(id=product_id, is_active=True)
@@ -43,6 +76,11 @@ class CartItemAddView(APIView):
         
         # Check stock
         available_stock = variant.stock if variant else product.stock
+        if available_stock == 0:
+            if variant:
+                mark_sold_out(variant_ids=[variant.id])
+            else:
+                mark_sold_out(product_ids=[product.id])
         if quantity > available_stock:
             return Response(
                 {'detail': f'Only {available_stock} items available'},
@@ -64,6 +102,7 @@ class CartItemAddView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             cart_item.save()
+        cart.touch()
         
         serializer = CartSerializer(cart)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -93,6 +132,7 @@ class CartItemUpdateView(APIView):
                 )
             cart_item.quantity = quantity
             cart_item.save()
+            cart_item.cart.touch()
         
         serializer = CartSerializer(cart_item.cart)
         return Response(serializer.data)
@@ -105,6 +145,7 @@ class CartItemUpdateView(APIView):
             )
             cart = cart_item.cart
             cart_item.delete()
+            cart.touch()
             serializer = CartSerializer(cart)
             return Response(serializer.data)
         except CartItem.DoesNotExist:
@@ -120,6 +161,7 @@ class CartClearView(APIView):
         try:
             cart = Cart.objects.get(user=request.user)
             cart.items.all().delete()
+            cart.touch()
             serializer = CartSerializer(cart)
             return Response(serializer.data)
         except Cart.DoesNotExist:
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Order, OrderItem, OrderStatusHistory, Coupon
+from .models import Order, OrderItem, OrderStatusHistory, Coupon, CouponRedemption
+from .coupons import reconcile_coupon
+from .transitions import transition_orders
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -49,37 +51,23 @@ class OrderAdmin(admin.ModelAdmin):
     
     actions = ['mark_as_processing', 'mark_as_shipped', 'mark_as_delivered']
     
+    def _transition(self, request, queryset, to_status):
+        requested = queryset.count()
+        updated = transition_orders(
+            queryset, to_status, notes='Status updated by admin', user=request.user
+        )
+        self.message_user(request, f"{updated} of {requested} orders marked as {to_status}")
+    
     def mark_as_processing(self, request, queryset):
-        queryset.update(status='processing')
-        for order in queryset:
-            OrderStatusHistory.objects.create(
-                order=order,
-                status='processing',
-                notes='Status updated by admin',
-                created_by=request.user
-            )
+        self._transition(request, queryset, 'processing')
     mark_as_processing.short_description = "Mark as Processing"
     
     def mark_as_shipped(self, request, queryset):
-        queryset.update(status='shipped')
-        for order in queryset:
-            OrderStatusHistory.objects.create(
-                order=order,
-                status='shipped',
-                notes='Status updated by admin',
-                created_by=request.user
-            )
+        self._transition(request, queryset, 'shipped')
     mark_as_shipped.short_description = "Mark as Shipped"
     
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status='delivered')
-        for order in queryset:
-            OrderStatusHistory.objects.create(
-                order=order,
-                status='delivered',
-                notes='Status updated by admin',
-                created_by=request.user
-            )
+        self._transition(request, queryset, 'delivered')
     mark_as_delivered.short_description = "Mark as Delivered"
 
 @admin.register(Coupon)
@@ -87,4 +75,22 @@ class CouponAdmin(admin.ModelAdmin):
     list_display = ['code', 'discount_type', 'discount_value', 'used_count', 'usage_limit', 'is_active', 'valid_from', 'valid_to']
     list_filter = ['discount_type', 'is_active', 'valid_from', 'valid_to']
     search_fields = ['code', 'description']
-    readonly_fields = ['used_count', 'created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['used_count', 'legacy_used_count', 'created_at', 'updated_at']
+    actions = ['reconcile_usage']
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'counter_shards' in form.changed_data or 'usage_limit' in form.changed_data:
+            reconcile_coupon(obj)
+    
+    def reconcile_usage(self, request, queryset):
+        for coupon in queryset:
+            reconcile_coupon(coupon)
+    reconcile_usage.short_description = "Reconcile usage from redemption ledger"
+
+@admin.register(CouponRedemption)
+class CouponRedemptionAdmin(admin.ModelAdmin):
+    list_display = ['coupon', 'order', 'user', 'shard', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['coupon__code', 'order__order_number', 'user__email']
+    readonly_fields = ['coupon', 'order', 'user', 'shard', 'created_at']
\ No newline at end of file
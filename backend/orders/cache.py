@@ -0,0 +1,23 @@
+from backend.cache import TieredCache
+
+ORDER_DETAIL_TTL = 300  # seconds
+ORDER_DETAIL_LOCAL_TTL = 5  # seconds
+ORDER_DETAIL_STALE_TTL = 60  # seconds
+
+order_cache = TieredCache('orders', ORDER_DETAIL_TTL, ORDER_DETAIL_LOCAL_TTL, local_max_size=2000,
+                          stale_ttl=ORDER_DETAIL_STALE_TTL)
+
+def _order_detail_key(order_number):
+    return f'detail:{order_number}'
+
+def get_order_detail(order_number, load):
+    """
+    Return the cached ``{'user_id': ..., 'data': ...}`` entry for an order,
+    or None if there is no such order. On a miss ``load(order_number)``
+    builds the entry, once for all concurrent callers. The owner id is kept
+    next to the body so permission checks do not need the database.
+    """
+    return order_cache.get_or_compute(_order_detail_key(order_number), lambda: load(order_number))
+
+def invalidate_order_detail(order_numbers):
+    order_cache.delete_many([_order_detail_key(order_number) for order_number in order_numbers])
@@ -0,0 +1,169 @@
+import hashlib
+import random
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from backend.cache import TieredCache
+from .models import Coupon, CouponCounterShard, CouponRedemption
+
+COUPON_CACHE_TTL = 300  # seconds
+COUPON_LOCAL_TTL = 5  # seconds
+COUPON_LOCAL_MAX_SIZE = 1024
+COUPON_MISSING_TTL = 60  # seconds an unknown code is remembered
+
+# Marks codes that are known not to exist
+MISSING = 'missing'
+
+coupon_cache = TieredCache('coupons', COUPON_CACHE_TTL, COUPON_LOCAL_TTL, COUPON_LOCAL_MAX_SIZE)
+
+def _code_key(code):
+    return f'code:{hashlib.md5(code.encode()).hexdigest()}'
+
+def _load_coupon(code):
+    coupon_key = _code_key(code)
+    coupon = coupon_cache.get(coupon_key)
+    if coupon is not None:
+        return coupon
+    
+    coupon = Coupon.objects.filter(code=code).first()
+    if coupon is None:
+        # Unknown codes get a short-lived entry of their own, so repeated
+        # guesses stay off the database
+        coupon_cache.set(coupon_key, MISSING, COUPON_MISSING_TTL)
+        return MISSING
+    coupon_cache.set(coupon_key, coupon)
+    return coupon
+
+def get_coupon(code):
+    """
+    Look a coupon up by code through the two-tier coupon cache. Returns None
+    for unknown codes. Usage counters on the returned instance may lag
+    behind; redeem_coupon is the authoritative check.
+    """
+    if not code or len(code) > Coupon._meta.get_field('code').max_length:
+        return None
+    
+    coupon = _load_coupon(code)
+    return None if coupon == MISSING else coupon
+
+def get_active_coupon(code):
+    """Return the coupon if it exists, is active and is within its validity window"""
+    coupon = get_coupon(code)
+    now = timezone.now()
+    if coupon and coupon.is_active and coupon.valid_from <= now <= coupon.valid_to:
+        return coupon
+    return None
+
+def invalidate_coupon_cache():
+    """Drop every cached coupon, in this process and, through pub/sub, all others"""
+    coupon_cache.clear()
+
+def _has_uses_left():
+    # usage_limit of NULL or 0 means the coupon is unlimited
+    return Q(usage_limit__isnull=True) | Q(usage_limit=0) | Q(used_count__lt=F('usage_limit'))
+
+def _shard_has_capacity():
+    return Q(capacity__isnull=True) | Q(used__lt=F('capacity'))
+
+def has_uses_left(coupon):
+    """
+    Whether a coupon can still be redeemed, for checks ahead of checkout.
+    Sharded coupons count their uses on the shards, so those are read
+    instead of used_count, which only catches up on reconcile.
+    """
+    if not coupon.usage_limit:
+        return True
+    if coupon.counter_shards:
+        shards = list(coupon.shards.values_list('capacity', 'used'))
+        if shards:
+            return any(capacity is None or used < capacity for capacity, used in shards)
+    return coupon.used_count < coupon.usage_limit
+
+def _claim_shard(coupon):
+    """
+    Claim one use from a random shard, falling back to the others in turn.
+    Returns the shard number or None when every shard is exhausted.
+    """
+    shards = list(range(coupon.counter_shards))
+    start = random.randrange(len(shards))
+    for shard in shards[start:] + shards[:start]:
+        claimed = CouponCounterShard.objects.filter(
+            coupon=coupon, shard=shard
+        ).filter(_shard_has_capacity()).update(used=F('used') + 1)
+        if claimed:
+            return shard
+    return None
+
+def redeem_coupon(coupon, order=None, user=None):
+    """
+    Claim one use of a coupon with a single conditional increment and record
+    it in the redemption ledger. Must run inside the checkout transaction so a
+    failed order gives the use back. Returns False when the limit is reached.
+    """
+    shard = None
+    if coupon.counter_shards:
+        shard = _claim_shard(coupon)
+        if shard is None and coupon.shards.count() < coupon.counter_shards:
+            # Sharding was enabled without allocating the shards, e.g. outside the admin
+            reconcile_coupon(coupon)
+            shard = _claim_shard(coupon)
+        if shard is None:
+            return False
+    else:
+        claimed = Coupon.objects.filter(pk=coupon.pk).filter(_has_uses_left()).update(
+            used_count=F('used_count') + 1
+        )
+        if not claimed:
+            return False
+    
+    CouponRedemption.objects.create(coupon=coupon, order=order, user=user, shard=shard)
+    return True
+
+@transaction.atomic
+def reconcile_coupon(coupon):
+    """
+    Rebuild a coupon's counters from the redemption ledger, on top of the
+    uses counted before the ledger existed. For sharded coupons the remaining
+    uses are re-allocated evenly across the shards. Returns the reconciled
+    used count.
+    """
+    coupon = Coupon.objects.select_for_update().get(pk=coupon.pk)
+    per_shard = dict(
+        coupon.redemptions.values_list('shard').annotate(count=Count('id')).order_by()
+    )
+    redeemed = sum(per_shard.values())
+    if coupon.legacy_used_count is None:
+        # used_count moves with the unsharded ledger rows, the rest predate the ledger
+        coupon.legacy_used_count = max(coupon.used_count - per_shard.get(None, 0), 0)
+    used_count = coupon.legacy_used_count + redeemed
+    Coupon.objects.filter(pk=coupon.pk).update(
+        used_count=used_count, legacy_used_count=coupon.legacy_used_count
+    )
+    
+    coupon.shards.filter(shard__gte=coupon.counter_shards).delete()
+    if coupon.counter_shards:
+        remaining = None
+        if coupon.usage_limit:
+            remaining = max(coupon.usage_limit - used_count, 0)
+        
+        shards = []
+        for shard in range(coupon.counter_shards):
+            used = per_shard.get(shard, 0)
+            capacity = None
+            if remaining is not None:
+                share = remaining // coupon.counter_shards
+                if shard < remaining % coupon.counter_shards:
+                    share += 1
+                capacity = used + share
+            shards.append(CouponCounterShard(coupon=coupon, shard=shard, capacity=capacity, used=used))
+        
+        # Uses recorded against the row counter before sharding was enabled
+        # are already reflected in the remaining capacity above
+        CouponCounterShard.objects.bulk_create(
+            shards,
+            update_conflicts=True,
+            unique_fields=['coupon', 'shard'],
+            update_fields=['capacity', 'used']
+        )
+    
+    return used_count
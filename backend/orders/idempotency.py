@@ -0,0 +1,130 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+from django.db.models import Q
+from django.http import QueryDict
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IDEMPOTENCY_RETENTION = timedelta(hours=24)
+IDEMPOTENCY_LEASE = timedelta(seconds=60)  # longer than any request may run
+IDEMPOTENCY_WAIT_TIMEOUT = 10  # seconds
+IDEMPOTENCY_POLL_INTERVAL = 0.1  # seconds
+
+def _fingerprint(request):
+    data = request.data
+    if isinstance(data, QueryDict):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+def _lease_active(record):
+    return record.locked_until is not None and record.locked_until > timezone.now()
+
+def _wait_for_completion(record):
+    """
+    Wait while another request holds the key. Returns the latest record,
+    which is still in progress if its lease ran out or the wait timed out,
+    or None when that request failed and released the key.
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+    while record.status == 'in_progress' and _lease_active(record) and time.monotonic() < deadline:
+        time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None:
+            return None
+    return record
+
+def _take_over(record):
+    """Claim an in_progress key whose lease ran out, e.g. because its process died"""
+    now = timezone.now()
+    return IdempotencyKey.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lte=now),
+        pk=record.pk,
+        status='in_progress'
+    ).update(locked_until=now + IDEMPOTENCY_LEASE) == 1
+
+def idempotent(scope):
+    """
+    Make a POST handler safe to retry with an ``Idempotency-Key`` header.
+    The first request stores its final response; retries with the same key
+    and payload replay it without running the handler again, and concurrent
+    duplicates wait for the in-flight request to finish. A key whose request
+    died mid-way is handed to the next retry once its lease runs out.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.META.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return handler(self, request, *args, **kwargs)
+            
+            if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+                return Response(
+                    {'detail': 'Idempotency-Key is too long'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            fingerprint = _fingerprint(request)
+            record, created = IdempotencyKey.objects.get_or_create(
+                user=request.user,
+                scope=scope,
+                key=key,
+                defaults={'fingerprint': fingerprint, 'locked_until': timezone.now() + IDEMPOTENCY_LEASE}
+            )
+            
+            if not created and record.created_at < timezone.now() - IDEMPOTENCY_RETENTION:
+                # Expired keys are reused as if they were new
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+                record = IdempotencyKey.objects.create(
+                    user=request.user, scope=scope, key=key, fingerprint=fingerprint,
+                    locked_until=timezone.now() + IDEMPOTENCY_LEASE
+                )
+                created = True
+            
+            if not created:
+                if record.fingerprint != fingerprint:
+                    return Response(
+                        {'detail': 'Idempotency-Key was already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                
+                if record.status == 'in_progress':
+                    record = _wait_for_completion(record)
+                    if record is None or (record.status == 'in_progress' and not _take_over(record)):
+                        return Response(
+                            {'detail': 'A request with this Idempotency-Key is still in progress'},
+                            status=status.HTTP_409_CONFLICT
+                        )
+                
+                if record.status == 'completed':
+                    return _replay(record)
+            
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            
+            if response.status_code >= 500:
+                # Server errors are not final, let the client retry them
+                record.delete()
+            else:
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    status='completed',
+                    response_status=response.status_code,
+                    response_body=response.data
+                )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from orders.models import Order
+from orders.utils import refresh_order_summaries
+
+class Command(BaseCommand):
+    help = 'Build order_summaries rows for orders that do not have one yet'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        
+        while True:
+            order_ids = list(
+                Order.objects.filter(id__gt=last_id, summary__isnull=True)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            
+            refresh_order_summaries(order_ids)
+            last_id = order_ids[-1]
+            total += len(order_ids)
+        
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {total} order summaries'))
@@ -0,0 +1,104 @@
+import itertools
+import socketserver
+import threading
+import time
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+from backend.emails import build_message, send_batch, warm_templates
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and discard messages"""
+    
+    def handle(self):
+        # Stands in for the TCP/TLS handshake cost of a real mail server
+        time.sleep(self.server.connect_latency)
+        self.wfile.write(b'220 sink ESMTP\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'DATA':
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                next(self.server.received)
+                self.wfile.write(b'250 OK\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class Command(BaseCommand):
+    help = 'Compare per-message send_mail with the batched email dispatcher against a local SMTP sink'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--connect-latency', type=float, default=20,
+                            help='Milliseconds the sink waits before greeting each connection')
+    
+    def handle(self, *args, **options):
+        sink = SMTPSink(('127.0.0.1', 0), SMTPSinkHandler)
+        sink.connect_latency = options['connect_latency'] / 1000
+        sink.received = itertools.count()
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        
+        smtp = {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': '127.0.0.1',
+            'EMAIL_PORT': sink.server_address[1],
+            'EMAIL_USE_TLS': False,
+            'EMAIL_HOST_USER': '',
+            'EMAIL_HOST_PASSWORD': '',
+        }
+        count = options['messages']
+        context = {
+            'order': {'order_number': 'ORD-BENCH', 'carrier': 'UPS', 'tracking_number': '1Z999'},
+            'tracking_number': '1Z999',
+            'carrier': 'UPS',
+        }
+        
+        try:
+            with override_settings(**smtp):
+                start = time.perf_counter()
+                for i in range(count):
+                    send_mail(
+                        subject='Your Order Has Shipped',
+                        message='Your order has shipped.',
+                        from_email=None,
+                        recipient_list=[f'customer{i}@example.com'],
+                        html_message=render_to_string('emails/order_shipped.html', context),
+                        connection=get_connection(),
+                    )
+                naive = time.perf_counter() - start
+                
+                start = time.perf_counter()
+                warm_templates()
+                failed = send_batch({
+                    i: build_message(
+                        'Your Order Has Shipped',
+                        'Your order has shipped.',
+                        f'customer{i}@example.com',
+                        'emails/order_shipped.html',
+                        context
+                    )
+                    for i in range(count)
+                })
+                batched = time.perf_counter() - start
+        finally:
+            sink.shutdown()
+            sink.server_close()
+        
+        self.stdout.write(f'Messages:            {count} per run')
+        self.stdout.write(f'Received by sink:    {next(sink.received)}')
+        self.stdout.write(f'send_mail per email: {count / naive:,.0f} msg/s ({naive:.2f}s)')
+        self.stdout.write(f'Batched dispatcher:  {count / batched:,.0f} msg/s ({batched:.2f}s)')
+        self.stdout.write(f'Failed:              {len(failed)}')
+        self.stdout.write(self.style.SUCCESS('Email dispatch benchmark complete'))
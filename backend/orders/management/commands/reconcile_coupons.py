@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from orders.models import Coupon
+from orders.coupons import reconcile_coupon
+
+class Command(BaseCommand):
+    help = 'Rebuild coupon usage counters from the redemption ledger'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--code', help='Only reconcile the coupon with this code')
+    
+    def handle(self, *args, **options):
+        coupons = Coupon.objects.all()
+        if options['code']:
+            coupons = coupons.filter(code=options['code'])
+        
+        for coupon in coupons.iterator():
+            used_count = reconcile_coupon(coupon)
+            if used_count != coupon.used_count:
+                self.stdout.write(
+                    f'{coupon.code}: used_count {coupon.used_count} -> {used_count}'
+                )
+        
+        self.stdout.write(self.style.SUCCESS('Coupon usage reconciled'))
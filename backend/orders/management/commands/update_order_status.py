@@ -1,31 +1,21 @@
 from django.core.management.base import BaseCommand
-from orders.models import Order
-from django.utils import timezone
-from datetime import timedelta
+from orders.tasks import auto_deliver_shipped_orders
 
 class Command(BaseCommand):
     help = 'Auto-update order statuses based on time'
     
     def handle(self, *args, **kwargs):
-        # Auto-mark orders as delivered after 7 days of shipping
-        seven_days_ago = timezone.now() - timedelta(days=7)
+        # Auto-mark orders as delivered after 7 days of shipping. Runs
+        # periodically under Celery beat; this runs the same job inline
+        metrics = auto_deliver_shipped_orders()
         
-        shipped_orders = Order.objects.filter(
-            status='shipped',
-            shipped_at__lte=seven_days_ago
-        )
-        
-        for order in shipped_orders:
-            order.status = 'delivered'
-            order.delivered_at = timezone.now()
-            order.save()
-            
-            self.stdout.write(
-                f'Marked order {order.order_number} as delivered'
-            )
+        if metrics['skipped']:
+            self.stdout.write(self.style.WARNING('Another node is already running this job'))
+            return
         
         self.stdout.write(
             self.style.SUCCESS(
-                f'Updated {shipped_orders.count()} orders to delivered status'
+                f"Updated {metrics['delivered']} orders to delivered status "
+                f"in {metrics['chunks']} chunks ({metrics['duration']}s)"
             )
         )
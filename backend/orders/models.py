@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
 from accounts.models import User, Address
 from products.models import Product, ProductVariant
 import uuid
@@ -68,6 +69,11 @@ class Order(models.Model):
         indexes = [
             models.Index(fields=['order_number']),
             models.Index(fields=['user', '-created_at']),
+            models.Index(
+                fields=['status', 'shipped_at'],
+                name='orders_shipped_at_idx',
+                condition=models.Q(status='shipped')
+            ),
         ]
     
     def save(self, *args, **kwargs):
@@ -102,6 +108,18 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.product_name} x {self.quantity}"
 
+class OrderSummary(models.Model):
+    """Per-order item totals maintained on write, so order lists need no join"""
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    item_count = models.PositiveIntegerField(default=0)
+    total_quantity = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'order_summaries'
+    
+    def __str__(self):
+        return f"Summary of order {self.order_id}"
+
 class OrderStatusHistory(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_history')
     status = models.CharField(max_length=20)
@@ -133,6 +151,11 @@ class Coupon(models.Model):
     
     usage_limit = models.PositiveIntegerField(null=True, blank=True)
     used_count = models.PositiveIntegerField(default=0)
+    # Uses counted before the redemption ledger existed; captured by the first reconcile
+    legacy_used_count = models.PositiveIntegerField(null=True, blank=True)
+    
+    # Number of counter shards for very hot coupons; 0 keeps the counter on this row
+    counter_shards = models.PositiveSmallIntegerField(default=0)
     
     is_active = models.BooleanField(default=True)
     
@@ -146,4 +169,114 @@ class Coupon(models.Model):
         db_table = 'coupons'
     
     def __str__(self):
-        return self.code
\ No newline at end of file
+        return self.code
+
+class CouponCounterShard(models.Model):
+    """Pre-allocated slice of a hot coupon's usage limit"""
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    used = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'coupon_counter_shards'
+        unique_together = ['coupon', 'shard']
+    
+    def __str__(self):
+        return f"{self.coupon.code} - shard {self.shard}"
+
+class CouponRedemption(models.Model):
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='redemptions')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, related_name='coupon_redemptions')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'coupon_redemptions'
+        indexes = [
+            models.Index(fields=['coupon', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.coupon.code} - order {self.order_id}"
+
+class IdempotencyKey(models.Model):
+    STATUS_CHOICES = [
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    # Lease of the request handling an in_progress key; once it runs out a retry may take over
+    locked_until = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'idempotency_keys'
+        unique_together = ['user', 'scope', 'key']
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope} - {self.key}"
+
+class CheckoutTicket(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    ticket = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='checkout_tickets')
+    payload = models.JSONField(default=dict)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'checkout_tickets'
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"Checkout {self.ticket} ({self.status})"
+
+class OutboxEvent(models.Model):
+    """Event written in the same transaction as the state change it describes"""
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    dedupe_key = models.CharField(max_length=255, unique=True)
+    
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'outbox_events'
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='outbox_pending_idx',
+                condition=models.Q(dispatched_at__isnull=True)
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic} ({self.dedupe_key})"
\ No newline at end of file
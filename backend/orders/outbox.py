@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import uuid
+from datetime import timedelta
+from celery import current_app
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_RETENTION = timedelta(days=7)
+OUTBOX_MAX_ATTEMPTS = 10  # events failing this often are left for inspection
+
+# Celery tasks each topic is delivered to. Events of one topic in a relay
+# batch are grouped into a single call with their payloads as ``events``,
+# each payload carrying the event's ``dedupe_key``
+OUTBOX_HANDLERS = {
+    'order.created': [],
+    'order.paid': [
+        'orders.tasks.send_order_confirmation_emails',
+        'reports.tasks.update_sales_rollups',
+    ],
+    'order.payment_failed': [],
+    'order.status_changed': [
+        'orders.tasks.send_order_status_notifications',
+        'reports.tasks.update_sales_rollups',
+    ],
+}
+
+def publish_event(topic, payload, dedupe_key=None):
+    """
+    Record an event in the outbox. Call inside the transaction that makes the
+    state change so the event exists if and only if the change commits.
+    Events with an already recorded dedupe key are ignored.
+    """
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(topic=topic, payload=payload, dedupe_key=dedupe_key or f'{topic}:{uuid.uuid4().hex}')],
+        ignore_conflicts=True
+    )
+
+def publish_order_paid(order):
+    # Keyed by order so the redirect and the webhook only send one confirmation
+    publish_event('order.paid', {'order_id': order.id}, dedupe_key=f'order.paid:{order.id}')
+
+def unhandled_events(events, consumer):
+    """
+    Drop events the consumer has already handled. A relay that crashes after
+    sending a batch sends it again, so consumers with side effects that are
+    not idempotent (emails) filter their ``events`` through this first.
+    """
+    timeout = int(OUTBOX_RETENTION.total_seconds())
+    return [
+        event for event in events
+        if cache.add(f'outbox:done:{consumer}:{event["dedupe_key"]}', True, timeout)
+    ]
+
+def relay_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Send one batch of pending events to Celery. Rows are claimed with
+    SKIP LOCKED so several relays can drain the outbox side by side.
+    Returns the number of events dispatched and the number that failed.
+    """
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(dispatched_at__isnull=True, attempts__lt=OUTBOX_MAX_ATTEMPTS)
+            .order_by('id')[:batch_size]
+        )
+        
+        by_topic = {}
+        for event in events:
+            by_topic.setdefault(event.topic, []).append(event)
+        
+        dispatched, failed = [], []
+        for topic, topic_events in by_topic.items():
+            ids = [event.id for event in topic_events]
+            # Same for every relay of these events, so a redelivered group can be
+            # traced in the worker logs. Celery does not dedupe on it; consumers
+            # do that per event through unhandled_events
+            group_key = hashlib.md5(
+                '|'.join(event.dedupe_key for event in topic_events).encode()
+            ).hexdigest()
+            payloads = [dict(event.payload, dedupe_key=event.dedupe_key) for event in topic_events]
+            try:
+                for task_name in OUTBOX_HANDLERS.get(topic, []):
+                    current_app.signature(task_name, kwargs={'events': payloads}).apply_async(
+                        task_id=f'{topic}:{group_key}:{task_name}'
+                    )
+            except Exception:
+                logger.exception("Failed to relay %s outbox events %s", topic, ids)
+                failed.extend(ids)
+            else:
+                dispatched.extend(ids)
+        
+        OutboxEvent.objects.filter(id__in=dispatched).update(dispatched_at=timezone.now())
+        if failed:
+            OutboxEvent.objects.filter(id__in=failed).update(attempts=F('attempts') + 1)
+    return len(dispatched), len(failed)
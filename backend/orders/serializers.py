@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from orders.models import Order, OrderItem, OrderStatusHistory, Coupon
+from backend.serializers import SparseFieldsMixin
+from orders.models import Order, OrderItem, OrderStatusHistory, Coupon, CheckoutTicket
 from accounts.serializers import AddressSerializer
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -12,18 +13,19 @@ class OrderStatusHistorySerializer(serializers.ModelSerializer):
         model = OrderStatusHistory
         fields = ['status', 'notes', 'created_at']
 
-class OrderListSerializer(serializers.ModelSerializer):
-    item_count = serializers.SerializerMethodField()
+class OrderListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Annotated by OrderListView
+    item_count = serializers.IntegerField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+    items = OrderItemSerializer(many=True, read_only=True)
     
     class Meta:
         model = Order
         fields = ['id', 'order_number', 'status', 'payment_status', 'total', 
-                  'item_count', 'created_at']
-    
-    def get_item_count(self, obj):
-        return obj.items.count()
+                  'item_count', 'total_quantity', 'created_at', 'items']
+        expandable_fields = ['items']
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     shipping_address = AddressSerializer(read_only=True)
     billing_address = AddressSerializer(read_only=True)
@@ -51,4 +53,11 @@ class CouponSerializer(serializers.ModelSerializer):
     class Meta:
         model = Coupon
         fields = ['code', 'description', 'discount_type', 'discount_value', 
-                  'min_purchase', 'valid_from', 'valid_to']
\ No newline at end of file
+                  'min_purchase', 'valid_from', 'valid_to']
+
+class CheckoutTicketSerializer(serializers.ModelSerializer):
+    order_number = serializers.CharField(source='order.order_number', read_only=True, default=None)
+    
+    class Meta:
+        model = CheckoutTicket
+        fields = ['ticket', 'status', 'order_number', 'error', 'created_at', 'updated_at']
\ No newline at end of file
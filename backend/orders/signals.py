@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from accounts.models import Address
+from .models import Coupon, Order, OrderItem, OrderStatusHistory
+from .coupons import invalidate_coupon_cache
+from .cache import invalidate_order_detail
+
+@receiver([post_save, post_delete], sender=Coupon)
+def coupon_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_coupon_cache)
+
+def _invalidate_on_commit(order_numbers):
+    order_numbers = list(order_numbers)
+    transaction.on_commit(lambda: invalidate_order_detail(order_numbers))
+
+@receiver([post_save, post_delete], sender=Order)
+def order_changed(sender, instance, **kwargs):
+    _invalidate_on_commit([instance.order_number])
+
+@receiver([post_save, post_delete], sender=OrderItem)
+@receiver([post_save, post_delete], sender=OrderStatusHistory)
+def order_child_changed(sender, instance, **kwargs):
+    _invalidate_on_commit(
+        Order.objects.filter(pk=instance.order_id).values_list('order_number', flat=True)
+    )
+
+@receiver(post_save, sender=Address)
+def address_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    _invalidate_on_commit(
+        Order.objects.filter(
+            Q(shipping_address=instance) | Q(billing_address=instance)
+        ).values_list('order_number', flat=True)
+    )
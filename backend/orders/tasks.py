@@ -1,23 +1,28 @@
 from celery import shared_task
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
-from .models import Order
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import time
+from backend.cache import cache_lock
+from backend.emails import build_message, dispatch, EMAIL_MAX_RETRIES
+from .models import Order, IdempotencyKey, CheckoutTicket, OutboxEvent
+from .idempotency import IDEMPOTENCY_RETENTION
+from .utils import create_order_from_cart, CheckoutError
+from .transitions import id_chunks, transition_orders, TRANSITION_CHUNK_SIZE
+from .outbox import relay_batch, unhandled_events, OUTBOX_BATCH_SIZE, OUTBOX_RETENTION
 
-@shared_task
-def send_order_confirmation_email(order_id):
-    """Send order confirmation email to customer"""
-    try:
-        order = Order.objects.get(id=order_id)
-        
-        subject = f'Order Confirmation - {order.order_number}'
-        
-        html_message = render_to_string('emails/order_confirmation.html', {
-            'order': order,
-            'items': order.items.all(),
-        })
-        
-        plain_message = f"""
+logger = logging.getLogger(__name__)
+
+STATUS_MESSAGES = {
+    'processing': 'Your order is being processed',
+    'shipped': 'Your order has been shipped',
+    'delivered': 'Your order has been delivered',
+    'cancelled': 'Your order has been cancelled',
+}
+
+def _confirmation_message(order, new_status=None):
+    plain_message = f"""
         Thank you for your order!
         
         Order Number: {order.order_number}
@@ -28,38 +33,16 @@ def send_order_confirmation_email(order_id):
         Best regards,
         Your E-commerce Team
         """
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[order.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        
-        return f"Order confirmation email sent to {order.email}"
-    
-    except Order.DoesNotExist:
-        return f"Order {order_id} not found"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
+    return build_message(
+        f'Order Confirmation - {order.order_number}',
+        plain_message,
+        order.email,
+        'emails/order_confirmation.html',
+        {'order': order, 'items': order.items.all()}
+    )
 
-@shared_task
-def send_order_shipped_email(order_id):
-    """Send shipping notification email to customer"""
-    try:
-        order = Order.objects.get(id=order_id)
-        
-        subject = f'Your Order Has Shipped - {order.order_number}'
-        
-        html_message = render_to_string('emails/order_shipped.html', {
-            'order': order,
-            'tracking_number': order.tracking_number,
-            'carrier': order.carrier,
-        })
-        
-        plain_message = f"""
+def _shipped_message(order, new_status=None):
+    plain_message = f"""
         Good news! Your order has shipped.
         
         Order Number: {order.order_number}
@@ -71,59 +54,203 @@ def send_order_shipped_email(order_id):
         Best regards,
         Your E-commerce Team
         """
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[order.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        
-        return f"Shipping notification sent to {order.email}"
-    
-    except Order.DoesNotExist:
-        return f"Order {order_id} not found"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
+    return build_message(
+        f'Your Order Has Shipped - {order.order_number}',
+        plain_message,
+        order.email,
+        'emails/order_shipped.html',
+        {'order': order, 'tracking_number': order.tracking_number, 'carrier': order.carrier}
+    )
 
-@shared_task
-def send_order_status_update_email(order_id, new_status):
-    """Send order status update email to customer"""
-    try:
-        order = Order.objects.get(id=order_id)
-        
-        subject = f'Order Status Update - {order.order_number}'
-        
-        status_messages = {
-            'processing': 'Your order is being processed',
-            'shipped': 'Your order has been shipped',
-            'delivered': 'Your order has been delivered',
-            'cancelled': 'Your order has been cancelled',
-        }
-        
-        plain_message = f"""
+def _status_message(order, new_status=None):
+    plain_message = f"""
         Order Status Update
         
         Order Number: {order.order_number}
-        Status: {status_messages.get(new_status, new_status)}
+        Status: {STATUS_MESSAGES.get(new_status, new_status)}
         
         Best regards,
         Your E-commerce Team
         """
+    return build_message(f'Order Status Update - {order.order_number}', plain_message, order.email)
+
+ORDER_EMAILS = {
+    'confirmation': _confirmation_message,
+    'shipped': _shipped_message,
+    'status': _status_message,
+}
+
+@shared_task(bind=True, max_retries=EMAIL_MAX_RETRIES)
+def send_order_emails(self, order_ids, kind, new_status=None):
+    """
+    Send one kind of order email to many orders. Orders are loaded in one
+    query and the messages go out over a shared SMTP connection; only the
+    orders whose message failed are retried.
+    """
+    orders = Order.objects.filter(id__in=order_ids).select_related('user', 'shipping_address')
+    if kind == 'confirmation':
+        orders = orders.prefetch_related('items')
+    
+    build = ORDER_EMAILS[kind]
+    messages = {order.id: build(order, new_status) for order in orders}
+    sent = dispatch(self, messages, lambda failed: (failed, kind, new_status))
+    return f"Sent {sent} {kind} emails"
+
+@shared_task
+def send_order_confirmation_email(order_id):
+    """Send order confirmation email to customer"""
+    send_order_emails.delay([order_id], 'confirmation')
+
+@shared_task
+def send_order_shipped_email(order_id):
+    """Send shipping notification email to customer"""
+    send_order_emails.delay([order_id], 'shipped')
+
+@shared_task
+def send_order_status_update_email(order_id, new_status):
+    """Send order status update email to customer"""
+    send_order_emails.delay([order_id], 'status', new_status)
+
+@shared_task
+def send_order_confirmation_emails(events):
+    """Outbox consumer for order.paid events"""
+    order_ids = [event['order_id'] for event in unhandled_events(events, 'confirmation-emails')]
+    if order_ids:
+        send_order_emails.delay(order_ids, 'confirmation')
+
+@shared_task
+def send_order_status_notifications(events):
+    """Outbox consumer for order.status_changed events, one batch per status"""
+    by_status = {}
+    for event in unhandled_events(events, 'status-notifications'):
+        if not event.get('notify', True):
+            continue
+        by_status.setdefault(event['new_status'], []).extend(event['order_ids'])
+    for new_status, order_ids in by_status.items():
+        if new_status == 'shipped':
+            send_order_emails.delay(order_ids, 'shipped')
+        else:
+            send_order_emails.delay(order_ids, 'status', new_status)
+
+@shared_task
+def purge_idempotency_keys():
+    """Delete idempotency keys past their retention window"""
+    cutoff = timezone.now() - IDEMPOTENCY_RETENTION
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return f"Purged {deleted} idempotency keys"
+
+CHECKOUT_MAX_RETRIES = 3
+CHECKOUT_RETRY_DELAY = 5  # seconds
+CHECKOUT_STALE_AFTER = timedelta(minutes=10)
+CHECKOUT_FAILED_MESSAGE = 'Checkout could not be completed, please try again'
+
+def _fail_ticket(ticket, error):
+    ticket.status = 'failed'
+    ticket.error = error
+    ticket.save(update_fields=['status', 'error', 'updated_at'])
+
+@shared_task(bind=True, max_retries=CHECKOUT_MAX_RETRIES)
+def process_checkout(self, ticket_id):
+    """Place the order for a queued checkout ticket"""
+    # Claim the ticket so a redelivered message cannot place the order twice
+    claimed = CheckoutTicket.objects.filter(id=ticket_id, status='queued').update(
+        status='processing', updated_at=timezone.now()
+    )
+    if not claimed:
+        return f"Checkout ticket {ticket_id} already handled"
+    
+    ticket = CheckoutTicket.objects.select_related('user').get(id=ticket_id)
+    try:
+        # The ticket completes with the order, so a processing ticket never has one
+        with transaction.atomic():
+            order = create_order_from_cart(ticket.user, ticket.payload)
+            ticket.status = 'completed'
+            ticket.order = order
+            ticket.save(update_fields=['status', 'order', 'updated_at'])
+    except CheckoutError as e:
+        _fail_ticket(ticket, e.detail)
+        return f"Checkout {ticket.ticket} failed: {e.detail}"
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            # Unexpected errors may be transient, hand the ticket back and try again
+            CheckoutTicket.objects.filter(id=ticket_id, status='processing').update(status='queued')
+            raise self.retry(exc=exc, countdown=CHECKOUT_RETRY_DELAY)
+        logger.exception("Checkout %s failed", ticket.ticket)
+        _fail_ticket(ticket, CHECKOUT_FAILED_MESSAGE)
+        return f"Checkout {ticket.ticket} failed: {exc}"
+    
+    return f"Checkout {ticket.ticket} placed order {order.order_number}"
+
+@shared_task
+def fail_stale_checkouts():
+    """Fail checkout tickets left processing by a worker that died mid-checkout"""
+    cutoff = timezone.now() - CHECKOUT_STALE_AFTER
+    failed = CheckoutTicket.objects.filter(status='processing', updated_at__lt=cutoff).update(
+        status='failed', error=CHECKOUT_FAILED_MESSAGE, updated_at=timezone.now()
+    )
+    return f"Failed {failed} stale checkout tickets"
+
+AUTO_DELIVER_AFTER = timedelta(days=7)
+AUTO_DELIVER_LOCK_KEY = 'lock:auto-deliver-shipped-orders'
+AUTO_DELIVER_LOCK_TIMEOUT = 300  # seconds without progress before another node may take over
+
+@shared_task
+def auto_deliver_shipped_orders(chunk_size=TRANSITION_CHUNK_SIZE):
+    """Mark orders shipped more than a week ago as delivered"""
+    # Only one node may run the job at a time
+    with cache_lock(AUTO_DELIVER_LOCK_KEY, AUTO_DELIVER_LOCK_TIMEOUT) as lock:
+        if not lock.acquired:
+            logger.info("auto_deliver_shipped_orders already running, skipping")
+            return {'skipped': True}
         
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[order.email],
-            fail_silently=False,
-        )
+        started = time.monotonic()
+        delivered = 0
+        chunks = 0
+        cutoff = timezone.now() - AUTO_DELIVER_AFTER
+        shipped_orders = Order.objects.filter(status='shipped', shipped_at__lte=cutoff)
         
-        return f"Status update email sent to {order.email}"
+        for order_ids in id_chunks(shipped_orders, chunk_size):
+            delivered += transition_orders(
+                order_ids,
+                'delivered',
+                notes='Automatically marked as delivered',
+                chunk_size=chunk_size
+            )
+            chunks += 1
+            lock.refresh()
     
-    except Order.DoesNotExist:
-        return f"Order {order_id} not found"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
+    metrics = {
+        'skipped': False,
+        'delivered': delivered,
+        'chunks': chunks,
+        'duration': round(time.monotonic() - started, 3),
+    }
+    logger.info("auto_deliver_shipped_orders: %s", metrics)
+    return metrics
+
+OUTBOX_RELAY_MAX_BATCHES = 50
+
+@shared_task
+def relay_outbox(batch_size=OUTBOX_BATCH_SIZE, max_batches=OUTBOX_RELAY_MAX_BATCHES):
+    """
+    Drain pending outbox events to their Celery consumers. Bounded so one run
+    cannot hog a worker; the next beat tick picks up whatever is left.
+    """
+    dispatched = failed = 0
+    for _ in range(max_batches):
+        sent, errors = relay_batch(batch_size)
+        dispatched += sent
+        failed += errors
+        # Stop on a short batch or when the broker is failing
+        if sent < batch_size:
+            break
+    if failed:
+        logger.warning("Outbox relay: %s events failed to dispatch", failed)
+    return {'dispatched': dispatched, 'failed': failed}
+
+@shared_task
+def purge_outbox_events():
+    """Delete dispatched outbox events past their retention window"""
+    cutoff = timezone.now() - OUTBOX_RETENTION
+    deleted, _ = OutboxEvent.objects.filter(dispatched_at__lt=cutoff).delete()
+    return f"Purged {deleted} outbox events"
\ No newline at end of file
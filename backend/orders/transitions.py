@@ -0,0 +1,93 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from .models import Order, OrderStatusHistory
+from .cache import invalidate_order_detail
+from .outbox import publish_event
+
+# Allowed order status transitions
+ORDER_TRANSITIONS = {
+    'pending': {'processing', 'cancelled'},
+    'processing': {'shipped', 'cancelled', 'refunded'},
+    'shipped': {'delivered'},
+    'delivered': {'refunded'},
+    'cancelled': set(),
+    'refunded': set(),
+}
+
+# Timestamp fields stamped when an order enters a status
+TRANSITION_TIMESTAMPS = {
+    'shipped': 'shipped_at',
+    'delivered': 'delivered_at',
+}
+
+TRANSITION_CHUNK_SIZE = 500
+
+def allowed_sources(to_status):
+    return [source for source, targets in ORDER_TRANSITIONS.items() if to_status in targets]
+
+def id_chunks(orders, chunk_size=TRANSITION_CHUNK_SIZE):
+    """Yield sorted lists of order ids, walking querysets by id keyset"""
+    if isinstance(orders, QuerySet):
+        last_id = 0
+        while True:
+            ids = list(
+                orders.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+    else:
+        ids = sorted(set(orders))
+        for start in range(0, len(ids), chunk_size):
+            yield ids[start:start + chunk_size]
+
+def _transition_chunk(order_ids, to_status, sources, notes, user, notify, fields):
+    with transaction.atomic():
+        locked = list(
+            Order.objects.select_for_update()
+            .filter(id__in=order_ids, status__in=sources)
+            .values_list('id', 'order_number')
+        )
+        if not locked:
+            return 0
+        ids = [order_id for order_id, order_number in locked]
+        
+        now = timezone.now()
+        updates = {'status': to_status, 'updated_at': now}
+        if to_status in TRANSITION_TIMESTAMPS:
+            updates[TRANSITION_TIMESTAMPS[to_status]] = now
+        updates.update(fields)
+        
+        Order.objects.filter(id__in=ids, status__in=sources).update(**updates)
+        OrderStatusHistory.objects.bulk_create([
+            OrderStatusHistory(order_id=order_id, status=to_status, notes=notes, created_by=user)
+            for order_id in ids
+        ])
+        
+        order_numbers = [order_number for order_id, order_number in locked]
+        transaction.on_commit(lambda: invalidate_order_detail(order_numbers))
+        # Published either way for the other consumers, notify only decides the customer email
+        publish_event('order.status_changed', {'order_ids': ids, 'new_status': to_status, 'notify': notify})
+    return len(ids)
+
+def transition_orders(orders, to_status, notes='', user=None, notify=True,
+                      chunk_size=TRANSITION_CHUNK_SIZE, **fields):
+    """
+    Move a set of orders (a queryset or an iterable of ids) to ``to_status``.
+    Orders whose current status does not allow the transition are skipped.
+    Each chunk runs in its own transaction with one conditional UPDATE, one
+    bulk insert of history rows and one order.status_changed outbox event;
+    with ``notify=False`` the event does not email the customers. Extra
+    keyword arguments are written to the orders as well. Returns the number
+    of orders that changed status.
+    """
+    if to_status not in ORDER_TRANSITIONS:
+        raise ValueError(f'Unknown order status: {to_status}')
+    
+    sources = allowed_sources(to_status)
+    return sum(
+        _transition_chunk(order_ids, to_status, sources, notes, user, notify, fields)
+        for order_ids in id_chunks(orders, chunk_size)
+    )
@@ -1,8 +1,48 @@
 from decimal import Decimal
-from .models import Coupon
-from django.utils import timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, PositiveIntegerField, Q, Sum, When
+from .models import Order, OrderItem, OrderStatusHistory, OrderSummary
+from .coupons import get_active_coupon, has_uses_left, redeem_coupon
+from .outbox import publish_event
+from accounts.models import Address
+from cart.models import CartItem
+from products.admission import check_admission, mark_sold_out, SOLD_OUT, RATE_LIMITED
+from products.cache import invalidate_availability
+from products.models import Product, ProductVariant
 
-def calculate_order_total(subtotal, coupon_code=None, shipping_cost=Decimal('10.00'), tax_rate=Decimal('0.10')):
+TAX_RATE = Decimal('0.10')
+SHIPPING_COST = Decimal('10.00')
+
+ADMISSION_ERRORS = {
+    SOLD_OUT: ('Some items in your cart are sold out', 400),
+    RATE_LIMITED: ('Too many checkouts for an item in your cart, please retry', 429),
+}
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into an order"""
+    
+    def __init__(self, detail, status_code=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+def get_coupon_discount(coupon, subtotal):
+    """
+    Return the discount a coupon grants on the given subtotal
+    """
+    if subtotal < coupon.min_purchase:
+        raise CheckoutError(f'Minimum purchase of ${coupon.min_purchase} required')
+    
+    if coupon.discount_type == 'percentage':
+        discount = (subtotal * coupon.discount_value) / 100
+        if coupon.max_discount:
+            discount = min(discount, coupon.max_discount)
+    else:
+        discount = coupon.discount_value
+    return discount
+
+def calculate_order_total(subtotal, coupon_code=None, shipping_cost=SHIPPING_COST, tax_rate=TAX_RATE):
     """
     Calculate order total with tax, shipping, and discount
     """
@@ -10,29 +50,17 @@ def calculate_order_total(subtotal, coupon_code=None, shipping_cost=Decimal('10.
     discount = Decimal('0.00')
     
     if coupon_code:
-        try:
-            coupon = Coupon.objects.get(
-                code=coupon_code,
-                is_active=True,
-                valid_from__lte=timezone.now(),
-                valid_to__gte=timezone.now()
-            )
-            
-            if coupon.usage_limit and coupon.used_count >= coupon.usage_limit:
-                return None, "Coupon usage limit reached"
-            
-            if subtotal < coupon.min_purchase:
-                return None, f"Minimum purchase of ${coupon.min_purchase} required"
-            
-            if coupon.discount_type == 'percentage':
-                discount = (subtotal * coupon.discount_value) / 100
-                if coupon.max_discount:
-                    discount = min(discount, coupon.max_discount)
-            else:
-                discount = coupon.discount_value
-                
-        except Coupon.DoesNotExist:
+        coupon = get_active_coupon(coupon_code)
+        if coupon is None:
             return None, "Invalid coupon code"
+        
+        if not has_uses_left(coupon):
+            return None, "Coupon usage limit reached"
+        
+        try:
+            discount = get_coupon_discount(coupon, subtotal)
+        except CheckoutError as e:
+            return None, e.detail
     
     total = subtotal + tax + shipping_cost - discount
     
@@ -43,3 +71,208 @@ def calculate_order_total(subtotal, coupon_code=None, shipping_cost=Decimal('10.
         'discount': discount,
         'total': total
     }, None
+
+def lock_stock(cart_items):
+    """
+    Lock the products and variants referenced by the cart items, always in
+    primary key order (products first) so concurrent checkouts cannot deadlock.
+    Returns the locked rows keyed by id.
+    """
+    product_ids = sorted({item.product_id for item in cart_items})
+    variant_ids = sorted({item.variant_id for item in cart_items if item.variant_id})
+    
+    products = {
+        product.id: product
+        for product in Product.objects.select_for_update().filter(id__in=product_ids).order_by('id')
+    }
+    variants = {}
+    if variant_ids:
+        variants = {
+            variant.id: variant
+            for variant in ProductVariant.objects.select_for_update().filter(id__in=variant_ids).order_by('id')
+        }
+    return products, variants
+
+def decrement_stock(model, quantities):
+    """
+    Decrement stock for many rows with a single guarded UPDATE
+    (``SET stock = stock - n WHERE stock >= n``). Raises CheckoutError if any
+    row does not have enough stock left.
+    """
+    if not quantities:
+        return
+    
+    guard = Q()
+    whens = []
+    for pk, quantity in quantities.items():
+        guard |= Q(pk=pk, stock__gte=quantity)
+        whens.append(When(pk=pk, then=F('stock') - quantity))
+    
+    updated = model.objects.filter(guard).update(
+        stock=Case(*whens, default=F('stock'), output_field=PositiveIntegerField())
+    )
+    if updated != len(quantities):
+        raise CheckoutError('Some items in your cart are no longer available')
+
+def create_order_from_cart(user, data):
+    """
+    Turn the user's cart into an order. Stock rows are locked up front, order
+    items are bulk inserted and stock is decremented with guarded updates, so
+    the number of queries does not depend on the size of the cart.
+    """
+    cart_items = list(
+        CartItem.objects.filter(cart__user=user).select_related('product', 'variant')
+    )
+    if not cart_items:
+        raise CheckoutError('Cart is empty')
+    
+    rejection = check_admission([(item.product_id, item.variant_id) for item in cart_items])
+    if rejection:
+        raise CheckoutError(*ADMISSION_ERRORS[rejection])
+    
+    address_ids = {data['shipping_address_id'], data['billing_address_id']}
+    addresses = {
+        address.id: address
+        for address in Address.objects.filter(user=user, id__in=address_ids)
+    }
+    if len(addresses) != len(address_ids):
+        raise CheckoutError('Address not found', status_code=404)
+    
+    with transaction.atomic():
+        products, variants = lock_stock(cart_items)
+        
+        product_quantities = {}
+        variant_quantities = {}
+        lines = []
+        for cart_item in cart_items:
+            product = products.get(cart_item.product_id)
+            variant = variants.get(cart_item.variant_id) if cart_item.variant_id else None
+            if product is None or (cart_item.variant_id and variant is None):
+                raise CheckoutError('Some items in your cart are no longer available')
+            
+            stock_row, quantities = (variant, variant_quantities) if variant else (product, product_quantities)
+            quantities[stock_row.id] = quantities.get(stock_row.id, 0) + cart_item.quantity
+            if quantities[stock_row.id] > stock_row.stock:
+                raise CheckoutError(f'Only {stock_row.stock} of {product.name} available')
+            
+            lines.append((cart_item, product, variant))
+        
+        # Calculate totals
+        subtotal = sum(
+            (variant or product).price * cart_item.quantity
+            for cart_item, product, variant in lines
+        )
+        tax = (subtotal * TAX_RATE).quantize(Decimal('0.01'))
+        shipping_cost = SHIPPING_COST
+        discount = Decimal('0.00')
+        
+        # Apply coupon if provided
+        coupon_code = data.get('coupon_code')
+        if coupon_code:
+            coupon = get_active_coupon(coupon_code)
+            if coupon is None:
+                raise CheckoutError('Invalid coupon code')
+            
+            discount = get_coupon_discount(coupon, subtotal)
+        
+        total = subtotal + tax + shipping_cost - discount
+        
+        # Create order
+        order = Order.objects.create(
+            user=user,
+            email=data.get('email', user.email),
+            phone=data.get('phone', user.phone),
+            shipping_address=addresses[data['shipping_address_id']],
+            billing_address=addresses[data['billing_address_id']],
+            customer_notes=data.get('customer_notes', ''),
+            subtotal=subtotal,
+            tax=tax,
+            shipping_cost=shipping_cost,
+            discount=discount,
+            total=total
+        )
+        
+        if coupon_code and not redeem_coupon(coupon, order=order, user=user):
+            raise CheckoutError('Coupon usage limit reached')
+        
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=product,
+                variant=variant,
+                product_name=product.name,
+                product_sku=variant.sku if variant else product.sku,
+                quantity=cart_item.quantity,
+                unit_price=(variant or product).price,
+                total_price=(variant or product).price * cart_item.quantity
+            )
+            for cart_item, product, variant in lines
+        ])
+        
+        OrderSummary.objects.create(
+            order=order,
+            item_count=len(lines),
+            total_quantity=sum(cart_item.quantity for cart_item, product, variant in lines)
+        )
+        
+        # Reduce stock
+        decrement_stock(Product, product_quantities)
+        decrement_stock(ProductVariant, variant_quantities)
+        
+        # Create status history
+        OrderStatusHistory.objects.create(
+            order=order,
+            status='pending',
+            notes='Order created',
+            created_by=user
+        )
+        
+        # Clear cart
+        CartItem.objects.filter(id__in=[cart_item.id for cart_item in cart_items]).delete()
+        
+        publish_event('order.created', {'order_id': order.id}, dedupe_key=f'order.created:{order.id}')
+        
+        transaction.on_commit(lambda: invalidate_availability(
+            product_quantities.keys(), variant_quantities.keys()
+        ))
+        transaction.on_commit(lambda: mark_sold_out(
+            [pk for pk, quantity in product_quantities.items() if products[pk].stock == quantity],
+            [pk for pk, quantity in variant_quantities.items() if variants[pk].stock == quantity]
+        ))
+    
+    return order
+
+def refresh_order_summaries(order_ids):
+    """
+    Recompute the order_summaries rows for the given orders with one
+    aggregate query and one upsert.
+    """
+    totals = OrderItem.objects.filter(order_id__in=order_ids).values('order_id').annotate(
+        item_count=Count('id'), total_quantity=Sum('quantity')
+    ).order_by()
+    totals = {row['order_id']: row for row in totals}
+    
+    OrderSummary.objects.bulk_create(
+        [
+            OrderSummary(
+                order_id=order_id,
+                item_count=totals.get(order_id, {}).get('item_count', 0),
+                total_quantity=totals.get(order_id, {}).get('total_quantity', 0)
+            )
+            for order_id in order_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['order'],
+        update_fields=['item_count', 'total_quantity']
+    )
+
+def checkout_queue_for(product_ids):
+    """
+    Pick the partition queue for a queued checkout, by the cart's lowest
+    product id. Checkouts of a single hot SKU all land on the same
+    single-concurrency worker, but a cart spanning partitions still contends
+    for the locks of its other SKUs with those partitions' workers;
+    lock_stock's ordering keeps that deadlock-free, not contention-free.
+    """
+    partition = min(product_ids) % settings.CHECKOUT_QUEUE_PARTITIONS
+    return f'checkout.{partition}'
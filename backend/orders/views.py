@@ -1,23 +1,47 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from django.db import transaction
-from .models import Order, OrderItem, OrderStatusHistory, Coupon
+from rest_framework.exceptions import NotFound
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+from .models import Order, CheckoutTicket
 from .serializers import (
     OrderListSerializer, OrderDetailSerializer, 
-    OrderCreateSerializer, CouponSerializer
+    OrderCreateSerializer, CouponSerializer, CheckoutTicketSerializer
 )
-from cart.models import Cart
-from accounts.models import Address
+from .utils import create_order_from_cart, checkout_queue_for, CheckoutError, ADMISSION_ERRORS
+from .tasks import process_checkout
+from cart.models import CartItem
+from products.admission import check_admission
+from .coupons import get_active_coupon, has_uses_left
+from .idempotency import idempotent
+from .cache import get_order_detail
 
 class OrderListView(generics.ListAPIView):
     serializer_class = OrderListSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related('items')
+        fields = set(self.serializer_class.selected_fields(self.request))
+        queryset = Order.objects.filter(user=self.request.user).only(
+            *self.serializer_class.model_fields(fields)
+        ).order_by('-created_at')
+        if 'items' in fields:
+            queryset = queryset.prefetch_related('items')
+        
+        if settings.ORDER_LIST_USE_SUMMARY:
+            counts = {
+                'item_count': Coalesce(F('summary__item_count'), 0),
+                'total_quantity': Coalesce(F('summary__total_quantity'), 0),
+            }
+        else:
+            counts = {
+                'item_count': Count('items'),
+                'total_quantity': Coalesce(Sum('items__quantity'), 0),
+            }
+        # Skip the join and GROUP BY when no count is rendered
+        return queryset.annotate(**{name: value for name, value in counts.items() if name in fields})
 
 class OrderDetailView(generics.RetrieveAPIView):
     serializer_class = OrderDetailSerializer
@@ -25,142 +49,83 @@ class OrderDetailView(generics.RetrieveAPIView):
     lookup_field = 'order_number'
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related(
+        return Order.objects.filter(user=self.request.user).select_related(
+            'shipping_address', 'billing_address'
+        ).prefetch_related(
             'items', 'status_history'
         )
+    
+    def load_order_detail(self, order_number):
+        # Cached for every user, so not limited to the requester's orders
+        order = Order.objects.filter(order_number=order_number).select_related(
+            'shipping_address', 'billing_address'
+        ).prefetch_related(
+            'items', 'status_history'
+        ).first()
+        if order is None:
+            return None
+        return {'user_id': order.user_id, 'data': self.get_serializer(order, context={'request': None}).data}
+    
+    def retrieve(self, request, *args, **kwargs):
+        # The full representation is cached; ?fields= only trims the response
+        cached = get_order_detail(kwargs['order_number'], self.load_order_detail)
+        if cached is None or cached['user_id'] != request.user.id:
+            raise NotFound()
+        
+        fields = set(self.serializer_class.selected_fields(request))
+        return Response({name: value for name, value in cached['data'].items() if name in fields})
 
 class OrderCreateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
-    @transaction.atomic
+    @idempotent('order-create')
     def post(self, request):
         serializer = OrderCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Get cart
+        if settings.CHECKOUT_ASYNC:
+            return self.enqueue(request, serializer.validated_data)
+        
         try:
-            cart = Cart.objects.get(user=request.user)
-        except Cart.DoesNotExist:
-            return Response(
-                {'detail': 'Cart is empty'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            order = create_order_from_cart(request.user, serializer.validated_data)
+        except CheckoutError as e:
+            return Response({'detail': e.detail}, status=e.status_code)
         
-        if not cart.items.exists():
+        # Return order details
+        response_serializer = OrderDetailSerializer(order)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+    
+    def enqueue(self, request, data):
+        lines = list(
+            CartItem.objects.filter(cart__user=request.user).values_list('product_id', 'variant_id')
+        )
+        if not lines:
             return Response(
                 {'detail': 'Cart is empty'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get addresses
-        shipping_address = get_object_or_404(
-            Address, 
-            id=serializer.validated_data['shipping_address_id'],
-            user=request.user
-        )
-        billing_address = get_object_or_404(
-            Address,
-            id=serializer.validated_data['billing_address_id'],
-            user=request.user
-        )
-        
-        # Calculate totals
-        subtotal = cart.subtotal
-        tax = subtotal * 0.1  # 10% tax rate
-        shipping_cost = 10.00  # Fixed shipping cost
-        discount = 0
-        
-        # Apply coupon if provided
-        coupon_code = serializer.validated_data.get('coupon_code')
-        if coupon_code:
-            try:
-                coupon = Coupon.objects.get(
-                    code=coupon_code,
-                    is_active=True,
-                    valid_from__lte=timezone.now(),
-                    valid_to__gte=timezone.now()
-                )
-                
-                if coupon.usage_limit and coupon.used_count >= coupon.usage_limit:
-                    return Response(
-                        {'detail': 'Coupon usage limit reached'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                if subtotal < coupon.min_purchase:
-                    return Response(
-                        {'detail': f'Minimum purchase of ${coupon.min_purchase} required'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                if coupon.discount_type == 'percentage':
-                    discount = (subtotal * coupon.discount_value) / 100
-                    if coupon.max_discount:
-                        discount = min(discount, coupon.max_discount)
-                else:
-                    discount = coupon.discount_value
-                
-                coupon.used_count += 1
-                coupon.save()
-                
-            except Coupon.DoesNotExist:
-                return Response(
-                    {'detail': 'Invalid coupon code'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        
-        total = subtotal + tax + shipping_cost - discount
+        rejection = check_admission(lines)
+        if rejection:
+            detail, status_code = ADMISSION_ERRORS[rejection]
+            return Response({'detail': detail}, status=status_code)
         
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            email=serializer.validated_data.get('email', request.user.email),
-            phone=serializer.validated_data.get('phone', request.user.phone),
-            shipping_address=shipping_address,
-            billing_address=billing_address,
-            customer_notes=serializer.validated_data.get('customer_notes', ''),
-            subtotal=subtotal,
-            tax=tax,
-            shipping_cost=shipping_cost,
-            discount=discount,
-            total=total
-        )
-        
-        # Create order items
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                variant=cart_item.variant,
-                product_name=cart_item.product.name,
-                product_sku=cart_item.variant.sku if cart_item.variant else cart_item.product.sku,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price,
-                total_price=cart_item.total_price
-            )
-            
-            # Reduce stock
-            if cart_item.variant:
-                cart_item.variant.stock -= cart_item.quantity
-                cart_item.variant.save()
-            else:
-                cart_item.product.stock -= cart_item.quantity
-                cart_item.product.save()
+        ticket = CheckoutTicket.objects.create(user=request.user, payload=data)
+        queue = checkout_queue_for([product_id for product_id, variant_id in lines])
+        process_checkout.apply_async(args=[ticket.id], queue=queue)
         
-        # Create status history
-        OrderStatusHistory.objects.create(
-            order=order,
-            status='pending',
-            notes='Order created',
-            created_by=request.user
+        return Response(
+            CheckoutTicketSerializer(ticket).data,
+            status=status.HTTP_202_ACCEPTED
         )
-        
-        # Clear cart
-        cart.items.all().delete()
-        
-        # Return order details
-        response_serializer = OrderDetailSerializer(order)
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+class CheckoutStatusView(generics.RetrieveAPIView):
+    serializer_class = CheckoutTicketSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'ticket'
+    
+    def get_queryset(self):
+        return CheckoutTicket.objects.filter(user=self.request.user).select_related('order')
 
 class ValidateCouponView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -173,26 +138,18 @@ class ValidateCouponView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            coupon = Coupon.objects.get(
-                code=code,
-                is_active=True,
-                valid_from__lte=timezone.now(),
-                valid_to__gte=timezone.now()
-            )
-            
-            if coupon.usage_limit and coupon.used_count >= coupon.usage_limit:
-                return Response(
-                    {'detail': 'Coupon usage limit reached'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            serializer = CouponSerializer(coupon)
-            return Response(serializer.data)
-            
-        except Coupon.DoesNotExist:
+        coupon = get_active_coupon(code)
+        if coupon is None:
             return Response(
                 {'detail': 'Invalid or expired coupon code'},
                 status=status.HTTP_404_NOT_FOUND
             )
-
+        
+        if not has_uses_left(coupon):
+            return Response(
+                {'detail': 'Coupon usage limit reached'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = CouponSerializer(coupon)
+        return Response(serializer.data)
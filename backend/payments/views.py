@@ -2,6 +2,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -10,12 +11,17 @@ import stripe
 import json
 
 from orders.models import Order, OrderStatusHistory
+from orders.idempotency import idempotent
+from orders.transitions import transition_orders
+from orders.cache import invalidate_order_detail
+from orders.outbox import publish_event, publish_order_paid
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 class CreatePaymentIntentView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
+    @idempotent('payment-intent')
     def post(self, request):
         order_number = request.data.get('order_number')
         
@@ -75,22 +81,24 @@ class PaymentSuccessView(APIView):
             intent = stripe.PaymentIntent.retrieve(payment_intent_id)
             
             if intent.status == 'succeeded':
-                order.payment_status = 'paid'
-                order.status = 'processing'
-                order.paid_at = timezone.now()
-                order.transaction_id = payment_intent_id
-                order.save()
-                
-                # Create status history
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status='processing',
-                    notes='Payment received successfully',
-                    created_by=request.user
-                )
-                
-                # TODO: Send order confirmation email
-                # send_order_confirmation_email.delay(order.id)
+                payment = {
+                    'payment_status': 'paid',
+                    'paid_at': timezone.now(),
+                    'transaction_id': payment_intent_id,
+                }
+                with transaction.atomic():
+                    if not transition_orders(
+                        [order.id],
+                        'processing',
+                        notes='Payment received successfully',
+                        user=request.user,
+                        notify=False,
+                        **payment
+                    ):
+                        # Order already moved past pending, only record the payment
+                        Order.objects.filter(pk=order.pk).update(**payment)
+                        transaction.on_commit(lambda: invalidate_order_detail([order.order_number]))
+                    publish_order_paid(order)
                 
                 return Response({
                     'detail': 'Payment successful',
@@ -138,19 +146,18 @@ class StripeWebhookView(APIView):
             try:
                 order = Order.objects.get(order_number=order_number)
                 if order.payment_status != 'paid':
-                    order.payment_status = 'paid'
-                    order.status = 'processing'
-                    order.paid_at = timezone.now()
-                    order.save()
-                    
-                    OrderStatusHistory.objects.create(
-                        order=order,
-                        status='processing',
-                        notes='Payment confirmed via webhook'
-                    )
-                    
-                    # TODO: Send email notification
-                    # send_order_confirmation_email.delay(order.id)
+                    payment = {'payment_status': 'paid', 'paid_at': timezone.now()}
+                    with transaction.atomic():
+                        if not transition_orders(
+                            [order.id],
+                            'processing',
+                            notes='Payment confirmed via webhook',
+                            notify=False,
+                            **payment
+                        ):
+                            Order.objects.filter(pk=order.pk).update(**payment)
+                            transaction.on_commit(lambda: invalidate_order_detail([order.order_number]))
+                        publish_order_paid(order)
                     
             except Order.DoesNotExist:
                 pass
@@ -161,14 +168,20 @@ class StripeWebhookView(APIView):
             
             try:
                 order = Order.objects.get(order_number=order_number)
-                order.payment_status = 'failed'
-                order.save()
-                
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status='pending',
-                    notes='Payment failed'
-                )
+                with transaction.atomic():
+                    order.payment_status = 'failed'
+                    order.save()
+                    
+                    OrderStatusHistory.objects.create(
+                        order=order,
+                        status='pending',
+                        notes='Payment failed'
+                    )
+                    publish_event(
+                        'order.payment_failed',
+                        {'order_id': order.id},
+                        dedupe_key=f"order.payment_failed:{payment_intent['id']}"
+                    )
                 
             except Order.DoesNotExist:
                 pass
@@ -0,0 +1,51 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+SOLD_OUT_TTL = 600  # seconds, bounds how long a missed re-arm can hide stock
+
+SOLD_OUT = 'sold_out'
+RATE_LIMITED = 'rate_limited'
+
+def _stock_key(product_id, variant_id=None):
+    # Stock lives on the variant when one is chosen, otherwise on the product
+    if variant_id:
+        return ('variant', variant_id)
+    return ('product', product_id)
+
+def _sold_out_key(kind, pk):
+    return f'admission:sold_out:{kind}:{pk}'
+
+def check_admission(lines):
+    """
+    Decide whether requests for the given ``(product_id, variant_id)`` lines
+    may proceed to the database. Returns None when admitted, otherwise
+    SOLD_OUT or RATE_LIMITED. Only cache round trips are made.
+    """
+    stock_keys = {_stock_key(product_id, variant_id) for product_id, variant_id in lines}
+    if cache.get_many([_sold_out_key(kind, pk) for kind, pk in stock_keys]):
+        return SOLD_OUT
+    
+    rate = settings.PRODUCT_ADMISSION_RATE
+    if rate:
+        # Fixed one-second window per SKU, a cheap approximation of a token bucket
+        window = int(time.time())
+        for kind, pk in stock_keys:
+            key = f'admission:rate:{kind}:{pk}:{window}'
+            cache.add(key, 0, 2)
+            if cache.incr(key) > rate:
+                return RATE_LIMITED
+    return None
+
+def mark_sold_out(product_ids=(), variant_ids=()):
+    keys = [_sold_out_key('product', pk) for pk in product_ids]
+    keys += [_sold_out_key('variant', pk) for pk in variant_ids]
+    if keys:
+        cache.set_many(dict.fromkeys(keys, True), SOLD_OUT_TTL)
+
+def rearm(product_ids=(), variant_ids=()):
+    """Let requests through again after stock has been replenished"""
+    keys = [_sold_out_key('product', pk) for pk in product_ids]
+    keys += [_sold_out_key('variant', pk) for pk in variant_ids]
+    if keys:
+        cache.delete_many(keys)
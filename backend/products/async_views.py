@@ -0,0 +1,196 @@
+"""
+Async versions of the product list, detail and availability endpoints, for
+ASGI deployments (PRODUCT_ASYNC_VIEWS=True). They reuse the DRF views'
+querysets and serializers, so responses match the sync endpoints, but run
+independent queries concurrently.
+
+Django's async ORM methods all run on the one thread-sensitive executor, so
+gathering them would still query one at a time. Each query here runs on a
+bounded pool of ASYNC_DB_THREADS threads instead, each with its own database
+connection.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.db import connection
+from django.db.models import prefetch_related_objects
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from backend.db_router import route_as_user
+from .attributes import attribute_facets, parse_attribute_filters
+from .cache import get_availability, MAX_AVAILABILITY_ITEMS
+from .models import Product
+from .views import ProductListView, ProductDetailView, parse_id_list
+
+# Detail fields that need queries of their own, rendered concurrently
+DETAIL_QUERY_FIELDS = ('category', 'images', 'variants', 'reviews', 'related_products')
+
+_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='async-db')
+
+def _call(func, *args):
+    try:
+        return func(*args)
+    finally:
+        # Pool threads keep their connection between calls, unless it broke
+        if connection.errors_occurred and not connection.is_usable():
+            connection.close()
+
+async def run_query(func, *args):
+    """Run blocking ORM work on the database pool"""
+    return await sync_to_async(_call, thread_sensitive=False, executor=_executor)(func, *args)
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+def _error(exc):
+    # The same body as DRF's exception handler
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return _json(data, status=exc.status_code)
+
+def _route_as_token_user(request):
+    """
+    These endpoints skip DRF authentication, so tell the router who a
+    bearer token belongs to; reads after the user's own writes must stay
+    on the primary. Invalid tokens are rejected like on the sync views.
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return
+    token = auth.get_validated_token(raw_token)
+    if api_settings.USER_ID_CLAIM in token:
+        route_as_user(token[api_settings.USER_ID_CLAIM])
+
+def _drf_view(view_class, request, **kwargs):
+    return view_class(request=Request(request), args=(), kwargs=kwargs, format_kwarg=None)
+
+def _render_field(field, instance):
+    attribute = field.get_attribute(instance)
+    return None if attribute is None else field.to_representation(attribute)
+
+def _render_fields(fields, names, instance):
+    return {name: _render_field(fields[name], instance) for name in names}
+
+def _page_offset(page_number, page_size):
+    try:
+        number = int(page_number)
+    except (TypeError, ValueError):
+        return None
+    return (number - 1) * page_size if number >= 1 else None
+
+@require_safe
+async def product_list(request):
+    try:
+        _route_as_token_user(request)
+        view = _drf_view(ProductListView, request)
+        # Filter validation may query, e.g. for ?category=
+        queryset = await run_query(lambda: view.filter_queryset(view.get_queryset()))
+        fields = set(view.serializer_class.selected_fields(view.request))
+        prefetches = view.get_prefetches(fields)
+        rows_queryset = queryset.prefetch_related(None)
+        want_facets = view.request.query_params.get('facets') == 'true'
+        attribute_filters = parse_attribute_filters(view.request.query_params)
+        
+        pagination = view.paginator
+        page_size = pagination.get_page_size(view.request) if pagination is not None else None
+        if page_size:
+            paginator = pagination.django_paginator_class(rows_queryset, page_size)
+            page_number = view.request.query_params.get(pagination.page_query_param) or 1
+            if page_number in pagination.last_page_strings:
+                paginator.count = await run_query(queryset.count)
+                page_number = paginator.num_pages
+            
+            # The count, the page and the facets do not depend on each other
+            offset = _page_offset(page_number, page_size)
+            count, rows, facets = await asyncio.gather(
+                run_query(rows_queryset.count),
+                run_query(lambda: list(rows_queryset[offset:offset + page_size]) if offset is not None else []),
+                run_query(attribute_facets, queryset, attribute_filters) if want_facets else asyncio.sleep(0),
+            )
+            paginator.count = count
+            try:
+                page = paginator.page(page_number)
+            except InvalidPage as exc:
+                raise NotFound(pagination.invalid_page_message.format(page_number=page_number, message=str(exc)))
+            page.object_list = rows
+            pagination.page, pagination.request = page, view.request
+        else:
+            rows, facets = await asyncio.gather(
+                run_query(lambda: list(rows_queryset)),
+                run_query(attribute_facets, queryset, attribute_filters) if want_facets else asyncio.sleep(0),
+            )
+        
+        for row in rows:
+            row._prefetched_objects_cache = {}
+        await asyncio.gather(*(run_query(prefetch_related_objects, rows, lookup) for lookup in prefetches))
+        results = await run_query(lambda: view.get_serializer(rows, many=True).data)
+    except APIException as exc:
+        return _error(exc)
+    
+    if page_size:
+        data = {
+            'count': count,
+            'next': pagination.get_next_link(),
+            'previous': pagination.get_previous_link(),
+            'results': results,
+        }
+    else:
+        data = results
+    if want_facets:
+        data['facets'] = facets
+    return _json(data)
+
+@require_safe
+async def product_detail(request, slug):
+    try:
+        _route_as_token_user(request)
+        view = _drf_view(ProductDetailView, request, slug=slug)
+        queryset = view.get_queryset().prefetch_related(None)
+        product = await run_query(lambda: queryset.filter(slug=slug).first())
+        if product is None:
+            raise NotFound(f'No {Product._meta.object_name} matches the given query.')
+        
+        serializer = view.get_serializer(product)
+        fields = serializer.fields
+        query_fields = [name for name in DETAIL_QUERY_FIELDS if name in fields]
+        other_fields = [name for name in fields if name not in query_fields]
+        rendered = await asyncio.gather(
+            run_query(lambda: Product.objects.filter(pk=product.pk).update(views=product.views + 1)),
+            run_query(_render_fields, fields, other_fields, product),
+            *(run_query(_render_field, fields[name], product) for name in query_fields)
+        )
+    except APIException as exc:
+        return _error(exc)
+    
+    values = dict(rendered[1], **dict(zip(query_fields, rendered[2:])))
+    return _json({name: values[name] for name in fields})
+
+@require_safe
+async def product_availability(request):
+    query_params = Request(request).query_params
+    product_ids = parse_id_list(query_params.get('ids'))
+    variant_ids = parse_id_list(query_params.get('variant_ids'))
+    
+    if product_ids is None or variant_ids is None:
+        return _json({'detail': 'ids and variant_ids must be comma-separated integers'}, status=400)
+    
+    if len(product_ids) + len(variant_ids) > MAX_AVAILABILITY_ITEMS:
+        return _json({'detail': f'At most {MAX_AVAILABILITY_ITEMS} items can be requested at once'}, status=400)
+    
+    try:
+        _route_as_token_user(request)
+    except APIException as exc:
+        return _error(exc)
+    products, variants = await asyncio.gather(
+        run_query(get_availability, product_ids, ()),
+        run_query(get_availability, (), variant_ids),
+    )
+    return _json({'products': products['products'], 'variants': variants['variants']})
@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models import Count
+from .models import ProductVariant, VariantAttribute
+
+ATTRIBUTE_PARAM_PREFIX = 'attr.'
+MAX_ATTRIBUTE_FILTERS = 10
+MAX_FACET_VALUES = 50  # per attribute
+REBUILD_BATCH_SIZE = 5000
+
+def normalize_attributes(attributes):
+    """
+    Map ``{'Color': 'Red'}`` to ``{'color': 'red'}``. Only scalar values are
+    indexed, and names and values that do not fit the columns are skipped.
+    """
+    if not isinstance(attributes, dict):
+        return {}
+    normalized = {}
+    for name, value in attributes.items():
+        if isinstance(value, (dict, list)) or value is None:
+            continue
+        name, value = str(name).strip().lower(), str(value).strip().lower()
+        if name and value and len(name) <= 50 and len(value) <= 100:
+            normalized[name] = value
+    return normalized
+
+def _attribute_rows(variant_id, product_id, attributes):
+    return [
+        VariantAttribute(variant_id=variant_id, product_id=product_id, name=name, value=value)
+        for name, value in normalize_attributes(attributes).items()
+    ]
+
+def sync_variant_attributes(variant):
+    VariantAttribute.objects.filter(variant_id=variant.pk).delete()
+    if variant.is_active:
+        VariantAttribute.objects.bulk_create(_attribute_rows(variant.pk, variant.product_id, variant.attributes))
+
+def rebuild_variant_attributes(batch_size=REBUILD_BATCH_SIZE):
+    """
+    Re-index every variant, for data loaded with bulk_create or update()
+    which skip the post_save signal. Each batch of variant ids is replaced in
+    its own transaction, so readers never see the index empty. Returns the
+    number of rows written.
+    """
+    variants = ProductVariant.objects.filter(is_active=True).order_by('id')
+    written = 0
+    last_id = 0
+    while True:
+        batch = list(variants.filter(id__gt=last_id).values_list('id', 'product_id', 'attributes')[:batch_size])
+        # Also clears rows of inactive or deleted variants in the id range
+        stale = VariantAttribute.objects.filter(variant_id__gt=last_id)
+        if batch:
+            stale = stale.filter(variant_id__lte=batch[-1][0])
+        rows = [row for variant in batch for row in _attribute_rows(*variant)]
+        with transaction.atomic():
+            stale.delete()
+            VariantAttribute.objects.bulk_create(rows, batch_size=batch_size)
+        if not batch:
+            return written
+        last_id = batch[-1][0]
+        written += len(rows)
+
+def parse_attribute_filters(query_params):
+    """
+    Collect ``attr.<name>=<value>[,<value>...]`` parameters into
+    ``{name: [values]}``. Returns None when there are too many.
+    """
+    filters = {}
+    for param in query_params:
+        if not param.startswith(ATTRIBUTE_PARAM_PREFIX):
+            continue
+        name = param[len(ATTRIBUTE_PARAM_PREFIX):].strip().lower()
+        values = [
+            value.strip().lower()
+            for value in ','.join(query_params.getlist(param)).split(',') if value.strip()
+        ]
+        if name and values:
+            filters[name] = values
+    if len(filters) > MAX_ATTRIBUTE_FILTERS:
+        return None
+    return filters
+
+def _matching_attributes(filters):
+    """Attribute rows, one per variant, of the variants matching every filter"""
+    matches = None
+    for name, values in sorted(filters.items()):
+        rows = VariantAttribute.objects.filter(name=name, value__in=values)
+        if matches is not None:
+            rows = rows.filter(variant_id__in=matches.values('variant_id'))
+        matches = rows
+    return matches
+
+def filter_by_attributes(queryset, filters):
+    """
+    Keep products with at least one active variant matching every attribute
+    filter, e.g. a variant that is both red and size L. Values of the same
+    attribute are alternatives.
+    """
+    if not filters:
+        return queryset
+    return queryset.filter(id__in=_matching_attributes(filters).values('product_id'))
+
+def attribute_facets(queryset, filters=None, max_values=MAX_FACET_VALUES):
+    """
+    Count the products in ``queryset`` having each attribute value, in one
+    GROUP BY over the attribute index: ``{'color': [{'value': 'red',
+    'count': 3}, ...]}`` with the most common values first. Only variants
+    matching the attribute ``filters`` count, so with ?attr.size=s a product
+    is counted under the colors its size S variants come in.
+    """
+    rows = VariantAttribute.objects.filter(product_id__in=queryset.order_by().values('id'))
+    if filters:
+        rows = rows.filter(variant_id__in=_matching_attributes(filters).values('variant_id'))
+    rows = rows.values('name', 'value').annotate(
+        count=Count('product_id', distinct=True)
+    ).order_by('name', '-count', 'value')
+    
+    facets = {}
+    for row in rows:
+        values = facets.setdefault(row['name'], [])
+        if len(values) < max_values:
+            values.append({'value': row['value'], 'count': row['count']})
+    return facets
@@ -0,0 +1,144 @@
+from django.core.cache import cache
+from backend.cache import TieredCache
+from backend.db_router import use_primary
+from .models import Product, ProductVariant, Category
+from .serializers import ProductListSerializer, CategorySerializer
+
+AVAILABILITY_TTL = 15  # seconds
+MAX_AVAILABILITY_ITEMS = 300
+
+PRODUCT_CARD_TTL = 300  # seconds
+PRODUCT_CARD_LOCAL_TTL = 10  # seconds
+PRODUCT_CARD_STALE_TTL = 60  # seconds
+MAX_BATCH_PRODUCTS = 200
+
+CATEGORY_TREE_TTL = 3600  # seconds
+CATEGORY_TREE_LOCAL_TTL = 60  # seconds
+CATEGORY_TREE_STALE_TTL = 600  # seconds
+
+# Product cards and the slug-to-id mapping
+product_cache = TieredCache('products', PRODUCT_CARD_TTL, PRODUCT_CARD_LOCAL_TTL, local_max_size=5000,
+                            stale_ttl=PRODUCT_CARD_STALE_TTL)
+category_cache = TieredCache('categories', CATEGORY_TREE_TTL, CATEGORY_TREE_LOCAL_TTL, local_max_size=16,
+                             stale_ttl=CATEGORY_TREE_STALE_TTL)
+
+def _availability_key(kind, pk):
+    return f'availability:{kind}:{pk}'
+
+def _fetch_availability(model, ids):
+    rows = model.objects.filter(id__in=ids, is_active=True).values_list('id', 'stock', 'price')
+    return {
+        pk: {'stock': stock, 'in_stock': stock > 0, 'price': str(price)}
+        for pk, stock, price in rows
+    }
+
+def _get_many(kind, model, ids):
+    if not ids:
+        return {}
+    
+    keys = {_availability_key(kind, pk): pk for pk in ids}
+    cached = cache.get_many(keys.keys())
+    result = {keys[key]: value for key, value in cached.items()}
+    
+    missing = [pk for pk in ids if pk not in result]
+    if missing:
+        with use_primary():
+            fetched = _fetch_availability(model, missing)
+        # Unknown or inactive ids are cached as None so polling them stays cheap
+        cache.set_many(
+            {_availability_key(kind, pk): fetched.get(pk) for pk in missing},
+            AVAILABILITY_TTL
+        )
+        result.update(fetched)
+    
+    return {pk: value for pk, value in result.items() if value is not None}
+
+def get_availability(product_ids=(), variant_ids=()):
+    """
+    Return stock, in-stock flag and price for the given products and variants,
+    served from a short-lived cache with a single primary key lookup per model
+    for the misses.
+    """
+    return {
+        'products': _get_many('product', Product, list(product_ids)),
+        'variants': _get_many('variant', ProductVariant, list(variant_ids)),
+    }
+
+def invalidate_availability(product_ids=(), variant_ids=()):
+    """Drop cached stock for the given products and variants, product cards included"""
+    keys = [_availability_key('product', pk) for pk in product_ids]
+    keys += [_availability_key('variant', pk) for pk in variant_ids]
+    if keys:
+        cache.delete_many(keys)
+    invalidate_product_cards(product_ids)
+
+def _product_card_key(pk):
+    return f'card:{pk}'
+
+def _product_slug_key(slug):
+    return f'slug:{slug}'
+
+def _load_slug_ids(keys):
+    slugs = {_product_slug_key(slug): slug for slug in keys}
+    rows = Product.objects.filter(slug__in=slugs.values(), is_active=True).values_list('slug', 'id')
+    return {_product_slug_key(slug): pk for slug, pk in rows}
+
+def get_product_cards(request, ids=(), slugs=()):
+    """
+    Return ProductListSerializer data for the given ids and then slugs, in
+    that order, skipping unknown or inactive products. Cards come from the
+    two-tier product cache. The misses are loaded with one query per
+    relation, by a single caller per card while concurrent callers wait for
+    it. Slugs are resolved through a cached slug-to-id mapping.
+    """
+    ids, slugs = list(dict.fromkeys(ids)), list(dict.fromkeys(slugs))
+    
+    def load_cards(keys):
+        wanted = {key: int(key.split(':', 1)[1]) for key in keys}
+        products = Product.objects.filter(
+            id__in=wanted.values(), is_active=True
+        ).select_related('category').prefetch_related('images').with_ratings()
+        cards = ProductListSerializer(products, many=True, context={'request': request, 'sparse': False}).data
+        # Unknown ids are cached as None so repeated lookups stay cheap
+        return {_product_card_key(card['id']): card for card in cards} | {
+            _product_slug_key(card['slug']): card['id'] for card in cards
+        }
+    
+    slug_keys = {_product_slug_key(slug): slug for slug in slugs}
+    slug_ids = {
+        slug_keys[key]: pk for key, pk in product_cache.get_or_compute_many(slug_keys, _load_slug_ids).items()
+        if pk is not None
+    }
+    
+    card_keys = {_product_card_key(pk): pk for pk in ids + list(slug_ids.values())}
+    cards = {card_keys[key]: card for key, card in product_cache.get_or_compute_many(card_keys, load_cards).items()}
+    
+    # A mapping whose card has another slug is stale, the product was renamed
+    renamed = [slug for slug in slug_ids if (cards.get(slug_ids[slug]) or {}).get('slug') != slug]
+    if renamed:
+        product_cache.delete_many([_product_slug_key(slug) for slug in renamed])
+        for slug in renamed:
+            del slug_ids[slug]
+        resolved = _load_slug_ids([_product_slug_key(slug) for slug in renamed])
+        slug_ids.update((slug_keys[key], pk) for key, pk in resolved.items())
+        card_keys = {_product_card_key(pk): pk for pk in resolved.values()}
+        cards.update(
+            (card_keys[key], card) for key, card in product_cache.get_or_compute_many(card_keys, load_cards).items()
+        )
+    
+    ordered = ids + [slug_ids[slug] for slug in slugs if slug in slug_ids]
+    return [cards[pk] for pk in dict.fromkeys(ordered) if cards.get(pk) is not None]
+
+def invalidate_product_cards(product_ids):
+    product_cache.delete_many([_product_card_key(pk) for pk in product_ids])
+
+def get_category_tree(request):
+    """Serialized active top-level categories with their children"""
+    def load_tree():
+        categories = Category.objects.filter(is_active=True, parent=None)
+        return CategorySerializer(categories, many=True, context={'request': request}).data
+    
+    return category_cache.get_or_compute('tree', load_tree)
+
+def invalidate_category_tree():
+    category_cache.clear()
@@ -0,0 +1,92 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import Address
+from cart.models import Cart, CartItem
+from cart.views import CartItemAddView
+from orders.views import OrderCreateView
+from products.admission import mark_sold_out, rearm
+from products.models import Product
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = (
+        'Fire a request burst for a sold-out product through the cart add and checkout views, '
+        'with the sold-out admission marker set and without it (every request reaches the database), '
+        'and compare query counts and latency. Fixtures are rolled back afterwards.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and mode')
+        parser.add_argument('--product-id', type=int,
+                            help='Product with stock 0 to use; defaults to the first one found')
+    
+    def handle(self, *args, **options):
+        products = Product.objects.filter(is_active=True, stock=0)
+        if options['product_id']:
+            products = products.filter(id=options['product_id'])
+        product = products.order_by('id').first()
+        if product is None:
+            raise CommandError('No active product with stock 0; pass --product-id of a sold-out product')
+        
+        factory = APIRequestFactory()
+        queries = []
+        
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+        
+        # Rate limiting would turn the database path away too
+        with override_settings(PRODUCT_ADMISSION_RATE=0), transaction.atomic():
+            user = User.objects.create_user(email='admission-benchmark@example.invalid', password=None)
+            address = Address.objects.create(
+                user=user, address_type='shipping', street_address='1 Benchmark St',
+                city='Benchmark', state='BM', postal_code='00000', country='USA'
+            )
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=product, quantity=1)
+            
+            endpoints = {
+                'cart add': (CartItemAddView.as_view(), '/api/cart/add/',
+                             {'product_id': product.id, 'quantity': 1}),
+                'checkout': (OrderCreateView.as_view(), '/api/orders/create/',
+                             {'shipping_address_id': address.id, 'billing_address_id': address.id,
+                              'email': user.email}),
+            }
+            
+            self.stdout.write(f'Product {product.id} ({product.sku}), {options["requests"]} requests each')
+            for name, (view, path, data) in endpoints.items():
+                for admission in (False, True):
+                    latencies = []
+                    queries.clear()
+                    for _ in range(options['requests']):
+                        # Sold-out responses of the database path set the marker themselves
+                        if admission:
+                            mark_sold_out(product_ids=[product.id])
+                        else:
+                            rearm(product_ids=[product.id])
+                        request = factory.post(path, data, format='json')
+                        force_authenticate(request, user=user)
+                        with connection.execute_wrapper(count_queries):
+                            start = time.perf_counter()
+                            response = view(request)
+                            latencies.append(time.perf_counter() - start)
+                        if response.status_code < 400:
+                            raise CommandError(f'{name} accepted a sold-out product: {response.status_code}')
+                    
+                    latencies.sort()
+                    mode = 'admission' if admission else 'database'
+                    self.stdout.write(
+                        f'  {name:<9} {mode:<10} '
+                        f'{len(queries) / len(latencies):>5.1f} queries/req   '
+                        f'p50 {latencies[len(latencies) // 2] * 1000:>7.3f} ms   '
+                        f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:>7.3f} ms'
+                    )
+            transaction.set_rollback(True)
+        
+        # The product is still sold out
+        mark_sold_out(product_ids=[product.id])
+        self.stdout.write(self.style.SUCCESS('Admission burst benchmark complete'))
@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from products.models import Product
+
+def _rss_mb(pids):
+    """Resident memory of the given processes, from /proc"""
+    total = 0
+    for pid in pids:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1])
+    return total / 1024
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec and tail latency of the product list, detail and availability '
+        'endpoints between a WSGI server (sync views) and an ASGI server (PRODUCT_ASYNC_VIEWS=True). '
+        'Size both servers to the same total worker memory; pass their pids to report it.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001')
+        parser.add_argument('--wsgi-pids', default='', help='Comma-separated worker pids, for memory')
+        parser.add_argument('--asgi-pids', default='', help='Comma-separated worker pids, for memory')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and server')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--warmup', type=int, default=100, help='Untimed requests per endpoint first')
+    
+    def handle(self, *args, **options):
+        products = list(Product.objects.filter(is_active=True).order_by('-id').values_list('id', 'slug')[:20])
+        if not products:
+            raise CommandError('No active products; run generate_sample_data first')
+        endpoints = {
+            'list': '/api/products/',
+            'detail': f'/api/products/{products[0][1]}/',
+            'availability': '/api/products/availability/?ids=' + ','.join(str(pk) for pk, slug in products),
+        }
+        
+        sessions = threading.local()
+        
+        def fetch(url):
+            # One keep-alive connection per client thread
+            if not hasattr(sessions, 'session'):
+                sessions.session = requests.Session()
+            start = time.perf_counter()
+            try:
+                ok = sessions.session.get(url, timeout=30).status_code < 400
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - start, ok
+        
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for server in ('wsgi', 'asgi'):
+                base_url = options[f'{server}_url'].rstrip('/')
+                self.stdout.write(f'{server.upper()} {base_url}')
+                for name, path in endpoints.items():
+                    url = base_url + path
+                    list(executor.map(fetch, [url] * options['warmup']))
+                    
+                    start = time.perf_counter()
+                    results = list(executor.map(fetch, [url] * options['requests']))
+                    elapsed = time.perf_counter() - start
+                    
+                    latencies = np.array([latency for latency, ok in results]) * 1000
+                    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+                    errors = sum(1 for latency, ok in results if not ok)
+                    self.stdout.write(
+                        f'  {name:<13} {len(results) / elapsed:>8,.0f} req/s   '
+                        f'p50 {p50:>7.1f} ms   p95 {p95:>7.1f} ms   p99 {p99:>7.1f} ms   errors {errors}'
+                    )
+                pids = [int(pid) for pid in options[f'{server}_pids'].split(',') if pid.strip()]
+                if pids:
+                    self.stdout.write(f'  memory        {_rss_mb(pids):,.0f} MB RSS over {len(pids)} processes')
+        
+        self.stdout.write(self.style.SUCCESS('Product read benchmark complete'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from products.attributes import rebuild_variant_attributes, REBUILD_BATCH_SIZE
+
+class Command(BaseCommand):
+    help = 'Rebuild the variant attribute index used by attr.* filters and facets'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+    
+    def handle(self, *args, **options):
+        written = rebuild_variant_attributes(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {written} variant attributes'))
\ No newline at end of file
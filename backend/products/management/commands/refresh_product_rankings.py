@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from products.rankings import refresh_product_rankings, RANKING_CHUNK_SIZE
+
+class Command(BaseCommand):
+    help = 'Decay and update the bestseller and trending product rankings'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=RANKING_CHUNK_SIZE,
+                            help='Order ids per chunk')
+    
+    def handle(self, *args, **options):
+        metrics = refresh_product_rankings(chunk_size=options['chunk_size'])
+        if metrics['skipped']:
+            self.stdout.write(self.style.WARNING('Another refresh is already running'))
+            return
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ranked {metrics['products']} products with {metrics['orders']} new orders "
+                f"({metrics['duration']}s)"
+            )
+        )
\ No newline at end of file
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from products.recommendations import refresh_related_products, RELATED_CHUNK_SIZE
+
+class Command(BaseCommand):
+    help = 'Count product co-occurrence in orders placed since the last run and rebuild related products'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=RELATED_CHUNK_SIZE,
+                            help='Order ids per chunk')
+        parser.add_argument('--full', action='store_true',
+                            help='Discard the co-occurrence counts and recount every order')
+    
+    def handle(self, *args, **options):
+        metrics = refresh_related_products(chunk_size=options['chunk_size'], full=options['full'])
+        if metrics['skipped']:
+            self.stdout.write(self.style.WARNING('Another refresh is already running'))
+            return
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Counted {metrics['pairs']} product pairs from {metrics['orders']} orders and "
+                f"re-ranked {metrics['products']} products ({metrics['duration']}s)"
+            )
+        )
\ No newline at end of file
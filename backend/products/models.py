@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Coalesce
 from accounts.models import User
 
 class Category(models.Model):
@@ -27,6 +28,19 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def with_ratings(self):
+        """
+        Annotate approved review averages and counts as correlated subqueries,
+        computed only for the rows returned, so average_rating and
+        review_count do not query per product.
+        """
+        approved = Review.objects.filter(product=models.OuterRef('pk'), is_approved=True).order_by().values('product')
+        return self.annotate(
+            rating_avg=models.Subquery(approved.annotate(value=models.Avg('rating')).values('value')),
+            rating_count=Coalesce(models.Subquery(approved.annotate(value=models.Count('id')).values('value')), 0)
+        )
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
@@ -54,6 +68,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         db_table = 'products'
         ordering = ['-created_at']
@@ -73,6 +89,8 @@ class Product(models.Model):
     
     @property
     def average_rating(self):
+        if hasattr(self, 'rating_avg'):
+            return round(self.rating_avg, 1) if self.rating_avg is not None else 0
         reviews = self.reviews.filter(is_approved=True)
         if reviews.exists():
             return round(reviews.aggregate(models.Avg('rating'))['rating__avg'], 1)
@@ -80,6 +98,8 @@ class Product(models.Model):
     
     @property
     def review_count(self):
+        if hasattr(self, 'rating_count'):
+            return self.rating_count
         return self.reviews.filter(is_approved=True).count()
     
     @property
@@ -127,6 +147,28 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.name}"
 
+class VariantAttribute(models.Model):
+    """
+    One row per attribute of an active variant, normalized from
+    ProductVariant.attributes so filters and facets use an index instead of
+    scanning JSON. Maintained by the variant post_save signal.
+    """
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='attribute_values')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    name = models.CharField(max_length=50)
+    value = models.CharField(max_length=100)
+    
+    class Meta:
+        db_table = 'variant_attributes'
+        unique_together = ['variant', 'name']
+        indexes = [
+            models.Index(fields=['name', 'value', 'variant', 'product']),
+            models.Index(fields=['product', 'name', 'value']),
+        ]
+    
+    def __str__(self):
+        return f"{self.variant_id}: {self.name}={self.value}"
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
@@ -162,4 +204,84 @@ class Wishlist(models.Model):
         unique_together = ['user', 'product']
     
     def __str__(self):
-        return f"{self.user.email} - {self.product.name}"
\ No newline at end of file
+        return f"{self.user.email} - {self.product.name}"
+
+class ProductPairCount(models.Model):
+    """
+    Sparse product co-occurrence matrix: the number of orders containing
+    both products. Stored in both directions; the diagonal
+    (product == related) holds the number of orders containing the product.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'product_pair_counts'
+        unique_together = ['product', 'related']
+    
+    def __str__(self):
+        return f"{self.product_id} + {self.related_id}: {self.count}"
+
+class RelatedProduct(models.Model):
+    """Top co-purchased products per product, rebuilt by refresh_related_products"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        db_table = 'related_products'
+        unique_together = ['product', 'related']
+        ordering = ['product', 'rank']
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+class RelatedProductsRun(models.Model):
+    """Checkpoint of the co-occurrence job: orders up to last_order_id are counted"""
+    last_order_id = models.BigIntegerField()
+    orders = models.PositiveIntegerField(default=0)
+    pairs = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'related_products_runs'
+        ordering = ['-id']
+    
+    def __str__(self):
+        return f"Run {self.id} up to order {self.last_order_id}"
+
+class ProductScore(models.Model):
+    """
+    Exponentially time-decayed popularity of a product, refreshed by
+    refresh_product_rankings. Ranks are global (1 = best).
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='score')
+    bestseller = models.FloatField(default=0)
+    trending = models.FloatField(default=0)
+    bestseller_rank = models.PositiveIntegerField(default=0)
+    trending_rank = models.PositiveIntegerField(default=0)
+    counted_views = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'product_scores'
+        indexes = [
+            models.Index(fields=['bestseller_rank']),
+            models.Index(fields=['trending_rank']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id}: #{self.bestseller_rank} bestseller, #{self.trending_rank} trending"
+
+class ProductRankingRun(models.Model):
+    """Checkpoint of the ranking job: order items up to last_order_id are scored"""
+    last_order_id = models.BigIntegerField()
+    refreshed_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'product_ranking_runs'
+        ordering = ['-id']
+    
+    def __str__(self):
+        return f"Run {self.id} up to order {self.last_order_id}"
\ No newline at end of file
@@ -0,0 +1,155 @@
+import time
+from datetime import timedelta
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from backend.cache import cache_lock
+from orders.models import Order, OrderItem
+from .models import Product, ProductScore, ProductRankingRun
+
+BESTSELLER_HALF_LIFE = timedelta(days=30)
+TRENDING_HALF_LIFE = timedelta(days=3)
+# A product page view counts as this fraction of a unit sold towards trending
+VIEW_WEIGHT = 0.05
+RANKING_CHUNK_SIZE = 20000  # order ids per chunk
+RANKING_BATCH_SIZE = 2000
+# Orders younger than this may still be committing with lower ids
+RANKING_SETTLE_TIME = timedelta(minutes=5)
+
+RANKING_LOCK_KEY = 'lock:refresh-product-rankings'
+RANKING_LOCK_TIMEOUT = 600  # seconds without a finished chunk before another run may take over
+
+# ProductListView ordering names and the rank column behind them
+RANKING_ORDERINGS = {
+    'bestselling': 'score__bestseller_rank',
+    'trending': 'score__trending_rank',
+}
+UNRANKED = 2 ** 31 - 1  # products created since the last refresh sort last
+
+def decay(ages, half_life):
+    """Weight of events ``ages`` seconds old"""
+    return np.exp2(-np.asarray(ages, dtype=np.float64) / half_life.total_seconds())
+
+def _sum_by_product(product_ids, values, index):
+    """Sum values per product into an array aligned with the sorted ``index``"""
+    positions = np.searchsorted(index, product_ids)
+    known = positions < len(index)
+    known[known] = index[positions[known]] == product_ids[known]
+    return np.bincount(positions[known], weights=values[known], minlength=len(index))
+
+def _ranks(scores, product_ids):
+    """1 for the highest score; ties go to the older product"""
+    order = np.lexsort((product_ids, -scores))
+    ranks = np.empty(len(scores), dtype=np.int64)
+    ranks[order] = np.arange(1, len(scores) + 1)
+    return ranks
+
+def annotate_rankings(queryset, ordering):
+    """Annotate the rank columns named in an ``ordering`` query parameter"""
+    names = {term.strip().lstrip('-') for term in ordering.split(',')}
+    return queryset.annotate(**{
+        name: Coalesce(column, Value(UNRANKED))
+        for name, column in RANKING_ORDERINGS.items() if name in names
+    })
+
+def refresh_product_rankings(chunk_size=RANKING_CHUNK_SIZE):
+    """
+    Decay every product's scores by the time since the last run, then add
+    units sold in orders placed since then and, for trending, page views
+    since then. Both scores are in decayed units, so a sale counts fully today
+    and half as much one half-life later. Cancellations are not subtracted;
+    they decay away like any other sale. Only one run can be active at a
+    time. Returns metrics for the run.
+    """
+    with cache_lock(RANKING_LOCK_KEY, RANKING_LOCK_TIMEOUT) as lock:
+        if not lock.acquired:
+            return {'skipped': True, 'orders': 0, 'products': 0, 'duration': 0}
+        
+        started = time.monotonic()
+        now = timezone.now()
+        last_run = ProductRankingRun.objects.first()
+        last_order_id = last_run.last_order_id if last_run else 0
+        elapsed = (now - last_run.refreshed_at).total_seconds() if last_run else 0
+        
+        rows = list(Product.objects.order_by('id').values_list('id', 'views'))
+        product_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        views = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        previous = {
+            product_id: (bestseller, trending, counted_views)
+            for product_id, bestseller, trending, counted_views in ProductScore.objects.values_list(
+                'product_id', 'bestseller', 'trending', 'counted_views'
+            )
+        }
+        bestseller, trending, counted_views = (
+            np.array([previous.get(product_id, (0, 0, 0))[column] for product_id in product_ids.tolist()],
+                     dtype=np.float64)
+            for column in range(3)
+        )
+        bestseller *= decay(elapsed, BESTSELLER_HALF_LIFE)
+        trending *= decay(elapsed, TRENDING_HALF_LIFE)
+        
+        upper = Order.objects.filter(
+            created_at__lt=now - RANKING_SETTLE_TIME
+        ).aggregate(last=Max('id'))['last'] or 0
+        orders = 0
+        while last_order_id < upper:
+            chunk_end = min(last_order_id + chunk_size, upper)
+            items = list(
+                OrderItem.objects.filter(
+                    order_id__gt=last_order_id, order_id__lte=chunk_end, product__isnull=False
+                ).exclude(order__status='cancelled')
+                .values_list('order_id', 'product_id', 'quantity', 'order__created_at').order_by()
+            )
+            if items:
+                order_ids, item_products, quantities, created_at = zip(*items)
+                orders += len(set(order_ids))
+                item_products = np.array(item_products, dtype=np.int64)
+                quantities = np.array(quantities, dtype=np.float64)
+                ages = now.timestamp() - np.fromiter(
+                    (value.timestamp() for value in created_at), dtype=np.float64, count=len(items)
+                )
+                bestseller += _sum_by_product(
+                    item_products, quantities * decay(ages, BESTSELLER_HALF_LIFE), product_ids
+                )
+                trending += _sum_by_product(
+                    item_products, quantities * decay(ages, TRENDING_HALF_LIFE), product_ids
+                )
+            last_order_id = chunk_end
+            lock.refresh()
+        
+        # The view counter is cumulative; only views since the last run count
+        trending += np.maximum(views - counted_views, 0) * VIEW_WEIGHT
+        bestseller_rank = _ranks(bestseller, product_ids)
+        trending_rank = _ranks(trending, product_ids)
+        
+        with transaction.atomic():
+            ProductScore.objects.bulk_create(
+                [
+                    ProductScore(
+                        product_id=product_id,
+                        bestseller=round(best, 6),
+                        trending=round(trend, 6),
+                        bestseller_rank=best_rank,
+                        trending_rank=trend_rank,
+                        counted_views=product_views
+                    )
+                    for (product_id, product_views), best, trend, best_rank, trend_rank in zip(
+                        rows, bestseller.tolist(), trending.tolist(),
+                        bestseller_rank.tolist(), trending_rank.tolist()
+                    )
+                ],
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=['bestseller', 'trending', 'bestseller_rank', 'trending_rank', 'counted_views'],
+                batch_size=RANKING_BATCH_SIZE
+            )
+            ProductRankingRun.objects.create(last_order_id=last_order_id, refreshed_at=now)
+    
+    return {
+        'skipped': False,
+        'orders': orders,
+        'products': len(rows),
+        'duration': round(time.monotonic() - started, 2),
+    }
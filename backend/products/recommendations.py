@@ -0,0 +1,185 @@
+import time
+from datetime import timedelta
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from backend.cache import cache_lock
+from orders.models import Order, OrderItem
+from .models import ProductPairCount, RelatedProduct, RelatedProductsRun
+
+RELATED_TOP_K = 10
+RELATED_CHUNK_SIZE = 20000  # order ids per chunk
+RANK_BATCH_SIZE = 1000  # products re-ranked per transaction
+# Orders with more distinct products add k^2 pairs but little signal
+RELATED_MAX_ORDER_PRODUCTS = 50
+# Orders younger than this may still be committing with lower ids
+RELATED_SETTLE_TIME = timedelta(minutes=5)
+
+RELATED_LOCK_KEY = 'lock:refresh-related-products'
+RELATED_LOCK_TIMEOUT = 600  # seconds a chunk may take before the lock lapses
+
+def _runs(values):
+    """Start index and length of each run of equal values in a sorted array"""
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return starts, np.diff(np.append(starts, len(values)))
+
+def order_pairs(order_ids, product_ids):
+    """
+    Expand order lines into every (product, related) pair bought together,
+    diagonal included. Takes parallel arrays of distinct (order, product)
+    lines sorted by order and returns two arrays of product ids.
+    """
+    if not len(order_ids):
+        return product_ids, product_ids
+    starts, sizes = _runs(order_ids)
+    keep = np.repeat(sizes <= RELATED_MAX_ORDER_PRODUCTS, sizes)
+    order_ids, product_ids = order_ids[keep], product_ids[keep]
+    if not len(order_ids):
+        return product_ids, product_ids
+    starts, sizes = _runs(order_ids)
+    
+    # Line i pairs with every line of its order, including itself
+    pairs_per_line = np.repeat(sizes, sizes)
+    order_start = np.repeat(starts, sizes)
+    left = np.repeat(np.arange(len(product_ids)), pairs_per_line)
+    block_start = np.repeat(np.cumsum(pairs_per_line) - pairs_per_line, pairs_per_line)
+    right = np.repeat(order_start, pairs_per_line) + np.arange(len(left)) - block_start
+    return product_ids[left], product_ids[right]
+
+def count_pairs(products, related):
+    """Collapse pair arrays into distinct pairs and their counts"""
+    if not len(products):
+        return products, related, products
+    span = int(max(products.max(), related.max())) + 1
+    keys = np.sort(products * span + related)
+    starts, counts = _runs(keys)
+    products, related = np.divmod(keys[starts], span)
+    return products, related, counts
+
+def _add_counts(products, related, counts):
+    """
+    Add counts to the matrix in one upsert per batch. The addition happens in
+    the database, so a concurrent writer cannot make an increment go missing.
+    """
+    table = connection.ops.quote_name(ProductPairCount._meta.db_table)
+    rows = list(zip(products.tolist(), related.tolist(), counts.tolist()))
+    batch_size = connection.ops.bulk_batch_size(['product_id', 'related_id', 'count'], rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} (product_id, related_id, count) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT (product_id, related_id) DO UPDATE SET count = {table}.count + EXCLUDED.count',
+                [value for row in batch for value in row]
+            )
+
+def rank_related_products(product_ids, top_k=RELATED_TOP_K):
+    """
+    Rebuild the top-K related products for the given products. Pairs are
+    scored by cosine similarity, ``count(a, b) / sqrt(orders(a) * orders(b))``,
+    so products that are simply popular do not crowd out the rest.
+    """
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), RANK_BATCH_SIZE):
+        batch = product_ids[start:start + RANK_BATCH_SIZE]
+        rows = np.array(
+            list(ProductPairCount.objects.filter(product_id__in=batch).values_list('product_id', 'related_id', 'count')),
+            dtype=np.int64
+        ).reshape(-1, 3)
+        products, related, counts = rows[:, 0], rows[:, 1], rows[:, 2]
+        
+        off_diagonal = products != related
+        related_ids = np.unique(related[off_diagonal])
+        totals = dict(
+            ProductPairCount.objects.filter(
+                product_id__in=related_ids.tolist(), related_id=F('product_id')
+            ).values_list('product_id', 'count')
+        )
+        totals.update(zip(products[~off_diagonal].tolist(), counts[~off_diagonal].tolist()))
+        
+        products, related, counts = products[off_diagonal], related[off_diagonal], counts[off_diagonal]
+        total_ids = np.array(sorted(totals), dtype=np.int64)
+        total_counts = np.array([totals[pk] for pk in total_ids.tolist()], dtype=np.float64)
+        scores = counts / np.sqrt(
+            total_counts[np.searchsorted(total_ids, products)] * total_counts[np.searchsorted(total_ids, related)]
+        )
+        
+        # Best scores first within each product, ties broken by count then id
+        order = np.lexsort((related, -counts, -scores, products))
+        products, related, scores = products[order], related[order], scores[order]
+        ranks = np.arange(len(products))
+        if len(products):
+            starts, sizes = _runs(products)
+            ranks -= np.repeat(starts, sizes)
+        keep = ranks < top_k
+        
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=batch).delete()
+            RelatedProduct.objects.bulk_create([
+                RelatedProduct(product_id=product_id, related_id=related_id, rank=rank + 1, score=round(score, 6))
+                for product_id, related_id, rank, score in zip(
+                    products[keep].tolist(), related[keep].tolist(), ranks[keep].tolist(), scores[keep].tolist()
+                )
+            ], batch_size=2000)
+
+def refresh_related_products(chunk_size=RELATED_CHUNK_SIZE, full=False):
+    """
+    Fold orders placed since the last run into the co-occurrence matrix and
+    re-rank the products they touched. Each chunk of orders is counted and
+    checkpointed in one transaction, so an interrupted run resumes where it
+    stopped. ``full`` discards the matrix and recounts every order.
+    Only one run can be active at a time. Returns metrics for the run.
+    """
+    with cache_lock(RELATED_LOCK_KEY, RELATED_LOCK_TIMEOUT) as lock:
+        if not lock.acquired:
+            return {'skipped': True, 'orders': 0, 'pairs': 0, 'products': 0, 'duration': 0}
+        
+        started = time.monotonic()
+        if full:
+            with transaction.atomic():
+                ProductPairCount.objects.all().delete()
+                RelatedProductsRun.objects.all().delete()
+        
+        last_run = RelatedProductsRun.objects.first()
+        last_order_id = last_run.last_order_id if last_run else 0
+        run = RelatedProductsRun.objects.create(last_order_id=last_order_id)
+        upper = Order.objects.filter(
+            created_at__lt=timezone.now() - RELATED_SETTLE_TIME
+        ).aggregate(last=Max('id'))['last'] or 0
+        
+        touched = set()
+        while last_order_id < upper:
+            chunk_end = min(last_order_id + chunk_size, upper)
+            lines = np.array(
+                list(
+                    OrderItem.objects.filter(
+                        order_id__gt=last_order_id, order_id__lte=chunk_end, product__isnull=False
+                    ).exclude(order__status='cancelled')
+                    .values_list('order_id', 'product_id').distinct().order_by('order_id', 'product_id')
+                ),
+                dtype=np.int64
+            ).reshape(-1, 2)
+            
+            products, related, counts = count_pairs(*order_pairs(lines[:, 0], lines[:, 1]))
+            with transaction.atomic():
+                _add_counts(products, related, counts)
+                run.last_order_id = chunk_end
+                run.orders += len(np.unique(lines[:, 0]))
+                run.pairs += len(products)
+                run.save(update_fields=['last_order_id', 'orders', 'pairs'])
+            
+            touched.update(products.tolist())
+            last_order_id = chunk_end
+            lock.refresh()
+        
+        rank_related_products(touched)
+    
+    return {
+        'skipped': False,
+        'orders': run.orders,
+        'pairs': run.pairs,
+        'products': len(touched),
+        'duration': round(time.monotonic() - started, 2),
+    }
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Category, Product, ProductImage, ProductVariant, Review, Wishlist
+from backend.serializers import SparseFieldsMixin
+from .models import Category, Product, ProductImage, ProductVariant, Review, Wishlist, RelatedProduct
 
 class CategorySerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
@@ -32,31 +33,48 @@ class ReviewSerializer(serializers.ModelSerializer):
                   'is_verified_purchase', 'helpful_count', 'created_at']
         read_only_fields = ['user', 'is_verified_purchase', 'helpful_count', 'created_at']
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     primary_image = serializers.SerializerMethodField()
     average_rating = serializers.ReadOnlyField()
     review_count = serializers.ReadOnlyField()
+    images = ProductImageSerializer(many=True, read_only=True)
+    variants = ProductVariantSerializer(many=True, read_only=True)
     
     class Meta:
         model = Product
         fields = ['id', 'name', 'slug', 'short_description', 'price', 'compare_price',
                   'sku', 'stock', 'category_name', 'primary_image', 'is_featured',
-                  'average_rating', 'review_count', 'in_stock']
+                  'average_rating', 'review_count', 'in_stock', 'images', 'variants']
+        expandable_fields = ['images', 'variants']
+        field_dependencies = {'in_stock': ['stock']}
     
     def get_primary_image(self, obj):
-        image = obj.images.filter(is_primary=True).first() or obj.images.first()
+        # Picked from the prefetched images instead of two queries per product
+        images = obj.images.all()
+        image = next((image for image in images if image.is_primary), None) or next(iter(images), None)
         if image:
             request = self.context.get('request')
             if request:
                 return request.build_absolute_uri(image.image.url)
         return None
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class RelatedProductSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='related.id', read_only=True)
+    name = serializers.CharField(source='related.name', read_only=True)
+    slug = serializers.CharField(source='related.slug', read_only=True)
+    price = serializers.DecimalField(source='related.price', max_digits=10, decimal_places=2, read_only=True)
+    
+    class Meta:
+        model = RelatedProduct
+        fields = ['id', 'name', 'slug', 'price', 'score']
+
+class ProductDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     variants = ProductVariantSerializer(many=True, read_only=True)
     reviews = serializers.SerializerMethodField()
+    related_products = serializers.SerializerMethodField()
     average_rating = serializers.ReadOnlyField()
     review_count = serializers.ReadOnlyField()
     
@@ -66,11 +84,20 @@ class ProductDetailSerializer(serializers.ModelSerializer):
                   'category', 'price', 'compare_price', 'sku', 'stock', 
                   'weight', 'dimensions', 'is_featured', 'images', 'variants',
                   'average_rating', 'review_count', 'reviews', 'in_stock', 
-                  'is_low_stock', 'created_at']
+                  'is_low_stock', 'related_products', 'created_at']
+        field_dependencies = {
+            'in_stock': ['stock'],
+            'is_low_stock': ['stock', 'low_stock_threshold'],
+        }
     
     def get_reviews(self, obj):
         reviews = obj.reviews.filter(is_approved=True).order_by('-created_at')[:5]
         return ReviewSerializer(reviews, many=True).data
+    
+    def get_related_products(self, obj):
+        # Precomputed by refresh_related_products; one indexed lookup
+        related = obj.related_products.filter(related__is_active=True).select_related('related')
+        return RelatedProductSerializer(related, many=True).data
 
 class WishlistSerializer(serializers.ModelSerializer):
     product = ProductListSerializer(read_only=True)
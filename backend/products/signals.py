@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Category, Product, ProductVariant, ProductImage, Review
+from .admission import mark_sold_out, rearm
+from .cache import invalidate_availability, invalidate_product_cards, invalidate_category_tree
+from .attributes import sync_variant_attributes
+
+def _sync_stock(kind, pk, stock):
+    ids = {'product_ids': [pk]} if kind == 'product' else {'variant_ids': [pk]}
+    invalidate_availability(**ids)
+    if stock > 0:
+        rearm(**ids)
+    else:
+        mark_sold_out(**ids)
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: _sync_stock('product', instance.pk, instance.stock))
+
+@receiver(post_save, sender=ProductVariant)
+def variant_saved(sender, instance, **kwargs):
+    sync_variant_attributes(instance)
+    transaction.on_commit(lambda: _sync_stock('variant', instance.pk, instance.stock))
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Review)
+def product_card_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_product_cards([instance.product_id]))
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
\ No newline at end of file
@@ -0,0 +1,12 @@
+from celery import shared_task
+from . import rankings, recommendations
+
+@shared_task
+def refresh_related_products():
+    """Hourly incremental refresh of the frequently-bought-together lists"""
+    return recommendations.refresh_related_products()
+
+@shared_task
+def refresh_product_rankings():
+    """Decay and update the bestseller and trending scores"""
+    return rankings.refresh_product_rankings()
\ No newline at end of file
@@ -1,13 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
-    CategoryListView, ProductListView, ProductDetailView,
+    CategoryListView, ProductListView, ProductDetailView, ProductRelatedView, ProductBatchView,
+    ProductAvailabilityView,
     ProductReviewListCreateView, WishlistView, WishlistRemoveView
 )
 
+product_list = ProductListView.as_view()
+product_detail = ProductDetailView.as_view()
+product_availability = ProductAvailabilityView.as_view()
+if settings.PRODUCT_ASYNC_VIEWS:
+    from . import async_views
+    product_list = async_views.product_list
+    product_detail = async_views.product_detail
+    product_availability = async_views.product_availability
+
 urlpatterns = [
     path('categories/', CategoryListView.as_view(), name='category-list'),
-    path('', ProductListView.as_view(), name='product-list'),
-    path('<slug:slug>/', ProductDetailView.as_view(), name='product-detail'),
+    path('', product_list, name='product-list'),
+    path('availability/', product_availability, name='product-availability'),
+    path('batch/', ProductBatchView.as_view(), name='product-batch'),
+    path('<slug:slug>/', product_detail, name='product-detail'),
+    path('<slug:slug>/related/', ProductRelatedView.as_view(), name='product-related'),
     path('<int:product_id>/reviews/', ProductReviewListCreateView.as_view(), name='product-reviews'),
     path('wishlist/', WishlistView.as_view(), name='wishlist'),
     path('wishlist/<int:product_id>/', WishlistRemoveView.as_view(), name='wishlist-remove'),
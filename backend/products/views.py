@@ -1,18 +1,32 @@
 from rest_framework import generics, filters, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Q, Count, Avg
+from rest_framework.views import APIView
+from rest_framework.exceptions import ParseError
+from django.db.models import Q, Count, Avg, Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Category, Product, Review, Wishlist
+from django.http import Http404
+from .models import Category, Product, ProductVariant, Review, Wishlist, RelatedProduct
 from .serializers import (
     CategorySerializer, ProductListSerializer, ProductDetailSerializer,
-    ReviewSerializer, WishlistSerializer
+    RelatedProductSerializer, ReviewSerializer, WishlistSerializer
 )
+from .cache import get_availability, get_product_cards, get_category_tree, MAX_AVAILABILITY_ITEMS, MAX_BATCH_PRODUCTS
+from .rankings import annotate_rankings
+from .attributes import parse_attribute_filters, filter_by_attributes, attribute_facets, MAX_ATTRIBUTE_FILTERS
 
 class CategoryListView(generics.ListAPIView):
     queryset = Category.objects.filter(is_active=True, parent=None)
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
+    
+    def list(self, request, *args, **kwargs):
+        # The whole tree is cached; pages are cut from it
+        tree = get_category_tree(request)
+        page = self.paginate_queryset(tree)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(tree)
 
 class ProductListView(generics.ListAPIView):
     serializer_class = ProductListSerializer
@@ -20,11 +34,23 @@ class ProductListView(generics.ListAPIView):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'is_featured']
     search_fields = ['name', 'description', 'sku']
-    ordering_fields = ['price', 'created_at', 'name']
+    # bestselling and trending are precomputed ranks, 1 first
+    ordering_fields = ['price', 'created_at', 'name', 'bestselling', 'trending']
     ordering = ['-created_at']
     
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True).select_related('category').prefetch_related('images')
+        # Only load what the requested fields (?fields=, ?expand=) need
+        fields = set(self.serializer_class.selected_fields(self.request))
+        queryset = Product.objects.filter(is_active=True).only(*self.serializer_class.model_fields(fields))
+        if 'category_name' in fields:
+            queryset = queryset.select_related('category')
+        queryset = queryset.prefetch_related(*self.get_prefetches(fields))
+        if fields & {'average_rating', 'review_count'}:
+            queryset = queryset.with_ratings()
+        
+        ordering = self.request.query_params.get('ordering')
+        if ordering:
+            queryset = annotate_rankings(queryset, ordering)
         
         # Price filtering
         min_price = self.request.query_params.get('min_price')
@@ -40,14 +66,49 @@ class ProductListView(generics.ListAPIView):
         if in_stock == 'true':
             queryset = queryset.filter(stock__gt=0)
         
+        # Variant attributes, e.g. ?attr.color=red,blue&attr.size=l
+        attribute_filters = parse_attribute_filters(self.request.query_params)
+        if attribute_filters is None:
+            raise ParseError(f'At most {MAX_ATTRIBUTE_FILTERS} attribute filters are allowed')
+        queryset = filter_by_attributes(queryset, attribute_filters)
+        
         return queryset
+    
+    def get_prefetches(self, fields):
+        prefetches = []
+        if fields & {'primary_image', 'images'}:
+            prefetches.append('images')
+        if 'variants' in fields:
+            prefetches.append(Prefetch('variants', queryset=ProductVariant.objects.filter(is_active=True)))
+        return prefetches
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') == 'true':
+            response.data['facets'] = attribute_facets(
+                self.filter_queryset(self.get_queryset()), parse_attribute_filters(request.query_params)
+            )
+        return response
 
 class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductDetailSerializer
     permission_classes = [permissions.AllowAny]
     lookup_field = 'slug'
     
+    def get_queryset(self):
+        fields = set(self.serializer_class.selected_fields(self.request))
+        queryset = Product.objects.filter(is_active=True).only(
+            'views', *self.serializer_class.model_fields(fields)
+        )
+        if 'category' in fields:
+            queryset = queryset.select_related('category')
+        prefetch = [name for name in ('images', 'variants') if name in fields]
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if fields & {'average_rating', 'review_count'}:
+            queryset = queryset.with_ratings()
+        return queryset
+    
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         # Increment views
@@ -55,6 +116,79 @@ class ProductDetailView(generics.RetrieveAPIView):
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+class ProductRelatedView(generics.ListAPIView):
+    """Products frequently bought together with this one, best match first"""
+    serializer_class = RelatedProductSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = None
+    
+    def list(self, request, *args, **kwargs):
+        related = list(
+            RelatedProduct.objects.filter(
+                product__slug=kwargs['slug'], product__is_active=True, related__is_active=True
+            ).select_related('related')
+        )
+        if not related and not Product.objects.filter(slug=kwargs['slug'], is_active=True).exists():
+            raise Http404
+        return Response(self.get_serializer(related, many=True).data)
+
+def parse_id_list(value):
+    """Parse ``1,2,3`` into distinct ints, or None if any is not an int"""
+    try:
+        return list(dict.fromkeys(int(pk) for pk in (value or '').split(',') if pk.strip()))
+    except ValueError:
+        return None
+
+class ProductBatchView(APIView):
+    """Many products at once, by ``?ids=`` and/or ``?slugs=``, in request order"""
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request):
+        product_ids = parse_id_list(request.query_params.get('ids'))
+        slugs = list(dict.fromkeys(
+            slug.strip() for slug in request.query_params.get('slugs', '').split(',') if slug.strip()
+        ))
+        
+        if product_ids is None:
+            return Response(
+                {'detail': 'ids must be comma-separated integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(product_ids) + len(slugs) > MAX_BATCH_PRODUCTS:
+            return Response(
+                {'detail': f'At most {MAX_BATCH_PRODUCTS} products can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Cards are cached in full; ?fields= only trims the response
+        fields = set(ProductListSerializer.selected_fields(request))
+        cards = get_product_cards(request, product_ids, slugs)
+        return Response({
+            'results': [{name: value for name, value in card.items() if name in fields} for card in cards]
+        })
+
+class ProductAvailabilityView(APIView):
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request):
+        product_ids = parse_id_list(request.query_params.get('ids'))
+        variant_ids = parse_id_list(request.query_params.get('variant_ids'))
+        
+        if product_ids is None or variant_ids is None:
+            return Response(
+                {'detail': 'ids and variant_ids must be comma-separated integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(product_ids) + len(variant_ids) > MAX_AVAILABILITY_ITEMS:
+            return Response(
+                {'detail': f'At most {MAX_AVAILABILITY_ITEMS} items can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(get_availability(product_ids, variant_ids))
+
 class ProductReviewListCreateView(generics.ListCreateAPIView):
     serializer_class = ReviewSerializer
     
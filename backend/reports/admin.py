@@ -0,0 +1,29 @@
+from django.contrib import admin
+from .models import DailySales, DailyProductSales, DailyCategorySales, CustomerSegment, CustomerCohort
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ['date', 'orders', 'units', 'gross', 'discounts', 'tax']
+    date_hierarchy = 'date'
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(admin.ModelAdmin):
+    list_display = ['date', 'product', 'orders', 'units', 'gross']
+    list_filter = ['date']
+
+@admin.register(DailyCategorySales)
+class DailyCategorySalesAdmin(admin.ModelAdmin):
+    list_display = ['date', 'category', 'orders', 'units', 'gross']
+    list_filter = ['date']
+
+@admin.register(CustomerSegment)
+class CustomerSegmentAdmin(admin.ModelAdmin):
+    list_display = ['user', 'segment', 'r_score', 'f_score', 'm_score', 'frequency', 'monetary', 'clv']
+    list_filter = ['segment', 'r_score', 'f_score']
+    search_fields = ['user__email']
+    raw_id_fields = ['user']
+
+@admin.register(CustomerCohort)
+class CustomerCohortAdmin(admin.ModelAdmin):
+    list_display = ['cohort', 'months_since', 'customers']
+    list_filter = ['cohort']
\ No newline at end of file
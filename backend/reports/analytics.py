@@ -0,0 +1,238 @@
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from orders.models import Order
+from .models import CustomerSegment, CustomerCohort
+from .rollups import REVERSED_STATUSES
+
+ANALYTICS_CHUNK_SIZE = 50000
+SEGMENT_BATCH_SIZE = 5000
+RFM_BINS = 5
+CLV_HORIZON_YEARS = 3
+# Floor on customer age so a single recent order is not extrapolated to a huge yearly rate
+CLV_MIN_AGE_DAYS = 90
+SECONDS_PER_DAY = 86400
+
+def iter_order_columns(chunk_size=ANALYTICS_CHUNK_SIZE):
+    """
+    Yield ``(user_ids, created_at, totals)`` NumPy arrays for counted orders,
+    one chunk at a time, walking the orders table by primary key.
+    ``created_at`` is in epoch seconds.
+    """
+    orders = Order.objects.filter(user__isnull=False, paid_at__isnull=False).exclude(status__in=REVERSED_STATUSES)
+    last_id = 0
+    while True:
+        rows = list(
+            orders.filter(id__gt=last_id).order_by('id').values_list('id', 'user_id', 'created_at', 'total')[:chunk_size]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        ids, user_ids, created_at, totals = zip(*rows)
+        yield (
+            np.fromiter(user_ids, dtype=np.int64, count=len(rows)),
+            np.fromiter((value.timestamp() for value in created_at), dtype=np.int64, count=len(rows)),
+            np.fromiter(totals, dtype=np.float64, count=len(rows)),
+        )
+
+def load_order_columns(chunk_size=ANALYTICS_CHUNK_SIZE):
+    chunks = list(iter_order_columns(chunk_size))
+    if not chunks:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64)
+    return tuple(np.concatenate(column) for column in zip(*chunks))
+
+def quantile_scores(values, bins=RFM_BINS):
+    """Score values 1..bins by rank; equal values always get the same score"""
+    ranks = np.searchsorted(np.sort(values), values, side='left')
+    return 1 + ranks * bins // len(values)
+
+def sorted_unique(values):
+    """
+    ``np.unique`` with start indices and counts for an already sorted array,
+    found with one linear scan for run boundaries instead of another sort.
+    """
+    if not len(values):
+        return values, np.empty(0, np.intp), np.empty(0, np.intp)
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    counts = np.diff(np.append(starts, len(values)))
+    return values[starts], starts, counts
+
+def epoch_months(seconds):
+    """Months since 1970-01 (UTC) for epoch-second timestamps"""
+    # Binary search over month boundaries beats converting every timestamp
+    # through datetime64[M]
+    first, last = seconds.min(), seconds.max()
+    months = np.arange(
+        np.datetime64(int(first), 's').astype('datetime64[M]'),
+        np.datetime64(int(last), 's').astype('datetime64[M]') + 1
+    )
+    boundaries = months.astype('datetime64[s]').astype(np.int64)
+    return months.astype(np.int64)[np.searchsorted(boundaries, seconds, side='right') - 1]
+
+class CustomerOrders:
+    """Orders grouped by customer as parallel NumPy arrays"""
+    
+    def __init__(self, user_ids, created_at, totals):
+        order = np.argsort(user_ids, kind='stable')
+        self.created_at = created_at[order]
+        self.totals = totals[order]
+        self.customer_ids, self.starts, self.frequency = sorted_unique(user_ids[order])
+        if len(self.customer_ids):
+            self.first_order = np.minimum.reduceat(self.created_at, self.starts)
+            self.last_order = np.maximum.reduceat(self.created_at, self.starts)
+            self.monetary = np.add.reduceat(self.totals, self.starts)
+        else:
+            self.first_order = self.last_order = np.empty(0, np.int64)
+            self.monetary = np.empty(0, np.float64)
+    
+    def __len__(self):
+        return len(self.customer_ids)
+    
+    def rfm(self, now):
+        """Recency in days plus 1-5 recency, frequency and monetary scores and a segment per customer"""
+        recency_days = (now - self.last_order) // SECONDS_PER_DAY
+        r_score = quantile_scores(-recency_days)
+        f_score = quantile_scores(self.frequency)
+        m_score = quantile_scores(self.monetary)
+        segment = np.select(
+            [
+                (r_score >= 4) & (f_score >= 4),
+                f_score >= 4,
+                (r_score >= 4) & (f_score >= 2),
+                r_score >= 4,
+                (r_score <= 2) & (f_score >= 3),
+                r_score <= 2,
+            ],
+            ['champions', 'loyal', 'potential_loyalists', 'new', 'at_risk', 'hibernating'],
+            default='needs_attention'
+        )
+        return {
+            'recency_days': recency_days,
+            'r_score': r_score,
+            'f_score': f_score,
+            'm_score': m_score,
+            'segment': segment,
+        }
+    
+    def clv(self, now, horizon_years=CLV_HORIZON_YEARS):
+        """Historical run rate: average order value x orders per year x horizon"""
+        age_days = np.maximum((now - self.first_order) / SECONDS_PER_DAY, CLV_MIN_AGE_DAYS)
+        average_order = self.monetary / self.frequency
+        orders_per_year = self.frequency * 365 / age_days
+        return average_order * orders_per_year * horizon_years
+    
+    def cohorts(self):
+        """
+        Return ``(cohort_months, months_since, customers)``: for every cohort
+        of customers sharing a first-order month, how many ordered again
+        ``months_since`` months later. Months count from 1970-01 (UTC).
+        """
+        months = epoch_months(self.created_at)
+        customer = np.repeat(np.arange(len(self)), self.frequency)
+        first_month = np.minimum.reduceat(months, self.starts)
+        months_since = months - first_month[customer]
+        
+        # Each customer counts once per month, however many orders they placed
+        span = int(months_since.max()) + 1
+        active, _, _ = sorted_unique(np.sort(customer * span + months_since))
+        active_customer, active_offset = np.divmod(active, span)
+        
+        keys, _, customers = sorted_unique(np.sort(first_month[active_customer] * span + active_offset))
+        cohort_months, offsets = np.divmod(keys, span)
+        return cohort_months, offsets, customers
+
+def _to_datetime(seconds):
+    return datetime.fromtimestamp(int(seconds), tz=dt_timezone.utc)
+
+def _month_to_date(month):
+    return date(1970 + int(month) // 12, int(month) % 12 + 1, 1)
+
+def persist_segments(customer_orders, rfm, clv, now):
+    """Upsert one CustomerSegment per customer and drop customers no longer present"""
+    computed_at = _to_datetime(now)
+    clv = np.round(clv, 2)
+    monetary = np.round(customer_orders.monetary, 2)
+    
+    for start in range(0, len(customer_orders), SEGMENT_BATCH_SIZE):
+        batch = slice(start, start + SEGMENT_BATCH_SIZE)
+        CustomerSegment.objects.bulk_create(
+            [
+                CustomerSegment(
+                    user_id=int(user_id),
+                    recency_days=int(recency),
+                    frequency=int(frequency),
+                    monetary=Decimal(f'{value:.2f}'),
+                    r_score=int(r),
+                    f_score=int(f),
+                    m_score=int(m),
+                    segment=str(segment),
+                    clv=Decimal(f'{lifetime_value:.2f}'),
+                    first_order_at=_to_datetime(first),
+                    last_order_at=_to_datetime(last),
+                    computed_at=computed_at
+                )
+                for user_id, recency, frequency, value, r, f, m, segment, lifetime_value, first, last in zip(
+                    customer_orders.customer_ids[batch], rfm['recency_days'][batch],
+                    customer_orders.frequency[batch], monetary[batch], rfm['r_score'][batch],
+                    rfm['f_score'][batch], rfm['m_score'][batch], rfm['segment'][batch], clv[batch],
+                    customer_orders.first_order[batch], customer_orders.last_order[batch]
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=[
+                'recency_days', 'frequency', 'monetary', 'r_score', 'f_score', 'm_score',
+                'segment', 'clv', 'first_order_at', 'last_order_at', 'computed_at'
+            ]
+        )
+    
+    # Customers without counted orders any more
+    CustomerSegment.objects.filter(computed_at__lt=computed_at).delete()
+
+@transaction.atomic
+def persist_cohorts(cohorts):
+    cohort_months, offsets, customers = cohorts
+    CustomerCohort.objects.all().delete()
+    CustomerCohort.objects.bulk_create([
+        CustomerCohort(cohort=_month_to_date(month), months_since=int(offset), customers=int(count))
+        for month, offset, count in zip(cohort_months, offsets, customers)
+    ], batch_size=1000)
+
+def compute_customer_analytics(chunk_size=ANALYTICS_CHUNK_SIZE):
+    """
+    Rebuild customer segments and cohorts from the full order history.
+    Returns the number of orders, customers and cohort cells along with
+    the time spent loading, computing and saving.
+    """
+    now = int(timezone.now().timestamp())
+    
+    started = time.perf_counter()
+    user_ids, created_at, totals = load_order_columns(chunk_size)
+    loaded = time.perf_counter()
+    
+    customer_orders = CustomerOrders(user_ids, created_at, totals)
+    if len(customer_orders):
+        rfm = customer_orders.rfm(now)
+        clv = customer_orders.clv(now)
+        cohorts = customer_orders.cohorts()
+    else:
+        rfm = {key: np.empty(0) for key in ('recency_days', 'r_score', 'f_score', 'm_score', 'segment')}
+        clv = np.empty(0)
+        cohorts = (np.empty(0), np.empty(0), np.empty(0))
+    computed = time.perf_counter()
+    
+    persist_segments(customer_orders, rfm, clv, now)
+    persist_cohorts(cohorts)
+    saved = time.perf_counter()
+    
+    return {
+        'orders': len(user_ids),
+        'customers': len(customer_orders),
+        'cohort_cells': len(cohorts[2]),
+        'load_seconds': round(loaded - started, 2),
+        'compute_seconds': round(computed - loaded, 2),
+        'save_seconds': round(saved - computed, 2),
+    }
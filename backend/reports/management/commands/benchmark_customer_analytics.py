@@ -0,0 +1,59 @@
+import time
+from collections import defaultdict
+import numpy as np
+from django.core.management.base import BaseCommand
+from reports.analytics import CustomerOrders, SECONDS_PER_DAY
+
+class Command(BaseCommand):
+    help = 'Time the vectorized RFM, CLV and cohort computation on a synthetic order history'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000000)
+        parser.add_argument('--customers', type=int, default=500000)
+        parser.add_argument('--years', type=int, default=3)
+        parser.add_argument('--python-sample', type=int, default=200000,
+                            help='Orders to run through an equivalent per-row Python loop for comparison')
+        parser.add_argument('--seed', type=int, default=42)
+    
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        count = options['orders']
+        now = int(time.time())
+        
+        user_ids = rng.integers(1, options['customers'] + 1, size=count, dtype=np.int64)
+        created_at = now - rng.integers(0, options['years'] * 365 * SECONDS_PER_DAY, size=count, dtype=np.int64)
+        totals = np.round(rng.gamma(2.0, 40.0, size=count), 2)
+        
+        start = time.perf_counter()
+        customer_orders = CustomerOrders(user_ids, created_at, totals)
+        grouped = time.perf_counter()
+        rfm = customer_orders.rfm(now)
+        customer_orders.clv(now)
+        scored = time.perf_counter()
+        cohorts = customer_orders.cohorts()
+        finished = time.perf_counter()
+        
+        sample = min(options['python_sample'], count)
+        python_start = time.perf_counter()
+        per_customer = defaultdict(lambda: [0, 0.0, None, None])
+        for user_id, created, total in zip(user_ids[:sample].tolist(), created_at[:sample].tolist(), totals[:sample].tolist()):
+            stats = per_customer[user_id]
+            stats[0] += 1
+            stats[1] += total
+            stats[2] = created if stats[2] is None else min(stats[2], created)
+            stats[3] = created if stats[3] is None else max(stats[3], created)
+        python_seconds = (time.perf_counter() - python_start) * count / sample
+        
+        segments, sizes = np.unique(rfm['segment'], return_counts=True)
+        
+        self.stdout.write(f'Orders:             {count:,}')
+        self.stdout.write(f'Customers:          {len(customer_orders):,}')
+        self.stdout.write(f'Cohort cells:       {len(cohorts[2]):,}')
+        self.stdout.write(f'Group by customer:  {grouped - start:.2f}s')
+        self.stdout.write(f'RFM and CLV:        {scored - grouped:.2f}s')
+        self.stdout.write(f'Cohorts:            {finished - scored:.2f}s')
+        self.stdout.write(f'Total (NumPy):      {finished - start:.2f}s')
+        self.stdout.write(f'Python loop (est.): {python_seconds:.2f}s for aggregation alone')
+        for segment, size in zip(segments, sizes):
+            self.stdout.write(f'  {segment:<20} {size:,}')
+        self.stdout.write(self.style.SUCCESS('Customer analytics benchmark complete'))
\ No newline at end of file
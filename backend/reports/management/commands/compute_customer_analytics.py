@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from reports.analytics import compute_customer_analytics, ANALYTICS_CHUNK_SIZE
+
+class Command(BaseCommand):
+    help = 'Rebuild RFM customer segments, lifetime value and monthly retention cohorts'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=ANALYTICS_CHUNK_SIZE)
+    
+    def handle(self, *args, **options):
+        metrics = compute_customer_analytics(chunk_size=options['chunk_size'])
+        
+        self.stdout.write(
+            f"Loaded {metrics['orders']} orders in {metrics['load_seconds']}s, "
+            f"computed in {metrics['compute_seconds']}s, saved in {metrics['save_seconds']}s"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Segmented {metrics['customers']} customers into "
+                f"{metrics['cohort_cells']} cohort cells"
+            )
+        )
\ No newline at end of file
@@ -0,0 +1,109 @@
+from django.db import models
+from accounts.models import User
+from orders.models import Order
+from products.models import Category, Product
+
+class DailySales(models.Model):
+    """Sales totals per day, counting paid orders that were not cancelled or refunded"""
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    gross = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discounts = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'daily_sales'
+        ordering = ['date']
+    
+    def __str__(self):
+        return f"{self.date}: {self.orders} orders"
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    # No database constraint so history survives product deletion
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    gross = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'daily_product_sales'
+        unique_together = ['date', 'product']
+    
+    def __str__(self):
+        return f"{self.date} - product {self.product_id}: {self.units} units"
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    gross = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'daily_category_sales'
+        unique_together = ['date', 'category']
+    
+    def __str__(self):
+        return f"{self.date} - category {self.category_id}: {self.units} units"
+
+class SalesLedgerEntry(models.Model):
+    """Whether, and on which day, an order is counted in the rollups"""
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    date = models.DateField(null=True, blank=True)
+    counted = models.BooleanField(default=False)
+    
+    class Meta:
+        db_table = 'sales_ledger'
+    
+    def __str__(self):
+        return f"Order {self.order_id}: {'counted' if self.counted else 'not counted'}"
+
+class CustomerSegment(models.Model):
+    """RFM scores, segment and lifetime value per customer, rebuilt by compute_customer_analytics"""
+    SEGMENT_CHOICES = (
+        ('champions', 'Champions'),
+        ('loyal', 'Loyal'),
+        ('potential_loyalists', 'Potential Loyalists'),
+        ('new', 'New'),
+        ('at_risk', 'At Risk'),
+        ('hibernating', 'Hibernating'),
+        ('needs_attention', 'Needs Attention'),
+    )
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='segment')
+    recency_days = models.PositiveIntegerField()
+    frequency = models.PositiveIntegerField()
+    monetary = models.DecimalField(max_digits=14, decimal_places=2)
+    r_score = models.PositiveSmallIntegerField()
+    f_score = models.PositiveSmallIntegerField()
+    m_score = models.PositiveSmallIntegerField()
+    segment = models.CharField(max_length=30, choices=SEGMENT_CHOICES)
+    clv = models.DecimalField(max_digits=14, decimal_places=2)
+    first_order_at = models.DateTimeField()
+    last_order_at = models.DateTimeField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'customer_segments'
+        indexes = [
+            models.Index(fields=['segment']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.segment} ({self.r_score}{self.f_score}{self.m_score})"
+
+class CustomerCohort(models.Model):
+    """Customers from a first-order month still ordering ``months_since`` months later"""
+    cohort = models.DateField()
+    months_since = models.PositiveSmallIntegerField()
+    customers = models.PositiveIntegerField()
+    
+    class Meta:
+        db_table = 'customer_cohorts'
+        unique_together = ['cohort', 'months_since']
+        ordering = ['cohort', 'months_since']
+    
+    def __str__(self):
+        return f"{self.cohort:%Y-%m} +{self.months_since}: {self.customers}"
\ No newline at end of file
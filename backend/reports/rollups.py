@@ -0,0 +1,180 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from orders.models import Order, OrderItem
+from .models import DailySales, DailyProductSales, DailyCategorySales, SalesLedgerEntry
+
+# Paid orders in these statuses no longer count as sales
+REVERSED_STATUSES = ('cancelled', 'refunded')
+
+def _is_counted(paid_at, status):
+    return paid_at is not None and status not in REVERSED_STATUSES
+
+def _apply_deltas(model, key_fields, deltas):
+    """Add ``{key: {field: delta}}`` to rollup rows, creating missing rows first"""
+    if not deltas:
+        return
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key))) for key in deltas],
+        ignore_conflicts=True
+    )
+    # Sorted so concurrent updates lock rows in the same order
+    for key in sorted(deltas):
+        model.objects.filter(**dict(zip(key_fields, key))).update(
+            **{field: F(field) + value for field, value in deltas[key].items()}
+        )
+
+@transaction.atomic
+def sync_order_sales(order_ids):
+    """
+    Bring the rollups in line with the current state of the given orders.
+    The ledger records what each order already contributes, so events may be
+    delivered more than once or out of order. Returns the number of orders
+    whose contribution changed.
+    """
+    orders = {
+        order['id']: order
+        for order in Order.objects.filter(id__in=set(order_ids)).values(
+            'id', 'paid_at', 'status', 'subtotal', 'discount', 'tax'
+        ).order_by()
+    }
+    if not orders:
+        return 0
+    
+    SalesLedgerEntry.objects.bulk_create(
+        [SalesLedgerEntry(order_id=order_id) for order_id in orders],
+        ignore_conflicts=True
+    )
+    entries = SalesLedgerEntry.objects.select_for_update().filter(order_id__in=orders).order_by('order_id')
+    
+    changed = {}
+    for entry in entries:
+        order = orders[entry.order_id]
+        counted = _is_counted(order['paid_at'], order['status'])
+        if counted == entry.counted:
+            continue
+        if counted:
+            entry.date = timezone.localdate(order['paid_at'])
+        entry.counted = counted
+        changed[entry.order_id] = entry
+    if not changed:
+        return 0
+    
+    SalesLedgerEntry.objects.bulk_update(changed.values(), ['date', 'counted'])
+    
+    daily = defaultdict(lambda: defaultdict(int))
+    products = defaultdict(lambda: defaultdict(int))
+    categories = defaultdict(lambda: defaultdict(int))
+    
+    for order_id, entry in changed.items():
+        sign = 1 if entry.counted else -1
+        order = orders[order_id]
+        totals = daily[(entry.date,)]
+        totals['orders'] += sign
+        totals['gross'] += sign * order['subtotal']
+        totals['discounts'] += sign * order['discount']
+        totals['tax'] += sign * order['tax']
+    
+    # Lines are attributed to the product's current category
+    lines = OrderItem.objects.filter(order_id__in=changed).values(
+        'order_id', 'product_id', 'product__category_id'
+    ).annotate(units=Sum('quantity'), gross=Sum('total_price')).order_by()
+    
+    order_categories = set()
+    for line in lines:
+        entry = changed[line['order_id']]
+        sign = 1 if entry.counted else -1
+        daily[(entry.date,)]['units'] += sign * line['units']
+        
+        if line['product_id'] is not None:
+            totals = products[(entry.date, line['product_id'])]
+            totals['orders'] += sign
+            totals['units'] += sign * line['units']
+            totals['gross'] += sign * line['gross']
+        
+        category_id = line['product__category_id']
+        if category_id is not None:
+            totals = categories[(entry.date, category_id)]
+            if (line['order_id'], category_id) not in order_categories:
+                order_categories.add((line['order_id'], category_id))
+                totals['orders'] += sign
+            totals['units'] += sign * line['units']
+            totals['gross'] += sign * line['gross']
+    
+    _apply_deltas(DailySales, ['date'], daily)
+    _apply_deltas(DailyProductSales, ['date', 'product_id'], products)
+    _apply_deltas(DailyCategorySales, ['date', 'category_id'], categories)
+    return len(changed)
+
+def _day_bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+@transaction.atomic
+def rebuild_sales_rollups(start, end):
+    """
+    Recompute the rollups and the ledger for the days ``start`` to ``end``
+    (inclusive) from the orders table with a handful of GROUP BY queries.
+    Returns the number of counted orders.
+    """
+    lower, upper = _day_bounds(start, end)
+    paid = Order.objects.filter(paid_at__gte=lower, paid_at__lt=upper)
+    counted = paid.exclude(status__in=REVERSED_STATUSES)
+    lines = OrderItem.objects.filter(order__in=counted).annotate(day=TruncDate('order__paid_at'))
+    
+    for model in (DailySales, DailyProductSales, DailyCategorySales):
+        model.objects.filter(date__range=(start, end)).delete()
+    
+    units = dict(lines.values('day').annotate(units=Sum('quantity')).values_list('day', 'units').order_by())
+    days = list(counted.annotate(day=TruncDate('paid_at')).values('day').annotate(
+        orders=Count('id'), gross=Sum('subtotal'), discounts=Sum('discount'), tax=Sum('tax')
+    ).order_by())
+    DailySales.objects.bulk_create([
+        DailySales(
+            date=row['day'],
+            orders=row['orders'],
+            units=units.get(row['day'], 0),
+            gross=row['gross'],
+            discounts=row['discounts'],
+            tax=row['tax']
+        )
+        for row in days
+    ])
+    
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(date=row['day'], product_id=row['product_id'], orders=row['orders'],
+                          units=row['units'], gross=row['gross'])
+        for row in lines.filter(product__isnull=False).values('day', 'product_id').annotate(
+            orders=Count('order_id', distinct=True), units=Sum('quantity'), gross=Sum('total_price')
+        ).order_by()
+    ], batch_size=1000)
+    
+    DailyCategorySales.objects.bulk_create([
+        DailyCategorySales(date=row['day'], category_id=row['product__category_id'], orders=row['orders'],
+                           units=row['units'], gross=row['gross'])
+        for row in lines.filter(product__category__isnull=False).values('day', 'product__category_id').annotate(
+            orders=Count('order_id', distinct=True), units=Sum('quantity'), gross=Sum('total_price')
+        ).order_by()
+    ], batch_size=1000)
+    
+    SalesLedgerEntry.objects.bulk_create(
+        [
+            SalesLedgerEntry(
+                order_id=order_id,
+                date=timezone.localdate(paid_at),
+                counted=_is_counted(paid_at, status)
+            )
+            for order_id, paid_at, status in paid.values_list('id', 'paid_at', 'status').order_by().iterator()
+        ],
+        update_conflicts=True,
+        unique_fields=['order'],
+        update_fields=['date', 'counted'],
+        batch_size=1000
+    )
+    return sum(row['orders'] for row in days)
@@ -0,0 +1,17 @@
+from celery import shared_task
+from .analytics import compute_customer_analytics
+from .rollups import sync_order_sales
+
+@shared_task
+def update_sales_rollups(events):
+    """Outbox consumer for order.paid and order.status_changed events"""
+    order_ids = []
+    for event in events:
+        order_ids.extend(event.get('order_ids') or [event['order_id']])
+    changed = sync_order_sales(order_ids)
+    return f"Updated sales rollups for {changed} orders"
+
+@shared_task
+def compute_customer_segments():
+    """Nightly rebuild of RFM segments, lifetime value and retention cohorts"""
+    return compute_customer_analytics()
\ No newline at end of file
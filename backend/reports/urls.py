@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import SalesReportView, TopProductsReportView, CategorySalesReportView
+
+urlpatterns = [
+    path('sales/', SalesReportView.as_view(), name='report-sales'),
+    path('products/', TopProductsReportView.as_view(), name='report-top-products'),
+    path('categories/', CategorySalesReportView.as_view(), name='report-categories'),
+]
\ No newline at end of file
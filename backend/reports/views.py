@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework import permissions
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from products.models import Category, Product
+from .models import DailySales, DailyProductSales, DailyCategorySales
+
+DEFAULT_REPORT_DAYS = 30
+MAX_TOP_LIMIT = 100
+
+MONEY_FIELDS = ('gross', 'discounts', 'tax')
+
+def _money(row):
+    # Decimals as strings so totals keep their exact value
+    return {key: str(value) if key in MONEY_FIELDS else value for key, value in row.items()}
+
+class ReportView(APIView):
+    """Base for staff reports served from the daily rollup tables"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get_date_range(self, request):
+        try:
+            end = date.fromisoformat(request.query_params['end']) if 'end' in request.query_params else timezone.localdate()
+            start = (
+                date.fromisoformat(request.query_params['start']) if 'start' in request.query_params
+                else end - timedelta(days=DEFAULT_REPORT_DAYS - 1)
+            )
+        except ValueError:
+            raise ParseError('start and end must be dates in YYYY-MM-DD format')
+        if start > end:
+            raise ParseError('start must not be after end')
+        return start, end
+    
+    def get_limit(self, request, default=10):
+        try:
+            limit = int(request.query_params.get('limit', default))
+        except ValueError:
+            raise ParseError('limit must be an integer')
+        return max(1, min(limit, MAX_TOP_LIMIT))
+
+class SalesReportView(ReportView):
+    """Daily orders, units, gross, discounts and tax"""
+    
+    def get(self, request):
+        start, end = self.get_date_range(request)
+        days = DailySales.objects.filter(date__range=(start, end))
+        totals = days.aggregate(
+            orders=Sum('orders'), units=Sum('units'), gross=Sum('gross'),
+            discounts=Sum('discounts'), tax=Sum('tax')
+        )
+        return Response({
+            'start': start,
+            'end': end,
+            'totals': _money({key: value or 0 for key, value in totals.items()}),
+            'series': [
+                _money(row)
+                for row in days.values('date', 'orders', 'units', 'gross', 'discounts', 'tax')
+            ],
+        })
+
+class TopProductsReportView(ReportView):
+    """Best selling products in a date range, by units or by gross revenue"""
+    
+    def get(self, request):
+        start, end = self.get_date_range(request)
+        order_by = 'gross' if request.query_params.get('by') == 'gross' else 'units'
+        rows = list(
+            DailyProductSales.objects.filter(date__range=(start, end))
+            .values('product_id')
+            .annotate(orders=Sum('orders'), units=Sum('units'), gross=Sum('gross'))
+            .order_by(f'-{order_by}', 'product_id')[:self.get_limit(request)]
+        )
+        products = Product.objects.in_bulk([row['product_id'] for row in rows])
+        for row in rows:
+            product = products.get(row['product_id'])
+            row['name'] = product.name if product else None
+            row['sku'] = product.sku if product else None
+        return Response({'start': start, 'end': end, 'results': [_money(row) for row in rows]})
+
+class CategorySalesReportView(ReportView):
+    """Sales per category in a date range"""
+    
+    def get(self, request):
+        start, end = self.get_date_range(request)
+        rows = list(
+            DailyCategorySales.objects.filter(date__range=(start, end))
+            .values('category_id')
+            .annotate(orders=Sum('orders'), units=Sum('units'), gross=Sum('gross'))
+            .order_by('-gross', 'category_id')
+        )
+        names = dict(Category.objects.filter(id__in=[row['category_id'] for row in rows]).values_list('id', 'name'))
+        for row in rows:
+            row['name'] = names.get(row['category_id'])
+        return Response({'start': start, 'end': end, 'results': [_money(row) for row in rows]})
\ No newline at end of file
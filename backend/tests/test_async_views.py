@@ -0,0 +1,97 @@
+import json
+from asgiref.sync import async_to_sync
+from django.test import TransactionTestCase, RequestFactory
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from backend.cache import clear_local_caches
+from products.models import Category, Product, ProductVariant, Review, RelatedProduct
+from products.attributes import rebuild_variant_attributes
+from products import async_views
+from decimal import Decimal
+
+User = get_user_model()
+
+# Sub-queries run on other threads with their own connections, so the test
+# data has to be committed
+class AsyncProductViewsTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_caches()
+        self.client = APIClient()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpass123', first_name='Test', last_name='User'
+        )
+        self.category = Category.objects.create(name='Electronics')
+        Category.objects.create(name='Phones', parent=self.category)
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', description='Test', category=self.category,
+                price=Decimal('10.00') + i, sku=f'SKU{i}', stock=i
+            )
+            for i in range(15)
+        ]
+        self.product = self.products[0]
+        ProductVariant.objects.create(product=self.product, name='Red', sku='SKU0-R', price=Decimal('10.00'),
+                                      stock=3, attributes={'color': 'red'})
+        Review.objects.create(product=self.product, user=self.user, rating=4, title='Good', comment='Fine',
+                              is_approved=True)
+        RelatedProduct.objects.create(product=self.product, related=self.products[1], rank=1, score=0.5)
+        rebuild_variant_attributes()
+    
+    def assertSameResponse(self, view, path, params=None, **kwargs):
+        """The async view answers like the sync endpoint at the same path"""
+        expected = self.client.get(path, params or {})
+        response = async_to_sync(view)(self.factory.get(path, params or {}), **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        return json.loads(response.content)
+    
+    def test_product_list_matches_sync_view(self):
+        data = self.assertSameResponse(async_views.product_list, '/api/products/')
+        self.assertEqual((data['count'], len(data['results'])), (15, 12))
+        
+        self.assertSameResponse(async_views.product_list, '/api/products/', {'page': 2, 'ordering': 'price'})
+        self.assertSameResponse(async_views.product_list, '/api/products/', {'page': 'last'})
+        self.assertSameResponse(async_views.product_list, '/api/products/', {
+            'category': self.category.id, 'in_stock': 'true', 'fields': 'id,name', 'expand': 'variants',
+        })
+        data = self.assertSameResponse(async_views.product_list, '/api/products/', {
+            'attr.color': 'red', 'facets': 'true',
+        })
+        self.assertEqual(data['facets'], {'color': [{'value': 'red', 'count': 1}]})
+        
+        self.assertSameResponse(async_views.product_list, '/api/products/', {'page': 9})
+        self.assertSameResponse(async_views.product_list, '/api/products/', {'category': 999999})
+    
+    def test_product_detail_matches_sync_view(self):
+        path = f'/api/products/{self.product.slug}/'
+        data = self.assertSameResponse(async_views.product_detail, path, slug=self.product.slug)
+        self.assertEqual(data['category']['children'][0]['name'], 'Phones')
+        self.assertEqual((data['review_count'], len(data['variants']), len(data['related_products'])), (1, 1, 1))
+        
+        self.assertSameResponse(async_views.product_detail, path, {'fields': 'id,reviews'}, slug=self.product.slug)
+        self.assertSameResponse(async_views.product_detail, '/api/products/missing/', slug='missing')
+        
+        # Both requests counted a view
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views, 4)
+    
+    def test_product_availability_matches_sync_view(self):
+        variant = self.product.variants.get()
+        path = '/api/products/availability/'
+        data = self.assertSameResponse(async_views.product_availability, path, {
+            'ids': f'{self.product.id},{self.products[1].id},999999', 'variant_ids': variant.id,
+        })
+        self.assertEqual(data['variants'][str(variant.id)]['stock'], 3)
+        self.assertSameResponse(async_views.product_availability, path, {'ids': 'abc'})
+    
+    def test_invalid_token_is_rejected(self):
+        request = self.factory.get('/api/products/', HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(async_to_sync(async_views.product_list)(request).status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        request = self.factory.get('/api/products/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(async_to_sync(async_views.product_list)(request).status_code, status.HTTP_200_OK)
@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+from django.test import TestCase
+from django.core.cache import cache
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from django.contrib.auth import get_user_model
+from backend.cache import (
+    LocalLRUCache, LockLost, TieredCache, cache_lock, handle_invalidation, read_cache_stats, clear_local_caches
+)
+from products.models import Category
+from products.cache import category_cache
+from accounts.cache import profile_cache
+
+User = get_user_model()
+
+class TieredCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_caches()
+        self.tiered = TieredCache('test-tiered', ttl=60, local_ttl=60, local_max_size=2)
+    
+    def test_local_lru_is_bounded(self):
+        lru = LocalLRUCache(max_size=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+        
+        expired = LocalLRUCache(max_size=2, ttl=-1)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
+    
+    def test_reads_fall_through_tiers(self):
+        self.tiered.set_many({'a': 1, 'b': None})
+        self.assertEqual(self.tiered.get_many(['a', 'b', 'c']), {'a': 1, 'b': None})
+        
+        # Another process has an empty local tier and reads from the shared one
+        self.tiered.local.clear()
+        self.assertEqual(self.tiered.get('a'), 1)
+        self.assertEqual(self.tiered.get('a'), 1)
+        
+        stats = self.tiered.stats()
+        self.assertEqual((stats['local']['hits'], stats['local']['misses']), (3, 2))
+        self.assertEqual((stats['shared']['hits'], stats['shared']['misses']), (1, 1))
+        
+        self.tiered.flush_stats(force=True)
+        self.assertEqual(read_cache_stats(['test-tiered'])['test-tiered']['local']['hit_rate'], 0.6)
+    
+    def test_invalidation_messages_evict_local_copies(self):
+        self.tiered.set_many({'a': 1, 'b': 2})
+        handle_invalidation(json.dumps({'sender': 'other:1', 'namespace': 'test-tiered', 'keys': ['a']}))
+        self.assertIsNone(self.tiered.local.get('a'))
+        self.assertEqual(self.tiered.local.get('b'), 2)
+        
+        handle_invalidation(json.dumps({'sender': 'other:1', 'namespace': 'test-tiered', 'keys': None}))
+        self.assertEqual(len(self.tiered.local), 0)
+        
+        # clear() moves the shared tier to a new version as well
+        self.tiered.set('a', 1)
+        self.tiered.clear()
+        self.assertIsNone(self.tiered.get('a'))
+    
+    def test_concurrent_access(self):
+        def worker(offset):
+            for i in range(200):
+                self.tiered.set(f'{offset}:{i}', i)
+                self.tiered.get(f'{offset}:{i // 2}')
+        
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(len(self.tiered.local), 2)
+    
+    def test_single_flight_under_concurrent_misses(self):
+        calls = []
+        barrier = threading.Barrier(200)
+        results = []
+        
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'tree'
+        
+        def worker():
+            barrier.wait()
+            results.append(self.tiered.get_or_compute('hot', compute))
+        
+        threads = [threading.Thread(target=worker) for _ in range(200)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['tree'] * 200)
+    
+    def test_waits_for_recompute_in_another_process(self):
+        cache.add('test-tiered:lock:hot', 'other', 30)
+        threading.Timer(0.2, lambda: self.tiered.set('hot', 'theirs')).start()
+        self.tiered.local.clear()
+        self.assertEqual(self.tiered.get_or_compute('hot', lambda: 'ours'), 'theirs')
+    
+    def test_stale_entries_are_served_while_one_caller_refreshes(self):
+        tiered = TieredCache('test-stale', ttl=60, local_ttl=60, stale_ttl=60)
+        tiered.set('a', 1, ttl=0)
+        tiered.local.clear()
+        self.assertIsNone(tiered.get('a'))
+        
+        # Someone else is refreshing it
+        cache.add('test-stale:lock:a', 'other', 30)
+        self.assertEqual(tiered.get_or_compute('a', lambda: 2), 1)
+        
+        cache.delete('test-stale:lock:a')
+        self.assertEqual(tiered.get_or_compute('a', lambda: 2), 2)
+        tiered.local.clear()
+        self.assertEqual(tiered.get('a'), 2)
+    
+    def test_cache_lock_is_owner_checked(self):
+        with cache_lock('lock:test-job', 60) as lock:
+            self.assertTrue(lock.acquired)
+            with cache_lock('lock:test-job', 60) as other:
+                self.assertFalse(other.acquired)
+            lock.refresh()
+            self.assertEqual(cache.get('lock:test-job'), lock.token)
+            
+            # The lock lapsed and another run took it over
+            cache.set('lock:test-job', 'other-run', 60)
+            with self.assertRaises(LockLost):
+                lock.refresh()
+        self.assertEqual(cache.get('lock:test-job'), 'other-run')
+    
+    def test_category_tree_is_cached(self):
+        category_cache.clear()
+        Category.objects.create(name='Books')
+        client = APIClient()
+        self.assertEqual(client.get('/api/products/categories/').data['results'][0]['name'], 'Books')
+        with self.assertNumQueries(0):
+            client.get('/api/products/categories/')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Games')
+        self.assertEqual(len(client.get('/api/products/categories/').data['results']), 2)
+    
+    def test_authentication_uses_profile_cache(self):
+        user = User.objects.create_user(email='test@example.com', password='testpass123',
+                                        first_name='Test', last_name='User')
+        profile_cache.clear()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        
+        self.assertEqual(client.get('/api/auth/profile/').data['email'], 'test@example.com')
+        with self.assertNumQueries(0):
+            response = client.get('/api/auth/profile/')
+        self.assertEqual(response.data['first_name'], 'Test')
+        
+        # The password hash stays out of the cache, and updates go to the stored row
+        self.assertNotIn(user.password, profile_cache.get(f'user:{user.pk}'))
+        User.objects.filter(pk=user.pk).update(last_name='Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch('/api/auth/profile/', {'first_name': 'Changed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertEqual((user.first_name, user.last_name), ('Changed', 'Renamed'))
+        self.assertTrue(user.check_password('testpass123'))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        self.assertEqual(client.get('/api/auth/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
@@ -3,13 +3,22 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from products.models import Category, Product
-from cart.models import Cart
+from cart.models import Cart, CartItem
+from cart.tasks import process_abandoned_carts, send_abandoned_cart_emails
+from django.core import mail
+from django.utils import timezone
+from datetime import timedelta
+from django.core.cache import cache
+from backend.cache import clear_local_caches
 from decimal import Decimal
+from unittest import mock
 
 User = get_user_model()
 
 class CartAPITestCase(TestCase):
     def setUp(self):
+        cache.clear()
+        clear_local_caches()
         self.client = APIClient()
         self.user = User.objects.create_user(
             email='test@example.com',
@@ -44,6 +53,17 @@ class CartAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['total_items'], 2)
     
+    def test_cart_sparse_fields(self):
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 2})
+        
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/cart/', {'fields': 'subtotal,total_items'})
+        self.assertEqual(response.data, {'subtotal': Decimal('100.00'), 'total_items': 2})
+        
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.data['items'][0]['product']['name'], 'Test Product')
+        self.assertEqual(response.data['subtotal'], Decimal('100.00'))
+    
     def test_add_to_cart_exceeds_stock(self):
         data = {
             'product_id': self.product.id,
@@ -51,4 +71,57 @@ class CartAPITestCase(TestCase):
         }
         response = self.client.post('/api/cart/add/', data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-
+    
+    def _set_stock(self, stock):
+        self.product.stock = stock
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+    
+    def test_sold_out_burst_skips_database(self):
+        self._set_stock(0)
+        
+        data = {'product_id': self.product.id, 'quantity': 1}
+        with self.assertNumQueries(0):
+            for _ in range(500):
+                response = self.client.post('/api/cart/add/', data)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        # Restocking re-arms the product
+        self._set_stock(5)
+        response = self.client.post('/api/cart/add/', data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def _create_cart(self, email, quantity=None, idle=timedelta(days=2)):
+        user = User.objects.create_user(email=email, password='testpass123', first_name='Idle')
+        cart = Cart.objects.create(user=user)
+        if quantity:
+            CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - idle)
+        return cart
+    
+    def _process_abandoned_carts(self, **kwargs):
+        # Send the queued email batches here rather than through a worker
+        with mock.patch('cart.tasks.send_abandoned_cart_emails.delay') as delay:
+            metrics = process_abandoned_carts(**kwargs)
+        for call in delay.call_args_list:
+            send_abandoned_cart_emails(*call.args)
+        return metrics
+    
+    def test_abandoned_carts_notified_once_per_version(self):
+        abandoned = [self._create_cart(f'idle{i}@example.com', quantity=i + 1) for i in range(3)]
+        self._create_cart('empty@example.com')
+        self._create_cart('fresh@example.com', quantity=1, idle=timedelta(hours=1))
+        
+        metrics = self._process_abandoned_carts(chunk_size=2)
+        self.assertEqual((metrics['scanned'], metrics['notified'], metrics['chunks']), (4, 3, 2))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('Cart Total: $150.00', mail.outbox[2].body)
+        
+        # Nothing changed, so nobody is emailed again
+        self.assertEqual(self._process_abandoned_carts()['notified'], 0)
+        
+        # A cart that changes and goes idle again gets a new reminder
+        abandoned[0].touch()
+        Cart.objects.filter(pk=abandoned[0].pk).update(updated_at=timezone.now() - timedelta(days=1, hours=1))
+        self.assertEqual(self._process_abandoned_carts()['notified'], 1)
+        self.assertEqual(len(mail.outbox), 4)
\ No newline at end of file
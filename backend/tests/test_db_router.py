@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.http import HttpResponse
+from backend.db_router import use_primary
+from backend.middleware import ReplicaRoutingMiddleware
+from products.models import Product
+from orders.models import Order, CheckoutTicket
+from cart.models import CartItem
+
+User = get_user_model()
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRouterTestCase(SimpleTestCase):
+    databases = {'default'}
+    
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = User(pk=1, email='test@example.com')
+    
+    def request(self, method, user=None, write=False):
+        """Route a few reads through the middleware, as a view would"""
+        routes = {}
+        
+        def view(request):
+            routes['product'] = router.db_for_read(Product)
+            if write:
+                router.db_for_write(Product)
+            routes['after_write'] = router.db_for_read(Product)
+            routes['order'] = router.db_for_read(Order)
+            routes['ticket'] = router.db_for_read(CheckoutTicket)
+            routes['cart'] = router.db_for_read(CartItem)
+            with use_primary():
+                routes['forced'] = router.db_for_read(Product)
+            with transaction.atomic():
+                routes['atomic'] = router.db_for_read(Product)
+            return HttpResponse()
+        
+        request = getattr(self.factory, method)('/api/products/')
+        request.user = user or self.user
+        ReplicaRoutingMiddleware(view)(request)
+        return routes
+    
+    def test_safe_reads_of_catalog_and_orders_use_replica(self):
+        routes = self.request('get')
+        self.assertEqual((routes['product'], routes['order']), ('replica', 'replica'))
+        self.assertEqual((routes['ticket'], routes['cart']), ('default', 'default'))
+        self.assertEqual((routes['forced'], routes['atomic']), ('default', 'default'))
+        # Outside a request, e.g. in Celery tasks
+        self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertEqual(router.db_for_write(Product), 'default')
+    
+    def test_writes_pin_the_user_to_primary(self):
+        self.assertEqual(self.request('post')['product'], 'default')
+        self.assertEqual(self.request('get')['product'], 'default')
+        
+        other = User(pk=2, email='other@example.com')
+        self.assertEqual(self.request('get', user=other)['product'], 'replica')
+        
+        cache.clear()
+        self.assertEqual(self.request('get')['product'], 'replica')
+    
+    def test_writes_during_reads_stay_on_primary_without_pinning(self):
+        routes = self.request('get', write=True)
+        self.assertEqual((routes['product'], routes['after_write']), ('replica', 'default'))
+        self.assertEqual(self.request('get')['product'], 'replica')
+    
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        self.assertEqual(self.request('get')['product'], 'default')
@@ -5,12 +5,33 @@ from django.contrib.auth import get_user_model
 from products.models import Category, Product
 from accounts.models import Address
 from cart.models import Cart, CartItem
+from orders.models import Order, OrderStatusHistory, Coupon, CheckoutTicket, IdempotencyKey, OutboxEvent
+from orders.outbox import publish_order_paid
+from orders.coupons import redeem_coupon, reconcile_coupon
+from django.utils import timezone
+from datetime import timedelta
+from django.db import connection
+from django.core.cache import cache
+from backend.cache import clear_local_caches
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection
+from smtplib import SMTPException
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+from orders.tasks import (
+    process_checkout, fail_stale_checkouts, auto_deliver_shipped_orders, relay_outbox, send_order_emails,
+    send_order_status_notifications, AUTO_DELIVER_LOCK_KEY, CHECKOUT_FAILED_MESSAGE, CHECKOUT_MAX_RETRIES
+)
+from orders.transitions import transition_orders
 from decimal import Decimal
 
 User = get_user_model()
 
 class OrderAPITestCase(TestCase):
     def setUp(self):
+        cache.clear()
+        clear_local_caches()
         self.client = APIClient()
         self.user = User.objects.create_user(
             email='test@example.com',
@@ -71,4 +92,412 @@ class OrderAPITestCase(TestCase):
         response = self.client.get('/api/orders/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreater(len(response.data['results']), 0)
-
+    
+    def _checkout_data(self):
+        return {
+            'shipping_address_id': self.address.id,
+            'billing_address_id': self.address.id,
+            'email': 'test@example.com'
+        }
+    
+    def test_create_order_decrements_stock(self):
+        response = self.client.post('/api/orders/create/', self._checkout_data())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['items']), 1)
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+        self.assertFalse(self.cart.items.exists())
+        self.assertTrue(OutboxEvent.objects.filter(topic='order.created').exists())
+    
+    def test_create_order_insufficient_stock(self):
+        self.cart.items.update(quantity=11)
+        
+        response = self.client.post('/api/orders/create/', self._checkout_data())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(self.cart.items.exists())
+    
+    def test_create_order_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as single_item:
+            self.client.post('/api/orders/create/', self._checkout_data())
+        
+        for i in range(5):
+            product = Product.objects.create(
+                name=f'Extra Product {i}',
+                description='Test',
+                price=Decimal('5.00'),
+                sku=f'EXTRA{i}',
+                stock=10
+            )
+            CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+        
+        with CaptureQueriesContext(connection) as many_items:
+            self.client.post('/api/orders/create/', self._checkout_data())
+        
+        self.assertEqual(len(single_item), len(many_items))
+    
+    def _create_coupon(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Coupon.objects.create(
+                code=kwargs.pop('code', 'SAVE10'),
+                discount_type='fixed',
+                discount_value=Decimal('10.00'),
+                valid_from=timezone.now() - timedelta(days=1),
+                valid_to=timezone.now() + timedelta(days=1),
+                **kwargs
+            )
+    
+    def test_coupon_usage_limit_is_enforced_at_checkout(self):
+        coupon = self._create_coupon(usage_limit=1)
+        data = dict(self._checkout_data(), coupon_code='SAVE10')
+        
+        response = self.client.post('/api/orders/create/', data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Decimal(response.data['discount']), Decimal('10.00'))
+        
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        response = self.client.post('/api/orders/create/', data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+        self.assertEqual(coupon.redemptions.count(), 1)
+        self.assertEqual(Order.objects.count(), 1)
+    
+    def test_sharded_coupon_redemption(self):
+        coupon = self._create_coupon(usage_limit=3, counter_shards=2)
+        reconcile_coupon(coupon)
+        
+        self.assertEqual(sorted(coupon.shards.values_list('capacity', flat=True)), [1, 2])
+        for _ in range(3):
+            self.assertTrue(redeem_coupon(coupon, user=self.user))
+        self.assertFalse(redeem_coupon(coupon, user=self.user))
+        
+        self.assertEqual(reconcile_coupon(coupon), 3)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 3)
+    
+    def test_reconcile_keeps_uses_from_before_the_ledger(self):
+        coupon = self._create_coupon(usage_limit=10, used_count=5)
+        self.assertTrue(redeem_coupon(coupon, user=self.user))
+        
+        self.assertEqual(reconcile_coupon(coupon), 6)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.legacy_used_count, 5)
+        
+        coupon.counter_shards = 2
+        coupon.save()
+        self.assertEqual(reconcile_coupon(coupon), 6)
+        self.assertEqual(sum(coupon.shards.values_list('capacity', flat=True)), 4)
+    
+    def test_sharded_coupon_without_shards_allocates_them(self):
+        coupon = self._create_coupon(usage_limit=1, counter_shards=2)
+        
+        self.assertTrue(redeem_coupon(coupon, user=self.user))
+        self.assertEqual(coupon.shards.count(), 2)
+        self.assertFalse(redeem_coupon(coupon, user=self.user))
+        
+        # The limit is visible before checkout, though used_count lives on the shards
+        response = self.client.post('/api/orders/coupons/validate/', {'code': 'SAVE10'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['detail'], 'Coupon usage limit reached')
+    
+    def test_validate_coupon_is_cached(self):
+        self._create_coupon()
+        
+        response = self.client.post('/api/orders/coupons/validate/', {'code': 'SAVE10'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/orders/coupons/validate/', {'code': 'GUESS1'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+        # Known and unknown codes are both answered from the cache
+        with self.assertNumQueries(0):
+            self.client.post('/api/orders/coupons/validate/', {'code': 'SAVE10'})
+            self.client.post('/api/orders/coupons/validate/', {'code': 'GUESS1'})
+        
+        # Creating a coupon drops the negative entry for its code
+        self._create_coupon(code='GUESS1')
+        response = self.client.post('/api/orders/coupons/validate/', {'code': 'GUESS1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_coupon_save_invalidates_cache(self):
+        coupon = self._create_coupon()
+        self.client.post('/api/orders/coupons/validate/', {'code': 'SAVE10'})
+        
+        coupon.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon.save()
+        
+        response = self.client.post('/api/orders/coupons/validate/', {'code': 'SAVE10'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_create_order_idempotency_key_replays_response(self):
+        first = self.client.post('/api/orders/create/', self._checkout_data(), HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        
+        retry = self.client.post('/api/orders/create/', self._checkout_data(), HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['order_number'], first.data['order_number'])
+        self.assertEqual(Order.objects.count(), 1)
+        
+        data = dict(self._checkout_data(), customer_notes='different')
+        mismatch = self.client.post('/api/orders/create/', data, HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(mismatch.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+    
+    def test_idempotency_key_of_dead_request_is_taken_over(self):
+        # A worker killed mid-request leaves its key in progress
+        with mock.patch('orders.views.create_order_from_cart', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                self.client.post('/api/orders/create/', self._checkout_data(), HTTP_IDEMPOTENCY_KEY='retry-2')
+        
+        with mock.patch('orders.idempotency.IDEMPOTENCY_WAIT_TIMEOUT', 0):
+            retry = self.client.post('/api/orders/create/', self._checkout_data(), HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(retry.status_code, status.HTTP_409_CONFLICT)
+        
+        IdempotencyKey.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        retry = self.client.post('/api/orders/create/', self._checkout_data(), HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(IdempotencyKey.objects.get().status, 'completed')
+        self.assertEqual(Order.objects.count(), 1)
+    
+    @override_settings(CHECKOUT_ASYNC=True, CHECKOUT_QUEUE_PARTITIONS=4)
+    def test_queued_checkout(self):
+        with mock.patch('orders.views.process_checkout.apply_async') as apply_async:
+            response = self.client.post('/api/orders/create/', self._checkout_data())
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(apply_async.call_args.kwargs['queue'], f'checkout.{self.product.id % 4}')
+        
+        process_checkout(*apply_async.call_args.kwargs['args'])
+        
+        response = self.client.get(f"/api/orders/checkout/{response.data['ticket']}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(response.data['order_number'], Order.objects.get().order_number)
+    
+    def test_queued_checkout_unexpected_errors_retry_then_fail(self):
+        ticket = CheckoutTicket.objects.create(user=self.user, payload=self._checkout_data())
+        with mock.patch('orders.tasks.create_order_from_cart', side_effect=RuntimeError('db gone')) as create:
+            process_checkout.apply(args=[ticket.id])
+        self.assertEqual(create.call_count, CHECKOUT_MAX_RETRIES + 1)
+        
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.status, 'failed')
+        self.assertEqual(ticket.error, CHECKOUT_FAILED_MESSAGE)
+        self.assertTrue(self.cart.items.exists())
+    
+    def test_stale_processing_checkouts_are_failed(self):
+        stale = CheckoutTicket.objects.create(user=self.user, status='processing')
+        fresh = CheckoutTicket.objects.create(user=self.user, status='processing')
+        CheckoutTicket.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        
+        fail_stale_checkouts()
+        
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertEqual(fresh.status, 'processing')
+    
+    def test_list_orders_annotates_item_totals(self):
+        for _ in range(3):
+            CartItem.objects.get_or_create(cart=self.cart, product=self.product, defaults={'quantity': 2})
+            self.client.post('/api/orders/create/', self._checkout_data())
+        
+        for use_summary in (False, True):
+            with self.settings(ORDER_LIST_USE_SUMMARY=use_summary):
+                # One count query and one page query, regardless of the number of orders
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/orders/')
+            self.assertEqual(len(response.data['results']), 3)
+            self.assertEqual(response.data['results'][0]['item_count'], 1)
+            self.assertEqual(response.data['results'][0]['total_quantity'], 2)
+    
+    def test_order_sparse_fields_and_expand(self):
+        order_number = self.client.post('/api/orders/create/', self._checkout_data()).data['order_number']
+        
+        # No item join when the counts are not requested
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/orders/', {'fields': 'order_number,total'})
+        self.assertEqual(set(response.data['results'][0]), {'order_number', 'total'})
+        
+        response = self.client.get('/api/orders/', {'fields': 'order_number', 'expand': 'items'})
+        self.assertEqual(response.data['results'][0]['items'][0]['quantity'], 2)
+        
+        response = self.client.get(f'/api/orders/{order_number}/', {'fields': 'status,total'})
+        self.assertEqual(set(response.data), {'status', 'total'})
+        self.assertEqual(len(self.client.get(f'/api/orders/{order_number}/').data['items']), 1)
+    
+    def test_order_detail_is_cached_and_invalidated(self):
+        order_number = self.client.post('/api/orders/create/', self._checkout_data()).data['order_number']
+        url = f'/api/orders/{order_number}/'
+        
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['order_number'], order_number)
+        
+        other_user = User.objects.create_user(
+            email='other@example.com', password='testpass123', first_name='Other', last_name='User'
+        )
+        self.client.force_authenticate(user=other_user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.user)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderStatusHistory.objects.create(
+                order=Order.objects.get(order_number=order_number), status='processing'
+            )
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['status_history']), 2)
+    
+    def _create_orders(self, count, **fields):
+        return [
+            Order.objects.create(
+                user=self.user, email=self.user.email,
+                subtotal=Decimal('10.00'), total=Decimal('10.00'), **fields
+            )
+            for _ in range(count)
+        ]
+    
+    def test_transition_orders_in_chunks(self):
+        orders = self._create_orders(5, status='processing')
+        delivered = self._create_orders(1, status='delivered')
+        
+        updated = transition_orders(
+            Order.objects.all(), 'shipped', notes='Shipped', chunk_size=2
+        )
+        
+        self.assertEqual(updated, 5)
+        self.assertEqual(OutboxEvent.objects.filter(topic='order.status_changed').count(), 3)
+        self.assertEqual(Order.objects.filter(status='shipped', shipped_at__isnull=False).count(), 5)
+        self.assertEqual(OrderStatusHistory.objects.filter(status='shipped').count(), 5)
+        
+        # Delivered orders cannot be shipped again
+        delivered[0].refresh_from_db()
+        self.assertEqual(delivered[0].status, 'delivered')
+        self.assertEqual(transition_orders([orders[0].id], 'pending'), 0)
+    
+    def test_silent_transitions_publish_without_emailing(self):
+        orders = self._create_orders(2, status='processing')
+        transition_orders([order.id for order in orders], 'cancelled', notify=False)
+        
+        event = OutboxEvent.objects.get(topic='order.status_changed')
+        self.assertFalse(event.payload['notify'])
+        with mock.patch('orders.tasks.send_order_emails.delay') as delay:
+            send_order_status_notifications([dict(event.payload, dedupe_key=event.dedupe_key)])
+        delay.assert_not_called()
+    
+    def test_auto_deliver_shipped_orders(self):
+        old = self._create_orders(3, status='shipped', shipped_at=timezone.now() - timedelta(days=8))
+        recent = self._create_orders(1, status='shipped', shipped_at=timezone.now())
+        
+        metrics = auto_deliver_shipped_orders(chunk_size=2)
+        
+        self.assertEqual(metrics['delivered'], 3)
+        self.assertEqual(metrics['chunks'], 2)
+        self.assertEqual(Order.objects.filter(status='delivered', delivered_at__isnull=False).count(), 3)
+        recent[0].refresh_from_db()
+        self.assertEqual(recent[0].status, 'shipped')
+        self.assertIsNone(cache.get(AUTO_DELIVER_LOCK_KEY))
+    
+    def test_auto_deliver_skips_when_locked(self):
+        cache.set(AUTO_DELIVER_LOCK_KEY, 'other-node', 60)
+        self.assertTrue(auto_deliver_shipped_orders()['skipped'])
+        self.assertEqual(cache.get(AUTO_DELIVER_LOCK_KEY), 'other-node')
+    
+    def test_outbox_events_relayed_once(self):
+        order = self._create_orders(1, status='processing')[0]
+        publish_order_paid(order)
+        publish_order_paid(order)
+        transition_orders([order.id], 'shipped')
+        self.assertEqual(OutboxEvent.objects.count(), 2)
+        
+        with mock.patch('orders.tasks.send_order_confirmation_emails.apply_async') as confirmation, \
+                mock.patch('orders.tasks.send_order_status_notifications.apply_async') as notifications, \
+                mock.patch('reports.tasks.update_sales_rollups.apply_async'):
+            self.assertEqual(relay_outbox(batch_size=1), {'dispatched': 2, 'failed': 0})
+            self.assertEqual(relay_outbox(), {'dispatched': 0, 'failed': 0})
+        
+        self.assertEqual(
+            confirmation.call_args.args[1],
+            {'events': [{'order_id': order.id, 'dedupe_key': f'order.paid:{order.id}'}]}
+        )
+        self.assertTrue(confirmation.call_args.kwargs['task_id'].startswith('order.paid:'))
+        status_event = OutboxEvent.objects.get(topic='order.status_changed')
+        self.assertEqual(
+            notifications.call_args.args[1],
+            {'events': [{'order_ids': [order.id], 'new_status': 'shipped', 'notify': True,
+                         'dedupe_key': status_event.dedupe_key}]}
+        )
+        self.assertFalse(OutboxEvent.objects.filter(dispatched_at__isnull=True).exists())
+    
+    def test_redelivered_outbox_events_send_one_email(self):
+        order = self._create_orders(1, status='processing')[0]
+        publish_order_paid(order)
+        transition_orders([order.id], 'shipped')
+        
+        with mock.patch('reports.tasks.update_sales_rollups.apply_async'):
+            relay_outbox()
+            # The relay crashed before recording the dispatch and sends the events again
+            OutboxEvent.objects.update(dispatched_at=None)
+            self.assertEqual(relay_outbox(), {'dispatched': 2, 'failed': 0})
+        
+        self.assertEqual(sorted(message.subject for message in mail.outbox), sorted([
+            f'Order Confirmation - {order.order_number}', f'Your Order Has Shipped - {order.order_number}'
+        ]))
+    
+    def test_order_emails_share_one_connection(self):
+        orders = self._create_orders(3)
+        
+        with mock.patch('backend.emails.get_connection', wraps=get_connection) as connections:
+            result = send_order_emails.apply(args=([order.id for order in orders], 'confirmation'))
+        
+        self.assertEqual(result.get(), 'Sent 3 confirmation emails')
+        self.assertEqual(connections.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+    
+    def test_order_emails_retry_only_failed(self):
+        orders = self._create_orders(3)
+        failing = 'bounce@example.com'
+        Order.objects.filter(pk=orders[1].pk).update(email=failing)
+        attempts = []
+        send = EmailMessage.send
+        
+        def flaky_send(message, *args, **kwargs):
+            attempts.append(message.to[0])
+            if message.to[0] == failing and attempts.count(failing) == 1:
+                raise SMTPException('Temporary failure')
+            return send(message, *args, **kwargs)
+        
+        with mock.patch.object(EmailMessage, 'send', flaky_send):
+            send_order_emails.apply(args=([order.id for order in orders], 'status', 'processing'))
+        
+        self.assertEqual(len(attempts), 4)
+        self.assertEqual(attempts.count(failing), 2)
+        self.assertEqual(len(mail.outbox), 3)
+    
+    def test_order_emails_retry_batches_after_a_failed_connection(self):
+        orders = self._create_orders(150)
+        opened = []
+        
+        def flaky_connection(*args, **kwargs):
+            connection = get_connection(*args, **kwargs)
+            opened.append(connection)
+            if len(opened) == 2:
+                connection.open = mock.Mock(side_effect=OSError('Connection refused'))
+            return connection
+        
+        with mock.patch('backend.emails.get_connection', flaky_connection):
+            send_order_emails.apply(args=([order.id for order in orders], 'status', 'processing'))
+        
+        # The first 100 went out once; only the second batch was retried
+        self.assertEqual(len(opened), 3)
+        self.assertEqual(len(mail.outbox), 150)
+        self.assertEqual(len({message.body for message in mail.outbox}), 150)
\ No newline at end of file
@@ -2,13 +2,24 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
-from products.models import Category, Product
+from django.core.cache import cache
+from backend.cache import clear_local_caches
+from django.utils import timezone
+from datetime import timedelta
+from products.models import Category, Product, ProductVariant, ProductPairCount, RelatedProduct, ProductScore, VariantAttribute
+from products.recommendations import order_pairs, refresh_related_products
+from products.rankings import refresh_product_rankings
+from products.attributes import rebuild_variant_attributes
+from orders.models import Order, OrderItem
 from decimal import Decimal
+import numpy as np
 
 User = get_user_model()
 
 class ProductAPITestCase(TestCase):
     def setUp(self):
+        cache.clear()
+        clear_local_caches()
         self.client = APIClient()
         self.user = User.objects.create_user(
             email='test@example.com',
@@ -49,3 +60,191 @@ class ProductAPITestCase(TestCase):
     def test_search_products(self):
         response = self.client.get('/api/products/?search=Test')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_product_availability(self):
+        response = self.client.get(f'/api/products/availability/?ids={self.product.id},999999')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['products'][self.product.id]['stock'], 10)
+        self.assertTrue(response.data['products'][self.product.id]['in_stock'])
+        self.assertNotIn(999999, response.data['products'])
+        
+        # Subsequent polls are served from the cache
+        with self.assertNumQueries(0):
+            self.client.get(f'/api/products/availability/?ids={self.product.id},999999')
+    
+    def test_product_availability_rejects_invalid_ids(self):
+        response = self.client.get('/api/products/availability/?ids=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def _order(self, products, status='processing'):
+        order = Order.objects.create(user=self.user, email=self.user.email, status=status,
+                                     subtotal=Decimal('10.00'), total=Decimal('10.00'))
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, product_name=product.name, product_sku=product.sku,
+                      quantity=1, unit_price=product.price, total_price=product.price)
+            for product in products
+        ])
+        return order
+    
+    def test_order_pairs_vectorized(self):
+        products, related = order_pairs(np.array([1, 1, 2, 2, 2]), np.array([10, 11, 10, 12, 13]))
+        pairs = sorted(zip(products.tolist(), related.tolist()))
+        self.assertEqual(len(pairs), 2 * 2 + 3 * 3)
+        self.assertIn((11, 10), pairs)
+        self.assertIn((13, 12), pairs)
+        self.assertNotIn((11, 12), pairs)
+    
+    def test_related_products(self):
+        case, cable, charger = [
+            Product.objects.create(name=name, description='Test', category=self.category,
+                                   price=Decimal('5.00'), sku=name.upper(), stock=10)
+            for name in ('Case', 'Cable', 'Charger')
+        ]
+        self._order([self.product, case, cable])
+        self._order([self.product, case])
+        self._order([self.product, charger], status='cancelled')
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        
+        metrics = refresh_related_products(chunk_size=2)
+        self.assertEqual(metrics['orders'], 2)
+        self.assertEqual(ProductPairCount.objects.get(product=self.product, related=self.product).count, 2)
+        self.assertEqual(
+            list(RelatedProduct.objects.filter(product=self.product).values_list('related_id', flat=True)),
+            [case.id, cable.id]
+        )
+        
+        # Served from the precomputed table, with no query on order items
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/products/{self.product.slug}/related/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['slug'] for item in response.data], [case.slug, cable.slug])
+        
+        response = self.client.get(f'/api/products/{self.product.slug}/')
+        self.assertEqual(response.data['related_products'][0]['name'], 'Case')
+        
+        # Only orders placed since the last run are counted again
+        order = self._order([cable, case])
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(refresh_related_products()['orders'], 1)
+        self.assertEqual(ProductPairCount.objects.get(product=case, related=cable).count, 2)
+        self.assertEqual(RelatedProduct.objects.filter(product=cable).first().related, case)
+        
+        response = self.client.get('/api/products/missing/related/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_product_rankings(self):
+        steady, hyped = [
+            Product.objects.create(name=name, description='Test', category=self.category,
+                                   price=Decimal('5.00'), sku=name.upper(), stock=10)
+            for name in ('Steady', 'Hyped')
+        ]
+        old = self._order([steady] * 5)
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=20))
+        recent = self._order([hyped, hyped])
+        Order.objects.filter(pk=recent.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        
+        self.assertEqual(refresh_product_rankings()['orders'], 2)
+        score = ProductScore.objects.get(product=steady)
+        self.assertAlmostEqual(score.bestseller, 5 * 0.5 ** (20 / 30), places=3)
+        self.assertEqual(score.bestseller_rank, 1)
+        self.assertEqual(ProductScore.objects.get(product=hyped).trending_rank, 1)
+        
+        response = self.client.get('/api/products/', {'ordering': 'trending'})
+        self.assertEqual([item['name'] for item in response.data['results']][:2], ['Hyped', 'Steady'])
+        response = self.client.get('/api/products/', {'ordering': 'bestselling', 'category': self.category.id})
+        self.assertEqual(response.data['results'][0]['name'], 'Steady')
+        
+        # Views since the last run feed trending only; old sales are not recounted
+        Product.objects.filter(pk=self.product.pk).update(views=1000)
+        self.assertEqual(refresh_product_rankings()['orders'], 0)
+        score = ProductScore.objects.get(product=self.product)
+        self.assertEqual((score.trending_rank, score.bestseller, score.counted_views), (1, 0, 1000))
+        refresh_product_rankings()
+        self.assertAlmostEqual(ProductScore.objects.get(product=self.product).trending, 50, places=2)
+    
+    def test_filter_by_variant_attributes(self):
+        shirt = Product.objects.create(name='Shirt', description='Test', category=self.category,
+                                       price=Decimal('20.00'), sku='SHIRT', stock=10)
+        for sku, attributes in [('RED-S', {'Color': 'Red', 'Size': 'S'}),
+                                ('BLUE-L', {'color': 'blue', 'size': 'L'})]:
+            ProductVariant.objects.create(product=shirt, name=sku, sku=sku, price=Decimal('20.00'),
+                                          attributes=attributes)
+        ProductVariant.objects.create(product=self.product, name='Red L', sku='TEST-RED-L',
+                                      price=Decimal('99.99'), attributes={'color': 'red', 'size': 'l'})
+        self.assertEqual(VariantAttribute.objects.filter(product=shirt, name='color').count(), 2)
+        
+        response = self.client.get('/api/products/', {'attr.color': 'red'})
+        self.assertEqual({item['name'] for item in response.data['results']}, {'Shirt', 'Test Product'})
+        
+        # Attributes must match on the same variant
+        response = self.client.get('/api/products/', {'attr.color': 'red', 'attr.size': 'l'})
+        self.assertEqual([item['name'] for item in response.data['results']], ['Test Product'])
+        response = self.client.get('/api/products/', {'attr.color': 'red,blue', 'attr.size': 'L'})
+        self.assertEqual(len(response.data['results']), 2)
+        
+        # Facets only count the variants matching the filters: the shirt comes in blue, but not in S
+        response = self.client.get('/api/products/', {'attr.size': 's', 'facets': 'true'})
+        self.assertEqual(response.data['facets']['color'], [{'value': 'red', 'count': 1}])
+        response = self.client.get('/api/products/', {'facets': 'true'})
+        self.assertEqual(response.data['facets']['color'][0], {'value': 'red', 'count': 2})
+        
+        # Deactivated variants drop out of the index
+        ProductVariant.objects.filter(sku='RED-S').update(is_active=False)
+        self.assertEqual(rebuild_variant_attributes(), 4)
+        response = self.client.get('/api/products/', {'attr.color': 'red'})
+        self.assertEqual(len(response.data['results']), 1)
+    
+    def test_sparse_fields_and_expand(self):
+        for i in range(3):
+            product = Product.objects.create(name=f'Extra {i}', description='Test', category=self.category,
+                                             price=Decimal('5.00'), sku=f'EXTRA{i}', stock=10)
+            ProductVariant.objects.create(product=product, name='Default', sku=f'EXTRA{i}-V',
+                                          price=Decimal('5.00'))
+        
+        # Count and page queries only: no category join, images or ratings
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/products/', {'fields': 'id,name,price'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+        
+        # Ratings come from subqueries and images from one prefetch, whatever the page size
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/products/')
+        self.assertNotIn('variants', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['average_rating'], 0)
+        
+        response = self.client.get('/api/products/', {'fields': 'name', 'expand': 'variants'})
+        self.assertEqual(set(response.data['results'][0]), {'name', 'variants'})
+        self.assertEqual(len(response.data['results'][0]['variants']), 1)
+        
+        response = self.client.get(f'/api/products/{self.product.slug}/', {'fields': 'name,in_stock,is_low_stock'})
+        self.assertEqual(response.data, {'name': 'Test Product', 'in_stock': True, 'is_low_stock': True})
+    
+    def test_batch_fetch(self):
+        other = Product.objects.create(name='Other', description='Test', category=self.category,
+                                       price=Decimal('5.00'), sku='OTHER', stock=10)
+        url = '/api/products/batch/'
+        
+        # Products, images and ratings subqueries in one query plus one prefetch
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'ids': f'{other.id},999999,{self.product.id}'})
+        self.assertEqual([item['id'] for item in response.data['results']], [other.id, self.product.id])
+        
+        # Served from the per-product cache, slugs included once resolved
+        response = self.client.get(url, {'slugs': self.product.slug})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'ids': f'{self.product.id},999999', 'slugs': f'{other.slug},{self.product.slug}',
+                                             'fields': 'id,name'})
+        self.assertEqual(response.data['results'], [
+            {'id': self.product.id, 'name': 'Test Product'},
+            {'id': other.id, 'name': 'Other'},
+        ])
+        
+        # Saving a product drops its card
+        with self.captureOnCommitCallbacks(execute=True):
+            other.name = 'Renamed'
+            other.save()
+        response = self.client.get(url, {'ids': other.id})
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+        
+        response = self.client.get(url, {'ids': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,189 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from decimal import Decimal
+from django.db.models import Sum
+from products.models import Category, Product
+from orders.models import Order, OrderItem, OutboxEvent
+from orders.outbox import publish_order_paid, OUTBOX_HANDLERS
+from orders.transitions import transition_orders
+from reports.models import DailySales, DailyProductSales, DailyCategorySales, CustomerSegment, CustomerCohort
+from reports.analytics import CustomerOrders, compute_customer_analytics
+from reports.rollups import sync_order_sales, rebuild_sales_rollups
+from reports.tasks import update_sales_rollups
+
+User = get_user_model()
+
+class SalesRollupTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='User'
+        )
+        self.staff = User.objects.create_user(
+            email='staff@example.com',
+            password='testpass123',
+            is_staff=True
+        )
+        self.category = Category.objects.create(name='Test Category')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}',
+                description='Test',
+                category=self.category,
+                price=Decimal('10.00'),
+                sku=f'SKU{i}',
+                stock=100
+            )
+            for i in range(2)
+        ]
+        self.today = timezone.localdate()
+    
+    def _paid_order(self, quantities, paid_at=None, status='processing'):
+        subtotal = sum(Decimal('10.00') * quantity for quantity in quantities)
+        order = Order.objects.create(
+            user=self.user, email=self.user.email, status=status,
+            subtotal=subtotal, tax=subtotal * Decimal('0.10'), discount=Decimal('1.00'),
+            total=subtotal, payment_status='paid', paid_at=paid_at or timezone.now()
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=product, product_name=product.name, product_sku=product.sku,
+                quantity=quantity, unit_price=product.price, total_price=product.price * quantity
+            )
+            for product, quantity in zip(self.products, quantities)
+        ])
+        return order
+    
+    def _rollups(self):
+        return (
+            list(DailySales.objects.values_list('date', 'orders', 'units', 'gross', 'discounts', 'tax')),
+            sorted(DailyProductSales.objects.values_list('date', 'product_id', 'orders', 'units', 'gross')),
+            sorted(DailyCategorySales.objects.values_list('date', 'category_id', 'orders', 'units', 'gross')),
+        )
+    
+    def _deliver_events(self):
+        # What the outbox relay hands the rollup consumer, without going through Celery
+        events = list(OutboxEvent.objects.filter(dispatched_at__isnull=True).order_by('id'))
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(dispatched_at=timezone.now())
+        payloads = [
+            dict(event.payload, dedupe_key=event.dedupe_key) for event in events
+            if 'reports.tasks.update_sales_rollups' in OUTBOX_HANDLERS[event.topic]
+        ]
+        return update_sales_rollups(payloads)
+    
+    def test_sync_is_idempotent_and_reversible(self):
+        first = self._paid_order([1, 2])
+        second = self._paid_order([3])
+        
+        self.assertEqual(sync_order_sales([first.id, second.id]), 2)
+        self.assertEqual(sync_order_sales([first.id, second.id]), 0)
+        
+        day = DailySales.objects.get(date=self.today)
+        self.assertEqual((day.orders, day.units, day.gross, day.discounts), (2, 6, Decimal('60.00'), Decimal('2.00')))
+        category = DailyCategorySales.objects.get(date=self.today, category=self.category)
+        self.assertEqual((category.orders, category.units), (2, 6))
+        
+        # Refunds without a customer email still reach the rollups
+        transition_orders([first.id], 'refunded', notify=False)
+        self.assertEqual(self._deliver_events(), 'Updated sales rollups for 1 orders')
+        day.refresh_from_db()
+        self.assertEqual((day.orders, day.units, day.gross), (1, 3, Decimal('30.00')))
+        self.assertEqual(DailyProductSales.objects.get(date=self.today, product=self.products[1]).units, 0)
+    
+    def test_rebuild_matches_incremental(self):
+        orders = [
+            self._paid_order([1, 2]),
+            self._paid_order([2], paid_at=timezone.now() - timedelta(days=3)),
+            self._paid_order([4, 1], status='cancelled'),
+        ]
+        Order.objects.create(user=self.user, email=self.user.email, subtotal=Decimal('5.00'), total=Decimal('5.00'))
+        
+        sync_order_sales([order.id for order in orders])
+        incremental = self._rollups()
+        
+        DailySales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        DailyCategorySales.objects.all().delete()
+        self.assertEqual(rebuild_sales_rollups(self.today - timedelta(days=7), self.today), 2)
+        self.assertEqual(self._rollups(), incremental)
+        
+        # The ledger was rebuilt as well, so replaying events changes nothing
+        self.assertEqual(sync_order_sales([order.id for order in orders]), 0)
+    
+    def test_paid_event_updates_rollups(self):
+        order = self._paid_order([2])
+        publish_order_paid(order)
+        self._deliver_events()
+        self.assertEqual(DailySales.objects.get(date=self.today).units, 2)
+    
+    def test_reports_api_staff_only(self):
+        sync_order_sales([self._paid_order([1, 2]).id])
+        
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/reports/sales/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+        self.client.force_authenticate(user=self.staff)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/reports/sales/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['totals']['units'], 3)
+        self.assertEqual(response.data['series'][0]['gross'], '30.00')
+        
+        response = self.client.get('/api/reports/products/', {'by': 'gross', 'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['sku'], 'SKU1')
+        
+        response = self.client.get('/api/reports/categories/')
+        self.assertEqual(response.data['results'][0]['name'], 'Test Category')
+        
+        response = self.client.get('/api/reports/sales/', {'start': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_customer_orders_vectorized(self):
+        def epoch(*args):
+            return int(datetime(*args, tzinfo=dt_timezone.utc).timestamp())
+        
+        customer_orders = CustomerOrders(
+            np.array([7, 3, 7, 3, 9]),
+            np.array([epoch(2025, 1, 5), epoch(2025, 1, 20), epoch(2025, 3, 1), epoch(2025, 2, 2), epoch(2025, 3, 9)]),
+            np.array([10.0, 20.0, 30.0, 5.0, 100.0])
+        )
+        self.assertEqual(customer_orders.customer_ids.tolist(), [3, 7, 9])
+        self.assertEqual(customer_orders.frequency.tolist(), [2, 2, 1])
+        self.assertEqual(customer_orders.monetary.tolist(), [25.0, 40.0, 100.0])
+        
+        rfm = customer_orders.rfm(epoch(2025, 3, 10))
+        self.assertEqual(rfm['recency_days'].tolist(), [36, 9, 1])
+        self.assertEqual(rfm['r_score'].tolist(), [1, 2, 4])
+        
+        cohorts = [(int(month), int(offset), int(count)) for month, offset, count in zip(*customer_orders.cohorts())]
+        january, march = (2025 - 1970) * 12, (2025 - 1970) * 12 + 2
+        self.assertEqual(cohorts, [(january, 0, 2), (january, 1, 1), (january, 2, 1), (march, 0, 1)])
+    
+    def test_compute_customer_analytics(self):
+        other = User.objects.create_user(email='other@example.com', password='testpass123')
+        old = self._paid_order([1])
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=400))
+        self._paid_order([2])
+        self._paid_order([5], status='refunded')
+        Order.objects.create(user=other, email=other.email, subtotal=Decimal('5.00'), total=Decimal('5.00'),
+                             payment_status='paid', paid_at=timezone.now())
+        
+        metrics = compute_customer_analytics(chunk_size=2)
+        self.assertEqual((metrics['orders'], metrics['customers']), (3, 2))
+        
+        segment = CustomerSegment.objects.get(user=self.user)
+        self.assertEqual((segment.frequency, segment.monetary), (2, Decimal('30.00')))
+        self.assertGreater(segment.clv, 0)
+        self.assertEqual(CustomerCohort.objects.filter(months_since=0).aggregate(total=Sum('customers'))['total'], 2)
\ No newline at end of file